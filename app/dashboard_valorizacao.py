@@ -1,58 +1,164 @@
 import os
+import sys
+import json
 import streamlit as st
 import pandas as pd
-from google.cloud import bigquery
 import plotly.express as px
 
-# Configurações do BigQuery
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.reports.cubo import DIMENSOES, ORDEM_RANKING, ROTULOS_FAIXAS, TODOS
+from src.reports.mapas import ZOOMS, caminho_mapa
+from src.utils.snapshot import Snapshot
+from src.utils.warehouse import obter_warehouse
+
+# Configurações do warehouse (BigQuery ou DuckDB local, conforme VALORIMOB_WAREHOUSE)
 BQ_PROJECT = 'seu-projeto-gcp'
 BQ_DATASET = 'valorimob'
-BQ_TABLE_RANKING = 'ranking_bairros'
+BQ_TABLE_CUBO = 'cubo_valorizacao'
+
+# Colunas lidas por cada elemento da página; as demais medidas do cubo nunca saem do disco
+COLUNAS_RANKING = ['bairro', 'valorizacao_percentual', 'ic_inferior', 'ic_superior',
+                   'valorizacao_absoluta', 'qtde_imoveis']
+COLUNAS_TOTAL = ['valorizacao_percentual', 'qtde_imoveis']
+COLUNAS_MAPA = ['bairro', 'valorizacao_percentual', 'qtde_imoveis']
+CORES_REGULARIZACAO = ['#e45756', '#f58518', '#54a24b', '#4c78a8', '#b279a2']
+TOP_GRAFICO = 10
+TOP_TABELA = 50
 
 st.set_page_config(page_title='Valorização Imobiliária', layout='wide')
 
-@st.cache_data(ttl=3600)
-def carregar_dados_bigquery():
-    client = bigquery.Client(project=BQ_PROJECT)
-    query = f"""
-        SELECT * 
-        FROM `{BQ_PROJECT}.{BQ_DATASET}.{BQ_TABLE_RANKING}`
-        ORDER BY valorizacao_percentual DESC
-    """
-    df = client.query(query).to_dataframe()
-    return df
+@st.cache_resource
+def snapshot_cubo():
+    """Cópia local do cubo, ordenada pelas dimensões dos filtros e renovada só quando o cubo é republicado."""
+    tabela = f'{BQ_DATASET}.{BQ_TABLE_CUBO}'
+    # Só leitura: no DuckDB o servidor abre o arquivo só durante cada verificação ou exportação
+    return Snapshot(obter_warehouse(BQ_PROJECT, somente_leitura=True), tabela, ordem=DIMENSOES[1:] + DIMENSOES[:1])
+
+# As consultas levam a versão do snapshot na chave do cache: uma nova versão invalida os resultados antigos
+@st.cache_data(max_entries=64)
+def opcoes(_snapshot, versao, dimensao):
+    valores = _snapshot.consultar([dimensao], excluir={dimensao: TODOS}, distintos=True)[dimensao].tolist()
+    if dimensao == 'faixa_preco':
+        return [TODOS] + sorted(valores, key=lambda v: ROTULOS_FAIXAS.index(v) if v in ROTULOS_FAIXAS else len(ROTULOS_FAIXAS))
+    return [TODOS] + sorted(valores)
+
+@st.cache_data(max_entries=1024)
+def bairros_fatia(_snapshot, versao, **fatia):
+    return _snapshot.consultar(['bairro'], filtros=fatia, excluir={'bairro': TODOS}, ordem='bairro')['bairro'].tolist()
+
+@st.cache_data(max_entries=1024)
+def ranking(_snapshot, versao, bairro, limite, **fatia):
+    filtros = dict(fatia, bairro=bairro) if bairro != TODOS else fatia
+    excluir = {'bairro': TODOS} if bairro == TODOS else None
+    return _snapshot.consultar(COLUNAS_RANKING, filtros=filtros, excluir=excluir, ordem=ORDEM_RANKING, limite=limite)
+
+@st.cache_data(max_entries=1024)
+def total(_snapshot, versao, **fatia):
+    return _snapshot.consultar(COLUNAS_TOTAL, filtros=dict(fatia, bairro=TODOS))
+
+@st.cache_data(max_entries=1024)
+def mapa_fatia(_snapshot, versao, **fatia):
+    return _snapshot.consultar(COLUNAS_MAPA, filtros=fatia, excluir={'bairro': TODOS})
+
+@st.cache_data(max_entries=len(ZOOMS) * 2)
+def carregar_mapa(camada, zoom, modificado):
+    """GeoJSON pré-simplificado do nível de zoom (a data de modificação entra na chave do cache)."""
+    with open(caminho_mapa(camada, zoom), encoding='utf-8') as f:
+        return json.load(f)
+
+def _mapa(camada, zoom):
+    caminho = caminho_mapa(camada, zoom)
+    return carregar_mapa(camada, zoom, os.path.getmtime(caminho)) if os.path.exists(caminho) else None
+
+def _centro(geojson):
+    coordenadas = [c for f in geojson['features'] for anel in _aneis(f['geometry']) for c in anel]
+    lon, lat = zip(*coordenadas)
+    return {'lon': (min(lon) + max(lon)) / 2, 'lat': (min(lat) + max(lat)) / 2}
+
+def _aneis(geometria):
+    if geometria['type'] == 'Polygon':
+        return geometria['coordinates']
+    return [anel for poligono in geometria['coordinates'] for anel in poligono]
+
+def mapa_bairros(dados, municipio):
+    """Coroplético da valorização por bairro com as áreas de regularização sobrepostas."""
+    padrao = ZOOMS[0] if municipio == TODOS else ZOOMS[len(ZOOMS) // 2]
+    zoom = st.select_slider('Detalhe do mapa', options=list(ZOOMS), value=padrao)
+    bairros = _mapa('bairros', zoom)
+    if bairros is None:
+        st.info('Mapa de bairros ainda não gerado (etapa `mapas` do pipeline).')
+        return
+
+    fig = px.choropleth_mapbox(
+        dados, geojson=bairros, locations='bairro', featureidkey='properties.bairro',
+        color='valorizacao_percentual', hover_data=['qtde_imoveis'],
+        color_continuous_scale='RdYlGn', mapbox_style='carto-positron',
+        center=_centro(bairros), zoom=zoom, opacity=0.7,
+        labels={'valorizacao_percentual': 'Valorização (%)'},
+    )
+    regularizacao = _mapa('regularizacao', zoom)
+    if regularizacao is not None and st.checkbox('Sobrepor áreas de regularização', value=True):
+        # Camadas nativas do mapa: desenhadas pelo WebGL sem entrar nos traços do Plotly
+        fig.update_layout(mapbox_layers=[
+            {'source': feicao, 'type': 'fill', 'color': CORES_REGULARIZACAO[i % len(CORES_REGULARIZACAO)],
+             'opacity': 0.35, 'name': feicao['properties']['situacao']}
+            for i, feicao in enumerate(regularizacao['features'])
+        ])
+    fig.update_layout(margin={'r': 0, 't': 0, 'l': 0, 'b': 0})
+    st.plotly_chart(fig, use_container_width=True)
+
+def _rotulo(valor):
+    return 'Todos' if valor == TODOS else valor
 
 def main():
     st.title('📈 Dashboard de Valorização Imobiliária - Litoral PR')
     st.markdown('**Fonte de dados:** IBGE, GeoData, Modelo preditivo')
 
-    df = carregar_dados_bigquery()
+    snapshot = snapshot_cubo()
+    snapshot.atualizar()
+    versao = snapshot.versao
 
-    # Filtros
-    bairros = df['bairro'].dropna().unique()
-    bairro_selecionado = st.selectbox("Selecione o bairro", options=['Todos'] + list(bairros))
+    # Filtros: cada combinação corresponde a uma fatia já calculada do cubo
+    f1, f2, f3, f4 = st.columns(4)
+    municipio = f1.selectbox("Município", opcoes(snapshot, versao, 'municipio'), format_func=_rotulo)
+    ano = f2.selectbox("Ano", opcoes(snapshot, versao, 'ano'), format_func=_rotulo)
+    eh_novo = f3.selectbox("Imóvel", opcoes(snapshot, versao, 'eh_novo'),
+                           format_func=lambda v: {'1': 'Novo', '0': 'Usado'}.get(v, _rotulo(v)))
+    faixa_preco = f4.selectbox("Faixa de preço", opcoes(snapshot, versao, 'faixa_preco'), format_func=_rotulo)
+    fatia = dict(municipio=municipio, ano=ano, eh_novo=eh_novo, faixa_preco=faixa_preco)
 
-    if bairro_selecionado != 'Todos':
-        df = df[df['bairro'] == bairro_selecionado]
+    bairros = bairros_fatia(snapshot, versao, **fatia)
+    bairro_selecionado = st.selectbox("Selecione o bairro", options=[TODOS] + bairros, format_func=_rotulo)
+
+    df = ranking(snapshot, versao, bairro_selecionado, TOP_TABELA, **fatia)
+    resumo = df if bairro_selecionado != TODOS else total(snapshot, versao, **fatia)
 
     col1, col2, col3 = st.columns(3)
-    col1.metric("📊 Bairros analisados", len(df))
-    col2.metric("📈 Valorização média (%)", f"{df['valorizacao_percentual'].mean():.2f}")
-    col3.metric("🏠 Imóveis processados", df['qtde_imoveis'].sum())
+    col1.metric("📊 Bairros analisados", len(bairros) if bairro_selecionado == TODOS else len(df))
+    col2.metric("📈 Valorização média (%)",
+                f"{resumo['valorizacao_percentual'].iloc[0]:.2f}" if len(resumo) else '-')
+    col3.metric("🏠 Imóveis processados", int(resumo['qtde_imoveis'].sum()))
 
     # Gráfico de barras
+    top = df.head(TOP_GRAFICO)
     fig = px.bar(
-        df.sort_values('valorizacao_percentual', ascending=False).head(10),
+        top,
         x='bairro',
         y='valorizacao_percentual',
+        error_y=top['ic_superior'] - top['valorizacao_percentual'],
+        error_y_minus=top['valorizacao_percentual'] - top['ic_inferior'],
         color='valorizacao_percentual',
         labels={'valorizacao_percentual': 'Valorização (%)'},
-        title='Top 10 Bairros com Maior Valorização'
+        title=f'Top {TOP_GRAFICO} Bairros com Maior Valorização (intervalo de 90%)'
     )
     st.plotly_chart(fig, use_container_width=True)
 
+    # Mapa
+    st.subheader('🗺️ Valorização por bairro')
+    mapa_bairros(mapa_fatia(snapshot, versao, **fatia), municipio)
+
     # Tabela
-    st.subheader('📋 Tabela de Ranking')
+    st.subheader(f'📋 Tabela de Ranking (top {TOP_TABELA})')
     st.dataframe(df, use_container_width=True)
 
 if __name__ == '__main__':
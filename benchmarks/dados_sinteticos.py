@@ -0,0 +1,311 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+import zipfile
+from dataclasses import asdict, dataclass
+from datetime import datetime
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from scipy.spatial import cKDTree
+
+from src.utils.logs import configurar_logs
+
+SEMENTE = 42
+
+# Envelopes (lon_min, lat_min, lon_max, lat_max) dos municípios; os bairros cobrem a união dos dois
+ENVELOPES = {
+    'paranagua': (-48.62, -25.62, -48.45, -25.48),
+    'pontal': (-48.55, -25.75, -48.30, -25.55),
+}
+ENVELOPE_TOTAL = (-48.62, -25.75, -48.30, -25.48)
+ENVELOPE_BRASIL = (-74.0, -33.8, -34.8, 5.3)
+# Fração dos imóveis de cada município nos CSVs
+FRACAO_MUNICIPIOS = {'paranagua': 0.6, 'pontal': 0.4}
+
+# Imóveis gerados e gravados por bloco: 10 milhões de linhas cabem em memória de bloco em bloco
+LINHAS_BLOCO = 1_000_000
+SITUACOES_REGULARIZACAO = ['Concluído', 'Ativo', 'Cancelado', 'Em análise']
+CATEGORIAS_POI = ['comercio', 'escola', 'saude', 'servicos']
+ANO_MALHA = 2022
+
+
+@dataclass(frozen=True)
+class Tamanhos:
+    imoveis: int = 10_000
+    bairros: int = 80
+    regularizacao: int = 2_000
+    municipios_br: int = 5_570
+    pois: int = 500
+    linhas_sidra: int = 2
+    # Espaçamento máximo entre vértices dos polígonos (graus): controla o detalhe das geometrias
+    detalhe_graus: float = 0.0002
+
+    def assinatura(self) -> str:
+        return ','.join(f'{campo}={valor}' for campo, valor in asdict(self).items())
+
+
+def _rng(semente, componente):
+    """Gerador independente por componente: mudar um tamanho não altera os demais dados."""
+    return np.random.default_rng([semente, componente])
+
+
+def _pontos(rng, n, envelope):
+    lon_min, lat_min, lon_max, lat_max = envelope
+    return np.column_stack([rng.uniform(lon_min, lon_max, n), rng.uniform(lat_min, lat_max, n)])
+
+
+def sementes_bairros(tamanhos, semente=SEMENTE):
+    """Centro de cada bairro; o bairro de um ponto é o da semente mais próxima (célula de Voronoi)."""
+    return _pontos(_rng(semente, 1), tamanhos.bairros, ENVELOPE_TOTAL)
+
+
+def nomes_bairros(n):
+    return [f'Bairro {i:03d}' for i in range(n)]
+
+
+def gerar_bairros(tamanhos, semente=SEMENTE) -> gpd.GeoDataFrame:
+    sementes = sementes_bairros(tamanhos, semente)
+    envelope = shapely.box(*ENVELOPE_TOTAL)
+    celulas = shapely.get_parts(shapely.voronoi_polygons(shapely.multipoints(sementes), extend_to=envelope))
+    # voronoi_polygons não preserva a ordem das sementes: cada célula é associada à semente que contém
+    ordem = cKDTree(sementes).query(shapely.get_coordinates(shapely.point_on_surface(celulas)))[1]
+    poligonos = np.empty(len(sementes), dtype=object)
+    poligonos[ordem] = shapely.segmentize(shapely.intersection(celulas, envelope), tamanhos.detalhe_graus)
+    return gpd.GeoDataFrame({'nome': nomes_bairros(len(sementes))}, geometry=poligonos, crs='EPSG:4674')
+
+
+def gerar_regularizacao(tamanhos, semente=SEMENTE) -> dict:
+    """Áreas de regularização por município, com as colunas do shapefile do ONR."""
+    rng = _rng(semente, 2)
+    camadas = {}
+    for i, (municipio, envelope) in enumerate(ENVELOPES.items()):
+        n = int(tamanhos.regularizacao * FRACAO_MUNICIPIOS[municipio])
+        centros = shapely.points(_pontos(rng, n, envelope))
+        raios = rng.uniform(0.0003, 0.002, n)
+        poligonos = shapely.segmentize(shapely.buffer(centros, raios, quad_segs=16), tamanhos.detalhe_graus)
+        camadas[municipio] = gpd.GeoDataFrame({
+            'processo': [f'ONR-{i}{j:07d}' for j in range(n)],
+            'situacao': rng.choice(SITUACOES_REGULARIZACAO, n),
+            'area_ha': np.round(np.pi * (raios * 111_320) ** 2 / 10_000, 3),
+        }, geometry=poligonos, crs='EPSG:4674')
+    return camadas
+
+
+def gerar_malha_brasil(tamanhos, codigos_litoral, semente=SEMENTE) -> gpd.GeoDataFrame:
+    """Malha municipal nacional: grade sobre o Brasil mais os municípios do litoral com os códigos reais."""
+    rng = _rng(semente, 3)
+    lado = int(np.ceil(np.sqrt(tamanhos.municipios_br)))
+    lon_min, lat_min, lon_max, lat_max = ENVELOPE_BRASIL
+    xs, ys = np.linspace(lon_min, lon_max, lado + 1), np.linspace(lat_min, lat_max, lado + 1)
+    celulas = [shapely.box(xs[i], ys[j], xs[i + 1], ys[j + 1]) for i in range(lado) for j in range(lado)]
+    celulas = celulas[:max(tamanhos.municipios_br - len(codigos_litoral), 0)]
+    litoral = [shapely.box(*ENVELOPES[m]) for m in ('paranagua', 'pontal')][:len(codigos_litoral)]
+    geometrias = shapely.segmentize(np.array(celulas + litoral, dtype=object), tamanhos.detalhe_graus * 50)
+    codigos = [str(1_000_000 + i) for i in range(len(celulas))] + list(codigos_litoral)
+    return gpd.GeoDataFrame({
+        'CD_MUN': codigos,
+        'NM_MUN': [f'Município {c}' for c in codigos],
+        'SIGLA_UF': rng.choice(['PR', 'SC', 'SP', 'MG', 'BA'], len(codigos)),
+        'AREA_KM2': np.round(rng.uniform(50, 5000, len(codigos)), 2),
+    }, geometry=geometrias, crs='EPSG:4674')
+
+
+def gerar_pois(tamanhos, semente=SEMENTE) -> gpd.GeoDataFrame:
+    rng = _rng(semente, 4)
+    porto = shapely.points([(-48.515, -25.50), (-48.53, -25.505)])
+    praia = shapely.linestrings(np.column_stack([np.linspace(-48.45, -48.30, 200), np.linspace(-25.60, -25.72, 200)]))
+    rodovia = shapely.linestrings([(-48.55, -25.55), (-48.40, -25.62), (-48.32, -25.70)])
+    outros = shapely.points(_pontos(rng, tamanhos.pois, ENVELOPE_TOTAL))
+    return gpd.GeoDataFrame({
+        'categoria': ['porto', 'porto', 'praia', 'pr407'] + list(rng.choice(CATEGORIAS_POI, tamanhos.pois)),
+    }, geometry=[*porto, praia, rodovia, *outros], crs='EPSG:4326')
+
+
+def gerar_imoveis(tamanhos, diretorio, semente=SEMENTE) -> dict:
+    """Grava os CSVs de imóveis por município, em blocos, com o formato dos arquivos reais."""
+    rng = _rng(semente, 5)
+    sementes = sementes_bairros(tamanhos, semente)
+    arvore = cKDTree(sementes)
+    nomes = np.array(nomes_bairros(len(sementes)), dtype=object)
+    # Preço base do m² por bairro: a variável que o modelo precisa aprender
+    preco_m2_bairro = rng.lognormal(np.log(4500), 0.35, len(sementes))
+
+    caminhos = {}
+    proximo_id = 0
+    for municipio, fracao in FRACAO_MUNICIPIOS.items():
+        caminho = os.path.join(diretorio, f'imoveis_{municipio}.csv')
+        restantes = int(round(tamanhos.imoveis * fracao))
+        primeiro = True
+        while restantes > 0:
+            n = min(LINHAS_BLOCO, restantes)
+            coordenadas = _pontos(rng, n, ENVELOPES[municipio])
+            bairro = arvore.query(coordenadas)[1]
+            ano_construcao = rng.integers(1960, 2026, n).astype('float64')
+            ano_construcao[rng.random(n) < 0.03] = np.nan
+            area = np.round(rng.lognormal(np.log(85), 0.45, n), 1)
+            idade = 2025 - np.nan_to_num(ano_construcao, nan=1990)
+            preco = area * preco_m2_bairro[bairro] * (1.15 - 0.004 * idade) * rng.lognormal(0, 0.15, n)
+            latitude, longitude = coordenadas[:, 1].copy(), coordenadas[:, 0].copy()
+            sem_coordenada = rng.random(n) < 0.05
+            latitude[sem_coordenada] = np.nan
+            longitude[sem_coordenada] = np.nan
+            # Parte dos anúncios informa um bairro diferente do oficial, como nos portais
+            informado = nomes[bairro].copy()
+            trocado = rng.random(n) < 0.1
+            informado[trocado] = nomes[rng.integers(0, len(nomes), trocado.sum())]
+
+            pd.DataFrame({
+                'id_anuncio': np.arange(proximo_id, proximo_id + n),
+                'titulo': 'Imóvel à venda',
+                'bairro': informado,
+                'preco': np.round(preco, 2),
+                'area_m2': area,
+                'ano_construcao': ano_construcao,
+                'latitude': np.round(latitude, 6),
+                'longitude': np.round(longitude, 6),
+                'ano': rng.integers(2015, 2025, n),
+                'quartos': rng.integers(1, 5, n),
+            }).to_csv(caminho, mode='w' if primeiro else 'a', header=primeiro, index=False)
+            primeiro = False
+            restantes -= n
+            proximo_id += n
+        caminhos[municipio] = caminho
+    return caminhos
+
+
+def respostas_sidra(tamanhos, municipio_code, ano, variavel, semente=SEMENTE) -> list:
+    """Resposta no formato da API de valores do SIDRA: cabeçalho seguido das linhas, tudo em texto."""
+    rng = _rng(semente, 6 + municipio_code + ano)
+    cabecalho = {
+        'NC': 'Nível Territorial (Código)', 'NN': 'Nível Territorial', 'MC': 'Unidade de Medida (Código)',
+        'MN': 'Unidade de Medida', 'V': 'Valor', 'D1C': 'Unidade Territorial (Código)', 'D1N': 'Unidade Territorial',
+        'D2C': 'Variável (Código)', 'D2N': 'Variável', 'D3C': 'Ano (Código)', 'D3N': 'Ano',
+    }
+    linhas = [cabecalho]
+    for i in range(tamanhos.linhas_sidra):
+        nivel, codigo = ('1', '1') if i == 0 else ('6', str(municipio_code if i == 1 else municipio_code * 100 + i))
+        linhas.append({
+            'NC': nivel, 'NN': 'Brasil' if nivel == '1' else 'Município', 'MC': '1020', 'MN': 'Unidades',
+            'V': str(int(rng.integers(1_000, 100_000))), 'D1C': codigo, 'D1N': f'Unidade {codigo}',
+            'D2C': variavel, 'D2N': f'Variável {variavel}', 'D3C': str(ano), 'D3N': str(ano),
+        })
+    return linhas
+
+
+def _zip_shapefile(gdf, caminho_zip, nome):
+    with tempfile.TemporaryDirectory() as tmp:
+        gdf.to_file(os.path.join(tmp, f'{nome}.shp'), engine='pyogrio')
+        with zipfile.ZipFile(caminho_zip, 'w', zipfile.ZIP_DEFLATED) as z:
+            for arquivo in sorted(os.listdir(tmp)):
+                z.write(os.path.join(tmp, arquivo), arquivo)
+    return caminho_zip
+
+
+def caminho_malha(diretorio) -> str:
+    return os.path.join(diretorio, 'data', 'raw', 'sinteticos', f'BR_Municipios_{ANO_MALHA}.zip')
+
+
+def gerar(diretorio, tamanhos=Tamanhos(), semente=SEMENTE) -> str:
+    """Prepara em `diretorio` uma árvore `data/` completa para rodar as etapas em modo offline.
+
+    Os CSVs de imóveis e a camada de pontos de interesse vão direto para
+    onde as etapas os leem; shapefiles e respostas do SIDRA entram no
+    cache de downloads sob as URLs reais. Não faz nada se o diretório já
+    tiver os dados dos mesmos tamanhos e semente. Um diretório só é apagado
+    se tiver sido criado pelo gerador (tem `sinteticos.json`); qualquer outro
+    diretório com arquivos é recusado.
+    """
+    from src.etl import etl_dados_historicos, etl_geospatial, etl_locais_paranagua, etl_locais_pontal
+    from src.utils.cache_downloads import CacheDownloads
+
+    manifesto_path = os.path.join(diretorio, 'sinteticos.json')
+    manifesto = {'semente': semente, 'tamanhos': asdict(tamanhos), 'ano_corrente': datetime.now().year}
+    if os.path.exists(manifesto_path):
+        with open(manifesto_path, encoding='utf-8') as f:
+            if json.load(f) == manifesto:
+                logging.info(f'Dados sintéticos já gerados em {diretorio}')
+                return diretorio
+        shutil.rmtree(diretorio)
+    elif os.path.isdir(diretorio) and os.listdir(diretorio):
+        raise FileExistsError(f'{diretorio} não está vazio e não foi criado pelo gerador de dados sintéticos')
+
+    processados = os.path.join(diretorio, 'data', 'processed')
+    os.makedirs(processados, exist_ok=True)
+    os.makedirs(os.path.dirname(caminho_malha(diretorio)), exist_ok=True)
+    cache = CacheDownloads(diretorio=os.path.join(diretorio, 'data', 'cache', 'downloads'), offline=True)
+
+    gerar_imoveis(tamanhos, processados, semente)
+    gerar_pois(tamanhos, semente).to_file(os.path.join(diretorio, 'data', 'raw', 'pontos_interesse.gpkg'), driver='GPKG')
+
+    # Fontes que as etapas baixam entram no cache de downloads; os arquivos intermediários são descartados
+    with tempfile.TemporaryDirectory() as tmp:
+        zip_bairros = _zip_shapefile(gerar_bairros(tamanhos, semente), os.path.join(tmp, 'bairros.zip'), 'bairros')
+        cache.importar(etl_geospatial.URL_SHAPE_BAIRROS, zip_bairros, 'bairros')
+        for municipio, gdf in gerar_regularizacao(tamanhos, semente).items():
+            arquivo = etl_locais_paranagua.SHAPEFILES[municipio]
+            zip_regularizacao = _zip_shapefile(gdf, os.path.join(tmp, arquivo), os.path.splitext(arquivo)[0])
+            cache.importar(etl_locais_paranagua.ONR_BASE_URL + arquivo, zip_regularizacao, 'onr')
+
+        for codigo in etl_dados_historicos.MUNICIPIOS.values():
+            for variavel in etl_dados_historicos.VARIAVEIS:
+                for ano in etl_dados_historicos.periodos_a_buscar(None):
+                    caminho = os.path.join(tmp, 'sidra.json')
+                    with open(caminho, 'w', encoding='utf-8') as f:
+                        json.dump(respostas_sidra(tamanhos, codigo, ano, variavel, semente), f, ensure_ascii=False)
+                    cache.importar(etl_dados_historicos.url_sidra(codigo, ano, variavel), caminho, 'sidra')
+
+    # A malha nacional vem por FTP na etapa real; o benchmark recorta o arquivo direto daqui
+    malha = gerar_malha_brasil(tamanhos, list(etl_locais_pontal.CODIGOS_MUNICIPIOS.values()), semente)
+    _zip_shapefile(malha, caminho_malha(diretorio), f'BR_Municipios_{ANO_MALHA}')
+
+    with open(manifesto_path, 'w', encoding='utf-8') as f:
+        json.dump(manifesto, f, indent=2)
+    logging.info(f'Dados sintéticos gerados em {diretorio} ({tamanhos.assinatura()})')
+    return diretorio
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(description='Gera dados sintéticos determinísticos no formato das entradas do pipeline')
+    parser.add_argument('diretorio', help='Diretório de trabalho (recebe uma árvore data/ completa)')
+    adicionar_opcoes_tamanho(parser)
+    return parser
+
+
+def adicionar_opcoes_tamanho(parser):
+    padrao = Tamanhos()
+    parser.add_argument('--imoveis', type=int, default=padrao.imoveis, help='Linhas de imóveis (10 mil a 10 milhões)')
+    parser.add_argument('--bairros', type=int, default=padrao.bairros)
+    parser.add_argument('--regularizacao', type=int, default=padrao.regularizacao, help='Polígonos de regularização')
+    parser.add_argument('--municipios-br', type=int, default=padrao.municipios_br, help='Polígonos da malha nacional')
+    parser.add_argument('--pois', type=int, default=padrao.pois, help='Pontos de interesse além de porto, praia e PR-407')
+    parser.add_argument('--linhas-sidra', type=int, default=padrao.linhas_sidra, help='Linhas por resposta do SIDRA')
+    parser.add_argument('--detalhe-graus', type=float, default=padrao.detalhe_graus)
+    parser.add_argument('--semente', type=int, default=SEMENTE)
+
+
+def tamanhos_dos_argumentos(args) -> Tamanhos:
+    return Tamanhos(
+        imoveis=args.imoveis, bairros=args.bairros, regularizacao=args.regularizacao,
+        municipios_br=args.municipios_br, pois=args.pois, linhas_sidra=args.linhas_sidra,
+        detalhe_graus=args.detalhe_graus,
+    )
+
+
+def main(argv=None):
+    parser = criar_parser()
+    args = parser.parse_args(argv)
+    try:
+        gerar(args.diretorio, tamanhos_dos_argumentos(args), args.semente)
+    except FileExistsError as e:
+        parser.error(str(e))
+
+
+if __name__ == '__main__':
+    configurar_logs()
+    main()
@@ -0,0 +1,299 @@
+import argparse
+import json
+import logging
+import os
+import resource
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import time
+# geopandas, pyarrow e o gerador de dados sintéticos só são importados no processo principal:
+# o processo que mede uma etapa não pode carregar nada além do que a própria etapa importa
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+from src import pipeline
+from src.utils.instrumentacao import pico_memoria_bytes, trecho
+from src.utils.logs import configurar_logs
+
+DIRETORIO_PADRAO = os.path.join('data', 'benchmarks')
+BASELINE_PATH = os.path.join(RAIZ, 'benchmarks', 'baseline.json')
+REPETICOES = 3
+ORCAMENTO_TREINO_S = 60
+
+# Regressão: tempo acima de +25% (e mais de 0,2 s, abaixo disso é ruído) ou pico de memória acima de +15%
+TOLERANCIA_TEMPO = 0.25
+MIN_DIFERENCA_S = 0.2
+TOLERANCIA_MEMORIA = 0.15
+
+# A etapa real baixa a malha nacional por FTP; no benchmark ela recorta e carrega a malha sintética
+ETAPAS_SEM_REDE = {'etl_malhas_ibge': 'benchmarks.suite:_etl_malhas_sintetica'}
+
+# Estado incremental apagado antes de cada repetição, para que todas meçam o mesmo trabalho
+ESTADO_ETAPAS = {
+    'etl_historico': [os.path.join('data', 'state', 'watermarks_sidra.json'),
+                      os.path.join('data', 'processed', 'dados_historicos_ibge.parquet')],
+    'proximidade': [os.path.join('data', 'cache', 'indices')],
+    'cubo': [os.path.join('data', 'state', 'cubo_valorizacao.json'),
+             os.path.join('data', 'processed', 'cubo_celulas.parquet')],
+}
+
+
+def _etl_malhas_sintetica():
+    from benchmarks.dados_sinteticos import ANO_MALHA, caminho_malha
+    from src.etl import etl_locais_pontal
+    from src.utils.destino_s3 import enviar_em_segundo_plano
+
+    # Os caminhos do módulo são relativos ao código; o extrato do benchmark fica no diretório de trabalho
+    etl_locais_pontal.EXTRATOS_DIR = os.path.join('data', 'processed', 'ibge_municipios')
+    extrato = etl_locais_pontal.recortar_municipios(caminho_malha('.'), ANO_MALHA)
+    enviar_em_segundo_plano(extrato, etl_locais_pontal.S3_BUCKET,
+                            f'{etl_locais_pontal.S3_FOLDER}/{os.path.basename(extrato)}')
+    etl_locais_pontal.carregar_bigquery(extrato, ANO_MALHA)
+
+
+def _funcao(nome):
+    funcao = ETAPAS_SEM_REDE.get(nome) or next(e.funcao for e in pipeline.ETAPAS if e.nome == nome)
+    return funcao.split(':')
+
+
+def _criar_buckets(modulo):
+    """Cria no S3 local os buckets que o módulo da etapa usa (fora da medição)."""
+    buckets = {getattr(modulo, a) for a in ('AWS_S3_BUCKET', 'S3_BUCKET') if hasattr(modulo, a)}
+    if not buckets:
+        return
+    from src.utils.destino_s3 import obter_cliente
+    cliente = obter_cliente()
+    for bucket in buckets:
+        cliente.create_bucket(Bucket=bucket)
+
+
+def _pico_memoria():
+    """Pico de memória residente (bytes) deste processo e dos filhos que ele criou (joblib)."""
+    # ru_maxrss dos filhos vem em KiB no Linux
+    return max(pico_memoria_bytes(), resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024)
+
+
+def medir_etapa(nome, resultado_path):
+    """Executa uma etapa neste processo e grava importação, tempo, CPU e pico de memória em `resultado_path`."""
+    import importlib
+    etapa = next(e for e in pipeline.ETAPAS if e.nome == nome)
+
+    inicio = time.perf_counter()
+    modulo = importlib.import_module(etapa.modulo)
+    importacao_s = time.perf_counter() - inicio
+    _criar_buckets(modulo)
+    modulo_nome, funcao_nome = _funcao(nome)
+    funcao = getattr(importlib.import_module(modulo_nome), funcao_nome)
+
+    antes = os.times()
+    inicio = time.perf_counter()
+    with trecho('etapa', etapa=nome) as medido:
+        funcao()
+        destino_s3 = sys.modules.get('src.utils.destino_s3')
+        if destino_s3 is not None:
+            destino_s3.aguardar_envios()
+    tempo_s = time.perf_counter() - inicio
+    depois = os.times()
+
+    cpu_s = sum(depois[:4]) - sum(antes[:4])
+    with open(resultado_path, 'w', encoding='utf-8') as f:
+        json.dump({'importacao_s': importacao_s, 'tempo_s': tempo_s, 'cpu_s': cpu_s,
+                   'pico_rss_mb': _pico_memoria() / 1024 ** 2, 'contadores': medido.totais()}, f)
+
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def iniciar_s3_local():
+    """Servidor moto em segundo plano no lugar do S3; retorna o servidor e seu endpoint."""
+    from moto.server import ThreadedMotoServer
+    porta = _porta_livre()
+    servidor = ThreadedMotoServer(ip_address='127.0.0.1', port=porta, verbose=False)
+    servidor.start()
+    return servidor, f'http://127.0.0.1:{porta}'
+
+
+def ambiente(diretorio, endpoint_s3, orcamento_treino_s):
+    """Variáveis de ambiente das etapas: DuckDB no lugar do BigQuery, S3 local e downloads só do cache."""
+    env = dict(os.environ)
+    env.update({
+        'PYTHONPATH': os.pathsep.join(filter(None, [RAIZ, env.get('PYTHONPATH')])),
+        'VALORIMOB_WAREHOUSE': 'duckdb',
+        'VALORIMOB_DUCKDB_PATH': os.path.join(diretorio, 'data', 'warehouse', 'valorimob.duckdb'),
+        'VALORIMOB_S3_ENDPOINT': endpoint_s3,
+        'AWS_ACCESS_KEY_ID': 'benchmark',
+        'AWS_SECRET_ACCESS_KEY': 'benchmark',
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'VALORIMOB_OFFLINE': '1',
+        'VALORIMOB_CACHE_DIR': os.path.join(diretorio, 'data', 'cache', 'downloads'),
+        'VALORIMOB_MODO_TREINO': 'completo',
+        'VALORIMOB_ORCAMENTO_TREINO_S': str(orcamento_treino_s),
+    })
+    return env
+
+
+def _limpar_estado(diretorio, nome):
+    for relativo in ESTADO_ETAPAS.get(nome, []):
+        caminho = os.path.join(diretorio, relativo)
+        if os.path.isdir(caminho):
+            shutil.rmtree(caminho)
+        elif os.path.exists(caminho):
+            os.remove(caminho)
+
+
+def executar_medicao(nome, diretorio, env) -> dict:
+    _limpar_estado(diretorio, nome)
+    resultado_path = os.path.join(diretorio, f'.medicao_{nome}.json')
+    processo = subprocess.run([sys.executable, '-m', 'benchmarks.suite', '_medir', nome, resultado_path],
+                              cwd=diretorio, env=env, capture_output=True, text=True)
+    if processo.returncode != 0:
+        raise RuntimeError(f'Etapa {nome} falhou no benchmark:\n{processo.stderr[-4000:]}')
+    with open(resultado_path, encoding='utf-8') as f:
+        medicao = json.load(f)
+    os.remove(resultado_path)
+    return medicao
+
+
+def saidas(nome, diretorio) -> dict:
+    """Linhas (pelos metadados dos Parquet e GeoPackage, sem lê-los) e bytes gravados nas saídas da etapa."""
+    import pyarrow.parquet as pq
+    from pyogrio import read_info
+    etapa = next(e for e in pipeline.ETAPAS if e.nome == nome)
+    arquivos = []
+    for saida in etapa.saidas:
+        caminho = os.path.join(diretorio, saida)
+        if os.path.isdir(caminho):
+            arquivos += [os.path.join(caminho, a) for a in sorted(os.listdir(caminho))]
+        elif os.path.exists(caminho):
+            arquivos.append(caminho)
+    linhas = sum(pq.read_metadata(a).num_rows for a in arquivos if a.endswith('.parquet'))
+    linhas += sum(read_info(a)['features'] for a in arquivos if a.endswith('.gpkg'))
+    return {'linhas': linhas, 'bytes': sum(os.path.getsize(a) for a in arquivos)}
+
+
+def medir(etapas, diretorio, env, repeticoes) -> dict:
+    """Executa as etapas em ordem; as pedidas são medidas `repeticoes` vezes (mediana), as demais rodam uma vez."""
+    necessarias = pipeline.selecionar(alvos=etapas)
+    resultados = {}
+    for nome in necessarias:
+        if nome not in etapas:
+            logging.info(f'Preparando {nome} (dependência, não medida)')
+            executar_medicao(nome, diretorio, env)
+            continue
+        medicoes = [executar_medicao(nome, diretorio, env) for _ in range(repeticoes)]
+        resultados[nome] = {
+            chave: statistics.median(m[chave] for m in medicoes)
+            for chave in ('importacao_s', 'tempo_s', 'cpu_s', 'pico_rss_mb')
+        }
+        resultados[nome].update(medicoes[-1]['contadores'])
+        resultados[nome].update(saidas(nome, diretorio))
+        logging.info(f'{nome}: {resultados[nome]["tempo_s"]:.2f} s, {resultados[nome]["pico_rss_mb"]:.0f} MiB')
+    return resultados
+
+
+def regressoes(resultados, base) -> dict:
+    """Motivos de regressão por etapa em relação à baseline dos mesmos tamanhos."""
+    encontradas = {}
+    for nome, atual in resultados.items():
+        anterior = base.get(nome)
+        if anterior is None:
+            continue
+        motivos = []
+        if (atual['tempo_s'] > anterior['tempo_s'] * (1 + TOLERANCIA_TEMPO)
+                and atual['tempo_s'] - anterior['tempo_s'] > MIN_DIFERENCA_S):
+            motivos.append(f'tempo {anterior["tempo_s"]:.2f} s -> {atual["tempo_s"]:.2f} s')
+        if atual['pico_rss_mb'] > anterior['pico_rss_mb'] * (1 + TOLERANCIA_MEMORIA):
+            motivos.append(f'memória {anterior["pico_rss_mb"]:.0f} MiB -> {atual["pico_rss_mb"]:.0f} MiB')
+        if motivos:
+            encontradas[nome] = motivos
+    return encontradas
+
+
+def _ler_baseline():
+    if not os.path.exists(BASELINE_PATH):
+        return {}
+    with open(BASELINE_PATH, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _salvar_baseline(baseline):
+    tmp = BASELINE_PATH + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+    os.replace(tmp, BASELINE_PATH)
+
+
+def imprimir(resultados, base, encontradas):
+    print(f"{'etapa':<25} {'import':>7} {'tempo':>8} {'base':>8} {'cpu':>8} {'RSS MiB':>8} {'linhas':>10}")
+    for nome, r in resultados.items():
+        anterior = base.get(nome, {}).get('tempo_s')
+        print(f"{nome:<25} {r['importacao_s']:>6.2f}s {r['tempo_s']:>7.2f}s "
+              f"{f'{anterior:.2f}s' if anterior is not None else '-':>8} {r['cpu_s']:>7.2f}s "
+              f"{r['pico_rss_mb']:>8.0f} {r['linhas']:>10}" + ('  REGRESSÃO' if nome in encontradas else ''))
+    for nome, motivos in encontradas.items():
+        print(f"{nome}: {'; '.join(motivos)}")
+
+
+def criar_parser():
+    from benchmarks.dados_sinteticos import adicionar_opcoes_tamanho
+
+    parser = argparse.ArgumentParser(description='Mede tempo e memória de cada etapa do pipeline sobre dados sintéticos')
+    parser.add_argument('--etapas', nargs='+', metavar='ETAPA', help='Etapas medidas (padrão: todas)')
+    parser.add_argument('--repeticoes', type=int, default=REPETICOES, help='Execuções por etapa; vale a mediana')
+    parser.add_argument('--diretorio', default=DIRETORIO_PADRAO, help='Diretório de trabalho com os dados sintéticos')
+    parser.add_argument('--orcamento-treino', type=float, default=ORCAMENTO_TREINO_S,
+                        help='Orçamento (s) da busca de hiperparâmetros na etapa modelo')
+    parser.add_argument('--salvar-baseline', action='store_true',
+                        help='Grava os resultados como baseline destes tamanhos')
+    adicionar_opcoes_tamanho(parser)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['_medir']:
+        return medir_etapa(*argv[1:])
+
+    from benchmarks.dados_sinteticos import gerar, tamanhos_dos_argumentos
+    args = criar_parser().parse_args(argv)
+    tamanhos = tamanhos_dos_argumentos(args)
+    etapas = args.etapas or pipeline.ordenar()
+    pipeline.selecionar(somente=etapas)
+
+    diretorio = os.path.abspath(args.diretorio)
+    try:
+        gerar(diretorio, tamanhos, args.semente)
+    except FileExistsError as e:
+        criar_parser().error(str(e))
+    servidor, endpoint = iniciar_s3_local()
+    try:
+        resultados = medir(etapas, diretorio, ambiente(diretorio, endpoint, args.orcamento_treino), args.repeticoes)
+    finally:
+        servidor.stop()
+
+    # A baseline é separada por tamanhos e semente: só medições do mesmo volume são comparáveis
+    chave = f'{tamanhos.assinatura()},semente={args.semente}'
+    baseline = _ler_baseline()
+    base = baseline.get(chave, {})
+    encontradas = regressoes(resultados, base)
+    imprimir(resultados, base, encontradas)
+    with open(os.path.join(diretorio, 'resultados.json'), 'w', encoding='utf-8') as f:
+        json.dump({'tamanhos': chave, 'resultados': resultados, 'regressoes': encontradas}, f, indent=2)
+
+    if args.salvar_baseline:
+        baseline[chave] = {**base, **resultados}
+        _salvar_baseline(baseline)
+        logging.info(f'Baseline atualizada em {BASELINE_PATH}')
+        return 0
+    return 1 if encontradas else 0
+
+
+if __name__ == '__main__':
+    configurar_logs()
+    raise SystemExit(main())
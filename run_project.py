@@ -1,34 +1,90 @@
+import argparse
 import logging
-from src.etl import etl_dados_historicos, etl_locais_paranagua, etl_locais_pontal
-from src.features import gerar_variaveis
-from src.models import modelo_valorizacao
-from src.reports import gerar_ranking
+from src import pipeline
+from src.utils.logs import configurar_logs
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s — %(levelname)s — %(message)s"
-)
+def _opcoes_execucao(parser):
+    parser.add_argument("--workers", type=int, default=pipeline.MAX_ETAPAS_SIMULTANEAS,
+                        help="Número máximo de etapas simultâneas")
+    parser.add_argument("--forcar", action="store_true",
+                        help="Executa as etapas mesmo com checkpoint válido (entradas, código e parâmetros inalterados)")
 
-def main():
-    logging.info("Iniciando pipeline completo do ValorImob")
+def criar_parser():
+    """Subcomandos do ValorImob; só `src.pipeline` é importado para montá-los, nenhuma etapa."""
+    parser = argparse.ArgumentParser(prog="valorimob", description="Pipeline do ValorImob (sem comando: executa tudo)")
+    comandos = parser.add_subparsers(dest="comando", metavar="COMANDO")
 
-    # 1. ETL dos dados de imóveis
-    etl_locais_paranagua.run_etl()
-    etl_locais_pontal.run_etl()
+    executar = comandos.add_parser("executar", help="Executa as etapas alvo e suas dependências (padrão: todas)")
+    executar.add_argument("alvos", nargs="*", help="Etapas alvo; suas dependências também são executadas")
+    executar.add_argument("--somente", nargs="+", metavar="ETAPA", help="Executa apenas estas etapas, sem dependências")
+    _opcoes_execucao(executar)
 
-    # 2. ETL histórico
-    etl_dados_historicos.run_etl()
+    comandos.add_parser("listar", help="Lista as etapas e suas dependências")
 
-    # 3. Feature engineering
-    gerar_variaveis.gerar()
+    verificar = comandos.add_parser("verificar", help="Confere os artefatos das etapas sem importar nenhuma delas")
+    verificar.add_argument("etapas", nargs="*", help="Etapas verificadas (padrão: todas)")
 
-    # 4. Treinamento e predição de modelo
-    modelo_valorizacao.treinar_modelo()
+    importacoes = comandos.add_parser("importacoes", help="Mede o tempo de importação do módulo de cada etapa")
+    importacoes.add_argument("etapas", nargs="*", help="Etapas medidas (padrão: todas)")
 
-    # 5. Gerar ranking final
-    gerar_ranking.gerar()
+    for etapa in pipeline.ETAPAS:
+        sub = comandos.add_parser(etapa.nome, help=f"Executa a etapa {etapa.nome} e suas dependências")
+        sub.add_argument("--sem-dependencias", action="store_true", help="Executa só esta etapa")
+        _opcoes_execucao(sub)
+    return parser
 
-    logging.info("Pipeline completo executado com sucesso.")
+def _executar(alvos=None, somente=None, workers=pipeline.MAX_ETAPAS_SIMULTANEAS, forcar=False):
+    nomes = pipeline.selecionar(alvos=alvos, somente=somente)
+    logging.info(f"Iniciando pipeline do ValorImob: {', '.join(nomes)}")
+    pipeline.executar(nomes, max_workers=workers, forcar=forcar)
+    logging.info("Pipeline executado com sucesso.")
+
+def _listar():
+    deps = pipeline.dependencias()
+    for nome in pipeline.ordenar():
+        print(f"{nome}: {', '.join(sorted(deps[nome])) or '-'}")
+
+def _verificar(etapas):
+    """Retorna 1 se faltar algum artefato, para uso em verificações agendadas."""
+    ausentes = 0
+    for nome, saida, idade in pipeline.artefatos(pipeline.selecionar(somente=etapas or None)):
+        if idade is None:
+            ausentes += 1
+            print(f"{nome}: {saida} AUSENTE")
+        else:
+            print(f"{nome}: {saida} atualizado há {idade / 3600:.1f} h")
+    return 1 if ausentes else 0
+
+def _importacoes(etapas):
+    from src.utils.importacoes import medir_importacao
+
+    por_nome = {etapa.nome: etapa for etapa in pipeline.ETAPAS}
+    for nome in pipeline.selecionar(somente=etapas or None):
+        medicao = medir_importacao(por_nome[nome].modulo)
+        if medicao['erro']:
+            print(f"{nome:<25} {'-':>8}  {medicao['erro']}")
+            continue
+        pacotes = ', '.join(f"{pacote} {segundos:.2f}s" for pacote, segundos in medicao['pacotes'])
+        print(f"{nome:<25} {medicao['total_s']:>7.2f}s  {pacotes}")
+
+def main(argv=None):
+    # Ponto de entrada comum de `python run_project.py` e do script `valorimob`
+    configurar_logs()
+    args = criar_parser().parse_args(argv)
+
+    if args.comando is None:
+        return _executar()
+    if args.comando == "executar":
+        return _executar(args.alvos, args.somente, args.workers, args.forcar)
+    if args.comando == "listar":
+        return _listar()
+    if args.comando == "verificar":
+        return _verificar(args.etapas)
+    if args.comando == "importacoes":
+        return _importacoes(args.etapas)
+    if args.sem_dependencias:
+        return _executar(somente=[args.comando], workers=args.workers, forcar=args.forcar)
+    return _executar(alvos=[args.comando], workers=args.workers, forcar=args.forcar)
 
 if __name__ == "__main__":
-    main()
+    raise SystemExit(main())
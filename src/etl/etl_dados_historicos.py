@@ -1,12 +1,15 @@
-import requests
+import json
 import pandas as pd
 import logging
 import os
 from datetime import datetime
-import boto3
-from google.cloud import bigquery
-
-logging.basicConfig(level=logging.INFO, format="%(asctime)s — %(levelname)s — %(message)s")
+from src.utils.cache_downloads import baixar_com_cache
+from src.utils.destino_s3 import enviar_em_segundo_plano
+from src.utils.instrumentacao import contar, trecho
+from src.utils.logs import configurar_logs
+from src.utils.rede import mapear_em_paralelo
+from src.utils.tabelas import caminho_tabela, ler_tabela, salvar_tabela
+from src.utils.warehouse import obter_warehouse
 
 # Parâmetros gerais
 AWS_S3_BUCKET = "seu-bucket-s3"
@@ -21,79 +24,164 @@ MUNICIPIOS = {
     "Pontal_do_Parana": 4118203,
 }
 
-# Período de interesse
-ANOS = list(range(2015, 2026))
+# Período de interesse: de ANO_INICIAL até o ano corrente
+ANO_INICIAL = 2015
 
-# Tabela SIDRA e variável a consultar (exemplo: tabela 6562 — domicílios particulares permanentes)
+# Tabela SIDRA e variáveis a consultar (exemplo: tabela 6562 — domicílios particulares permanentes)
 TABELA_SIDRA = 6562
-VARIAVEL_CODIGO = "7694"  # Exemplo variável dentro da tabela
+VARIAVEIS = ["7694"]  # Exemplo variável dentro da tabela
+
+# Número máximo de consultas simultâneas à API SIDRA
+MAX_REQUISICOES_SIMULTANEAS = 8
+
+# Marca d'água por (município, variável): último período com dados já ingerido
+WATERMARKS_PATH = os.path.join("data", "state", "watermarks_sidra.json")
+
+# Quantos períodos anteriores à marca d'água são consultados de novo para captar revisões do IBGE
+JANELA_REVISAO = 2
 
-def buscar_dados_sidra(municipio_code: int, ano: int) -> pd.DataFrame:
-    url = (
+# Chave de cada linha no armazenamento local e no BigQuery. NC (nível territorial) e
+# D1C (unidade territorial) distinguem as linhas de Brasil e região na mesma resposta.
+CHAVE = ["municipio", "variavel", "ano", "NC", "D1C"]
+
+def url_sidra(municipio_code: int, ano: int, variavel: str) -> str:
+    return (
         f"https://servicodados.ibge.gov.br/api/v1/sidra/values/{TABELA_SIDRA}/n1/all/"
-        f"n2/{municipio_code}/v/all/p/{ano}/c11255/{VARIAVEL_CODIGO}/d/v{VARIAVEL_CODIGO}%202"
+        f"n2/{municipio_code}/v/all/p/{ano}/c11255/{variavel}/d/v{variavel}%202"
     )
-    logging.info(f"Buscando dados SIDRA para município {municipio_code} e ano {ano}")
-    r = requests.get(url)
-    r.raise_for_status()
-    data = r.json()
+
+def buscar_dados_sidra(municipio_code: int, ano: int, variavel: str) -> pd.DataFrame:
+    url = url_sidra(municipio_code, ano, variavel)
+    logging.info(f"Buscando dados SIDRA para município {municipio_code}, variável {variavel} e ano {ano}")
+    with open(baixar_com_cache(url, fonte="sidra"), encoding="utf-8") as f:
+        data = json.load(f)
 
     # Conversão para DataFrame
     df = pd.DataFrame(data[1:], columns=data[0])
     return df
 
-def rodar_etl():
-    dfs = []
-    for municipio, codigo in MUNICIPIOS.items():
-        for ano in ANOS:
-            try:
-                df = buscar_dados_sidra(codigo, ano)
-                df["municipio"] = municipio
-                df["ano"] = ano
-                dfs.append(df)
-            except Exception as e:
-                logging.error(f"Erro ao baixar dados para {municipio} ano {ano}: {e}")
-
-    df_final = pd.concat(dfs, ignore_index=True)
-    csv_path = "data/processed/dados_historicos_ibge.csv"
-    os.makedirs(os.path.dirname(csv_path), exist_ok=True)
-    df_final.to_csv(csv_path, index=False)
-    logging.info(f"Dados consolidados salvos em {csv_path}")
-
-    # Enviar para S3
-    enviar_s3(csv_path)
-
-    # Enviar para BigQuery
-    enviar_bigquery(csv_path)
-
-def enviar_s3(file_path: str):
-    logging.info("Enviando arquivo para AWS S3")
-    s3_client = boto3.client("s3")
-    key = AWS_S3_PREFIX + os.path.basename(file_path)
+def buscar_municipio_ano(tarefa):
+    municipio, codigo, variavel, ano = tarefa
     try:
-        s3_client.upload_file(file_path, AWS_S3_BUCKET, key)
-        logging.info(f"Arquivo enviado para s3://{AWS_S3_BUCKET}/{key}")
+        with trecho("sidra", municipio=municipio, variavel=variavel, ano=ano):
+            df = buscar_dados_sidra(codigo, ano, variavel)
+            contar(linhas_entrada=len(df))
     except Exception as e:
-        logging.error(f"Erro ao enviar arquivo para S3: {e}")
-
-def enviar_bigquery(file_path: str):
-    logging.info("Enviando dados para BigQuery")
-    client = bigquery.Client(project=BIGQUERY_PROJECT)
+        logging.error(f"Erro ao baixar dados para {municipio} variável {variavel} ano {ano}: {e}")
+        return None
+    df["municipio"] = municipio
+    df["variavel"] = variavel
+    df["ano"] = ano
+    return df
 
-    dataset_ref = client.dataset(BIGQUERY_DATASET)
-    table_ref = dataset_ref.table(BIGQUERY_TABLE)
+def ler_watermarks() -> dict:
+    if not os.path.exists(WATERMARKS_PATH):
+        return {}
+    with open(WATERMARKS_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+def salvar_watermarks(watermarks: dict):
+    os.makedirs(os.path.dirname(WATERMARKS_PATH), exist_ok=True)
+    tmp = WATERMARKS_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(watermarks, f, indent=2, sort_keys=True)
+    os.replace(tmp, WATERMARKS_PATH)
+
+def periodos_a_buscar(watermark, ano_final=None) -> list:
+    """Períodos novos desde a marca d'água, mais a janela de revisão anterior a ela."""
+    ano_final = ano_final or datetime.now().year
+    if watermark is None:
+        return list(range(ANO_INICIAL, ano_final + 1))
+    inicio = max(ANO_INICIAL, watermark - JANELA_REVISAO + 1)
+    return list(range(inicio, ano_final + 1))
+
+def planejar_tarefas(watermarks: dict) -> list:
+    tarefas = []
+    for municipio, codigo in MUNICIPIOS.items():
+        for variavel in VARIAVEIS:
+            watermark = watermarks.get(f"{municipio}|{variavel}", {}).get("ultimo_periodo")
+            tarefas.extend((municipio, codigo, variavel, ano) for ano in periodos_a_buscar(watermark))
+    return tarefas
+
+def primeiras_falhas(tarefas, resultados) -> dict:
+    """Primeiro período cuja consulta falhou, por série (município|variável)."""
+    falhas = {}
+    for (municipio, _, variavel, ano), df in zip(tarefas, resultados):
+        if df is None:
+            chave = f"{municipio}|{variavel}"
+            falhas[chave] = min(ano, falhas.get(chave, ano))
+    return falhas
+
+def mesclar(existente, novos):
+    """Combina os dados novos com o armazenamento local pela CHAVE.
+
+    Retorna a tabela completa atualizada e o delta (linhas novas ou revisadas).
+    """
+    if existente is None or existente.empty:
+        return novos, novos
+    comparacao = novos.merge(existente, how="left", indicator=True)
+    delta = novos[(comparacao["_merge"] == "left_only").values]
+    completo = pd.concat([existente, delta], ignore_index=True)
+    completo = completo.drop_duplicates(subset=CHAVE, keep="last").sort_values(CHAVE, ignore_index=True)
+    return completo, delta
 
-    job_config = bigquery.LoadJobConfig(
-        source_format=bigquery.SourceFormat.CSV,
-        skip_leading_rows=1,
-        autodetect=True,
-        write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
-    )
+def rodar_etl():
+    watermarks = ler_watermarks()
+    tarefas = planejar_tarefas(watermarks)
+    logging.info(f"{len(tarefas)} consultas SIDRA planejadas a partir das marcas d'água")
+    resultados = mapear_em_paralelo(buscar_municipio_ano, tarefas, MAX_REQUISICOES_SIMULTANEAS)
+    dfs = [df for df in resultados if df is not None and not df.empty]
+    if not dfs:
+        logging.info("Nenhum dado novo na API SIDRA")
+        return
+
+    novos = pd.concat(dfs, ignore_index=True)
+    # Campos da API SIDRA chegam como texto; municipio e ano têm tipo fixo no esquema
+    colunas_sidra = [col for col in novos.columns if col != "ano"]
+    novos[colunas_sidra] = novos[colunas_sidra].astype("string")
+    novos["ano"] = novos["ano"].astype("int16")
+
+    caminho_local = caminho_tabela("dados_historicos_ibge")
+    existente = ler_tabela("dados_historicos_ibge") if os.path.exists(caminho_local) else None
+    completo, delta = mesclar(existente, novos)
+    logging.info(f"{len(delta)} linhas novas ou revisadas de {len(novos)} consultadas")
+
+    if not delta.empty:
+        delta_path = salvar_tabela(delta, "dados_historicos_ibge_delta", manter_extras=True)
+
+        # Mesclar o delta no warehouse antes de gravar o armazenamento local: se a carga falhar,
+        # a próxima execução ainda encontra essas linhas como delta e as reenvia
+        enviar_bigquery(delta_path)
+
+        parquet_path = salvar_tabela(completo, "dados_historicos_ibge", manter_extras=True)
+        logging.info(f"Dados consolidados salvos em {parquet_path}")
+
+        # Enviar para S3 (em segundo plano)
+        enviar_em_segundo_plano(parquet_path, AWS_S3_BUCKET, AWS_S3_PREFIX + os.path.basename(parquet_path))
+
+    # A marca d'água só avança depois que os dados foram gravados, e só até antes da primeira
+    # consulta falha da série: os períodos seguintes a ela voltam a ser consultados na próxima execução
+    falhas = primeiras_falhas(tarefas, resultados)
+    for (municipio, variavel), anos in novos.groupby(["municipio", "variavel"])["ano"]:
+        chave = f"{municipio}|{variavel}"
+        if chave in falhas:
+            anos = anos[anos < falhas[chave]]
+            if anos.empty:
+                continue
+        ano = anos.max()
+        atual = watermarks.get(chave, {}).get("ultimo_periodo")
+        watermarks[chave] = {
+            "ultimo_periodo": max(int(ano), atual or int(ano)),
+            "atualizado_em": datetime.now().isoformat(timespec="seconds"),
+        }
+    salvar_watermarks(watermarks)
 
-    with open(file_path, "rb") as source_file:
-        load_job = client.load_table_from_file(source_file, table_ref, job_config=job_config)
-    load_job.result()
-    logging.info(f"Dados carregados na tabela {BIGQUERY_DATASET}.{BIGQUERY_TABLE}")
+def enviar_bigquery(file_path: str):
+    """Mescla as linhas do arquivo na tabela do warehouse pela CHAVE."""
+    logging.info("Enviando dados para o warehouse")
+    obter_warehouse(BIGQUERY_PROJECT).upsert(file_path, f"{BIGQUERY_DATASET}.{BIGQUERY_TABLE}", CHAVE)
+    logging.info(f"Dados mesclados na tabela {BIGQUERY_DATASET}.{BIGQUERY_TABLE}")
 
 if __name__ == "__main__":
+    configurar_logs()
     rodar_etl()
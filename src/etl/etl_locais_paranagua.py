@@ -1,13 +1,13 @@
 import os
 import logging
-import requests
 import geopandas as gpd
-from io import BytesIO
-from zipfile import ZipFile
-from google.cloud import bigquery
-import boto3
+from src.utils.cache_downloads import baixar_com_cache
+from src.utils.destino_s3 import enviar_em_segundo_plano
+from src.utils.instrumentacao import contar
+from src.utils.logs import configurar_logs
+from src.utils.shapefiles import caminho_virtual_shapefile
+from src.utils.warehouse import obter_warehouse
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Configurações AWS e BigQuery - ajuste conforme seu ambiente
@@ -27,16 +27,12 @@ SHAPEFILES = {
 
 
 def baixar_shapefile_onr(municipio):
-    """Baixa e extrai shapefile do ONR para o município."""
+    """Baixa o shapefile do ONR para o município e retorna o caminho virtual do .shp no zip."""
     url = ONR_BASE_URL + SHAPEFILES.get(municipio)
     logger.info(f"Baixando dados ONR para {municipio} de {url}")
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        with ZipFile(BytesIO(response.content)) as zip_ref:
-            zip_ref.extractall(f'data/raw/{municipio}')
-        logger.info(f"Dados extraídos para data/raw/{municipio}")
-        return f'data/raw/{municipio}'
+        caminho_zip = baixar_com_cache(url, fonte='onr')
+        return caminho_virtual_shapefile(caminho_zip)
     except Exception as e:
         logger.error(f"Erro ao baixar shapefile para {municipio}: {e}")
         return None
@@ -44,18 +40,13 @@ def baixar_shapefile_onr(municipio):
 
 def processar_shapefile(municipio):
     """Lê shapefile, faz limpeza e retorna GeoDataFrame."""
-    path = baixar_shapefile_onr(municipio)
-    if not path:
+    shp_path = baixar_shapefile_onr(municipio)
+    if not shp_path:
         logger.error(f"Falha ao obter dados para {municipio}")
         return None
-    # Encontrar arquivo .shp dentro da pasta extraída
-    shp_files = [f for f in os.listdir(path) if f.endswith('.shp')]
-    if not shp_files:
-        logger.error(f"Nenhum arquivo .shp encontrado em {path}")
-        return None
-    shp_path = os.path.join(path, shp_files[0])
     logger.info(f"Lendo shapefile {shp_path}")
     gdf = gpd.read_file(shp_path)
+    contar(linhas_entrada=len(gdf))
 
     # Limpeza básica - manter colunas relevantes
     cols_relevantes = ['processo', 'situacao', 'area_ha', 'geometry']
@@ -65,39 +56,25 @@ def processar_shapefile(municipio):
     # Filtrar somente dados relevantes, por exemplo: situações ativas ou concluídas
     gdf = gdf[gdf['situacao'].isin(['Concluído', 'Ativo'])]
 
-    # Salvar CSV para análise posterior
-    output_csv = f'data/processed/regularizacao_{municipio}.csv'
-    gdf.to_csv(output_csv, index=False)
-    logger.info(f"Arquivo processado salvo em {output_csv}")
+    # Salvar GeoParquet em WGS84, o sistema das coordenadas dos imóveis no enriquecimento espacial.
+    # No warehouse a geometria é carregada como WKB (BYTES), não como GEOGRAPHY
+    if gdf.crs is not None:
+        gdf = gdf.to_crs(epsg=4326)
+    os.makedirs('data/processed', exist_ok=True)
+    output_parquet = f'data/processed/regularizacao_{municipio}.parquet'
+    gdf.to_parquet(output_parquet, compression='zstd', index=False)
+    contar(linhas_saida=len(gdf), bytes_gravados=os.path.getsize(output_parquet))
+    logger.info(f"Arquivo processado salvo em {output_parquet}")
     return gdf
 
 
-def upload_aws_s3(file_path, s3_key):
-    """Faz upload do arquivo para AWS S3."""
-    s3 = boto3.client('s3')
-    try:
-        s3.upload_file(file_path, AWS_S3_BUCKET, s3_key)
-        logger.info(f"Upload para S3 concluído: s3://{AWS_S3_BUCKET}/{s3_key}")
-    except Exception as e:
-        logger.error(f"Erro no upload para S3: {e}")
-
-
-def upload_bigquery(file_path, table_id):
-    """Faz upload do CSV para BigQuery."""
-    client = bigquery.Client(project=BIGQUERY_PROJECT)
-    job_config = bigquery.LoadJobConfig(
-        source_format=bigquery.SourceFormat.CSV,
-        skip_leading_rows=1,
-        autodetect=True,
-        write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
-    )
+def upload_bigquery(file_path, tabela):
+    """Carrega o GeoParquet no warehouse."""
     try:
-        with open(file_path, "rb") as source_file:
-            job = client.load_table_from_file(source_file, table_id, job_config=job_config)
-        job.result()  # Espera terminar o upload
-        logger.info(f"Upload para BigQuery concluído: {table_id}")
+        obter_warehouse(BIGQUERY_PROJECT).carregar(file_path, tabela)
+        logger.info(f"Upload para o warehouse concluído: {tabela}")
     except Exception as e:
-        logger.error(f"Erro no upload para BigQuery: {e}")
+        logger.error(f"Erro no upload para o warehouse: {e}")
 
 
 def run_etl():
@@ -105,13 +82,14 @@ def run_etl():
     for municipio in ['paranagua', 'pontal']:
         gdf = processar_shapefile(municipio)
         if gdf is not None:
-            csv_path = f'data/processed/regularizacao_{municipio}.csv'
-            s3_key = f'regularizacao/{municipio}/regularizacao.csv'
-            table_id = f'{BIGQUERY_PROJECT}.{BIGQUERY_DATASET}.{municipio}'
-            upload_aws_s3(csv_path, s3_key)
-            upload_bigquery(csv_path, table_id)
+            parquet_path = f'data/processed/regularizacao_{municipio}.parquet'
+            s3_key = f'regularizacao/{municipio}/regularizacao.parquet'
+            tabela = f'{BIGQUERY_DATASET}.{municipio}'
+            enviar_em_segundo_plano(parquet_path, AWS_S3_BUCKET, s3_key)
+            upload_bigquery(parquet_path, tabela)
     logger.info("ETL completo.")
 
 
 if __name__ == "__main__":
+    configurar_logs()
     run_etl()
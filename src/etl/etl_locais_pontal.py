@@ -1,18 +1,25 @@
 import os
 import logging
-import requests
-from ftplib import FTP
-import boto3
-from google.cloud import bigquery
-
-logging.basicConfig(level=logging.INFO, format='%(asctime)s — %(levelname)s — %(message)s')
+from functools import partial
+import geopandas as gpd
+from pyogrio import read_info
+from src.utils.destino_s3 import enviar_em_segundo_plano
+from src.utils.instrumentacao import contar
+from src.utils.logs import configurar_logs
+from src.utils.pool_ftp import PoolFTP, baixar_arquivo_ftp
+from src.utils.rede import mapear_em_paralelo
+from src.utils.shapefiles import caminho_virtual_shapefile
+from src.utils.warehouse import obter_warehouse
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'raw', 'ibge_shapefiles')
-os.makedirs(DATA_DIR, exist_ok=True)
+EXTRATOS_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'processed', 'ibge_municipios')
 
 IBGE_FTP_HOST = 'geoftp.ibge.gov.br'
 MALHAS_BASE_DIR = '/organizacao_do_territorio/malhas_territoriais/malhas_municipais'
 
+# Conexões FTP simultâneas (e anos baixados em paralelo)
+CONEXOES_FTP = 4
+
 # Config Google BigQuery
 BQ_PROJECT = 'seu-projeto-gcp'
 BQ_DATASET = 'valorimob_ibge'
@@ -21,25 +28,30 @@ BQ_DATASET = 'valorimob_ibge'
 S3_BUCKET = 'seu-bucket-s3'
 S3_FOLDER = 'ibge_shapefiles'
 
-# Código do município de Pontal - alterar conforme necessário
-CODIGO_MUNICIPIO_PONTAL = '4118500'  # Exemplo: Pontal do Paraná
+# Códigos IBGE (7 dígitos) dos municípios mantidos no recorte da malha nacional
+CODIGOS_MUNICIPIOS = {
+    'Paranagua': '4118204',
+    'Pontal_do_Parana': '4119954',
+}
+
+# Envelope (lon_min, lat_min, lon_max, lat_max) em SIRGAS 2000 que cobre os dois municípios.
+# Usado como pré-filtro espacial na leitura, antes do filtro por código.
+BBOX_LITORAL = (-48.90, -25.85, -48.25, -25.30)
 
-def listar_anos_disponiveis():
-    ftp = FTP(IBGE_FTP_HOST)
-    ftp.login()
-    ftp.cwd(MALHAS_BASE_DIR)
-    anos = ftp.nlst()
-    ftp.quit()
+# Nome da coluna de código do município na malha, que mudou a partir de 2019
+COLUNAS_CODIGO_MUNICIPIO = ('CD_MUN', 'CD_GEOCMU')
+
+def listar_anos_disponiveis(pool):
+    with pool.conexao() as ftp:
+        anos = [os.path.basename(item) for item in ftp.nlst(MALHAS_BASE_DIR)]
     anos_validos = [ano for ano in anos if ano.isdigit() and 2015 <= int(ano) <= 2025]
     logging.info(f"Anos disponíveis para download: {anos_validos}")
     return sorted(anos_validos)
 
-def baixar_shapefile_ano(ano):
-    ftp = FTP(IBGE_FTP_HOST)
-    ftp.login()
+def baixar_shapefile_ano(ano, pool):
     pasta_ano = f'{MALHAS_BASE_DIR}/{ano}/BR'
-    ftp.cwd(pasta_ano)
-    arquivos = ftp.nlst()
+    with pool.conexao() as ftp:
+        arquivos = [os.path.basename(item) for item in ftp.nlst(pasta_ano)]
     arquivo_zip = None
     for arq in arquivos:
         if arq.startswith('BR_Municipios') and arq.endswith('.zip'):
@@ -47,52 +59,58 @@ def baixar_shapefile_ano(ano):
             break
     if not arquivo_zip:
         logging.warning(f"Arquivo shapefile não encontrado para ano {ano}")
-        ftp.quit()
         return None
 
     caminho_local = os.path.join(DATA_DIR, arquivo_zip)
-    if os.path.exists(caminho_local):
-        logging.info(f"Arquivo {arquivo_zip} já existe localmente.")
-        ftp.quit()
-        return caminho_local
-
     logging.info(f"Baixando {arquivo_zip} para {caminho_local}")
-    with open(caminho_local, 'wb') as f:
-        ftp.retrbinary(f'RETR {arquivo_zip}', f.write)
-
-    ftp.quit()
-    return caminho_local
+    try:
+        return baixar_arquivo_ftp(pool, f'{pasta_ano}/{arquivo_zip}', caminho_local)
+    except Exception as e:
+        logging.error(f"Erro ao baixar shapefile do ano {ano}: {e}")
+        return None
 
-def upload_s3(caminho_arquivo):
-    s3 = boto3.client('s3')
-    nome_arquivo = os.path.basename(caminho_arquivo)
-    s3_key = f"{S3_FOLDER}/{nome_arquivo}"
-    logging.info(f"Fazendo upload para S3: s3://{S3_BUCKET}/{s3_key}")
-    s3.upload_file(caminho_arquivo, S3_BUCKET, s3_key)
+def recortar_municipios(caminho_zip, ano):
+    """Lê da malha nacional só os municípios de interesse e grava um extrato GeoParquet do ano."""
+    shp = caminho_virtual_shapefile(caminho_zip, prefixo_nome='BR_Mun')
+    campos = list(read_info(shp)['fields'])
+    coluna = next((c for c in COLUNAS_CODIGO_MUNICIPIO if c in campos), None)
+    if coluna is None:
+        raise KeyError(f"Coluna de código do município não encontrada em {shp}: {campos}")
+
+    codigos = ", ".join(f"'{codigo}'" for codigo in CODIGOS_MUNICIPIOS.values())
+    gdf = gpd.read_file(shp, engine='pyogrio', bbox=BBOX_LITORAL, where=f"{coluna} IN ({codigos})")
+    contar(linhas_entrada=len(gdf))
+    gdf = gdf.rename(columns={coluna: 'CD_MUN'}).to_crs(epsg=4326)
+    gdf['ano'] = int(ano)
+
+    os.makedirs(EXTRATOS_DIR, exist_ok=True)
+    caminho_extrato = os.path.join(EXTRATOS_DIR, f'municipios_litoral_{ano}.parquet')
+    gdf.to_parquet(caminho_extrato, compression='zstd', index=False)
+    contar(linhas_saida=len(gdf), bytes_gravados=os.path.getsize(caminho_extrato))
+    logging.info(f"Recorte {ano}: {len(gdf)} municípios salvos em {caminho_extrato}")
+    return caminho_extrato
 
 def carregar_bigquery(caminho_arquivo, ano):
-    client = bigquery.Client(project=BQ_PROJECT)
-    tabela_id = f"{BQ_PROJECT}.{BQ_DATASET}.municipios_ibge_{ano}_pontal"
-
-    job_config = bigquery.LoadJobConfig(
-        source_format=bigquery.SourceFormat.SHAPEFILE,  # SHP pode ser SHAPEFILE dependendo do SDK
-        write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
-    )
-
-    logging.info(f"Carregando shapefile no BigQuery: {tabela_id}")
-    with open(caminho_arquivo, "rb") as source_file:
-        job = client.load_table_from_file(source_file, tabela_id, job_config=job_config)
-
-    job.result()
-    logging.info(f"Upload no BigQuery concluído para o ano {ano}")
+    tabela = f"{BQ_DATASET}.municipios_ibge_{ano}_pontal"
+    logging.info(f"Carregando recorte GeoParquet no warehouse: {tabela}")
+    obter_warehouse(BQ_PROJECT).carregar(caminho_arquivo, tabela)
+    logging.info(f"Upload no warehouse concluído para o ano {ano}")
 
 def run_etl():
-    anos = listar_anos_disponiveis()
-    for ano in anos:
-        caminho = baixar_shapefile_ano(ano)
+    os.makedirs(DATA_DIR, exist_ok=True)
+    pool = PoolFTP(IBGE_FTP_HOST, tamanho=CONEXOES_FTP)
+    try:
+        anos = listar_anos_disponiveis(pool)
+        caminhos = mapear_em_paralelo(partial(baixar_shapefile_ano, pool=pool), anos, CONEXOES_FTP)
+    finally:
+        pool.fechar()
+
+    for ano, caminho in zip(anos, caminhos):
         if caminho:
-            upload_s3(caminho)
-            carregar_bigquery(caminho, ano)
+            extrato = recortar_municipios(caminho, ano)
+            enviar_em_segundo_plano(extrato, S3_BUCKET, f"{S3_FOLDER}/{os.path.basename(extrato)}")
+            carregar_bigquery(extrato, ano)
 
 if __name__ == "__main__":
+    configurar_logs()
     run_etl()
@@ -0,0 +1,120 @@
+import os
+import logging
+import geopandas as gpd
+import pandas as pd
+import pyarrow.parquet as pq
+from src.features.gerar_variaveis import linhas_por_bloco
+from src.utils.indice_espacial import IndiceEspacial
+from src.utils.instrumentacao import contar
+from src.utils.logs import configurar_logs
+from src.utils.tabelas import caminho_tabela, escritor_tabela
+
+PROCESSED_DIR = os.path.join('data', 'processed')
+BAIRROS_PATH = os.path.join(PROCESSED_DIR, 'bairros_paranagua.gpkg')
+REGULARIZACAO_PATHS = [
+    os.path.join(PROCESSED_DIR, 'regularizacao_paranagua.parquet'),
+    os.path.join(PROCESSED_DIR, 'regularizacao_pontal.parquet'),
+]
+
+# Possíveis nomes da coluna com o nome do bairro no shapefile da prefeitura
+COLUNAS_NOME_BAIRRO = ['nome', 'NOME', 'bairro', 'BAIRRO', 'nm_bairro', 'NM_BAIRRO', 'nome_bairro']
+
+def _coluna_nome_bairro(gdf):
+    for coluna in COLUNAS_NOME_BAIRRO:
+        if coluna in gdf.columns:
+            return coluna
+    texto = [c for c in gdf.columns if c != gdf.geometry.name and gdf[c].dtype == object]
+    if not texto:
+        raise KeyError(f'Nenhuma coluna com o nome do bairro em {BAIRROS_PATH}')
+    return texto[0]
+
+def ler_bairros() -> gpd.GeoDataFrame:
+    """Polígonos dos bairros em EPSG:4326 com o nome normalizado em `bairro_oficial`."""
+    gdf = gpd.read_file(BAIRROS_PATH)
+    if gdf.crs is not None:
+        gdf = gdf.to_crs(epsg=4326)
+    coluna = _coluna_nome_bairro(gdf)
+    return gpd.GeoDataFrame(
+        {'bairro_oficial': gdf[coluna].astype('string').str.strip().str.lower()},
+        geometry=gdf.geometry.values, crs='EPSG:4326',
+    )
+
+def ler_regularizacao(caminhos) -> gpd.GeoDataFrame:
+    return gpd.GeoDataFrame(pd.concat([gpd.read_parquet(c) for c in caminhos], ignore_index=True))
+
+def construir_indice_bairros():
+    gdf = ler_bairros()
+    return IndiceEspacial(gdf.geometry.values, pd.DataFrame(gdf[['bairro_oficial']]))
+
+def construir_indice_regularizacao(caminhos):
+    gdf = ler_regularizacao(caminhos)
+    atributos = pd.DataFrame({
+        'situacao_regularizacao': gdf['situacao'].astype('string'),
+        'area_ha_regularizacao': pd.to_numeric(gdf.get('area_ha'), errors='coerce'),
+    })
+    return IndiceEspacial(gdf.geometry.values, atributos)
+
+def carregar_indices():
+    """Índices de bairros e de regularização; camadas ainda não geradas ficam de fora (None).
+
+    São construídos a cada execução: o STRtree do shapely 2.0 é serializado
+    como as suas geometrias e reconstruído ao carregar, então persisti-lo
+    custaria mais do que ler as camadas de novo.
+    """
+    bairros = None
+    if os.path.exists(BAIRROS_PATH):
+        bairros = construir_indice_bairros()
+    else:
+        logging.warning(f'{BAIRROS_PATH} não encontrado — bairro informado no anúncio será mantido')
+
+    caminhos = [c for c in REGULARIZACAO_PATHS if os.path.exists(c)]
+    regularizacao = None
+    if caminhos:
+        regularizacao = construir_indice_regularizacao(caminhos)
+    else:
+        logging.warning('Camadas de regularização não encontradas — imóveis marcados como fora de regularização')
+    return bairros, regularizacao
+
+def enriquecer_bloco(df, bairros, regularizacao):
+    """Atribui bairro oficial e área de regularização a cada imóvel pelas suas coordenadas."""
+    informado = df['bairro'].astype('string')
+    df['bairro_informado'] = informado.astype('category')
+
+    if bairros is not None:
+        oficial = bairros.localizar(df['longitude'], df['latitude'])['bairro_oficial']
+        oficial.index = df.index
+        df['bairro'] = oficial.astype('string').fillna(informado).astype('category')
+
+    if regularizacao is not None:
+        area = regularizacao.localizar(df['longitude'], df['latitude'])
+        area.index = df.index
+        df['situacao_regularizacao'] = area['situacao_regularizacao'].astype('category')
+        df['area_ha_regularizacao'] = area['area_ha_regularizacao'].astype('float32')
+    else:
+        df['situacao_regularizacao'] = pd.Categorical([None] * len(df))
+        df['area_ha_regularizacao'] = pd.Series(float('nan'), index=df.index, dtype='float32')
+    df['em_regularizacao'] = df['situacao_regularizacao'].notna().astype('int8')
+    return df
+
+def processar():
+    bairros, regularizacao = carregar_indices()
+    origem = pq.ParquetFile(caminho_tabela('variaveis_paranagua'))
+    encontrados = registros = 0
+    with escritor_tabela('variaveis_enriquecidas') as escrever:
+        for lote in origem.iter_batches(batch_size=linhas_por_bloco()):
+            contar(linhas_entrada=lote.num_rows)
+            bloco = enriquecer_bloco(lote.to_pandas(), bairros, regularizacao)
+            escrever(bloco)
+            registros += len(bloco)
+            encontrados += int(bloco['em_regularizacao'].sum())
+
+    logging.info(f'Enriquecimento espacial concluído — {registros} imóveis, {encontrados} em áreas de regularização')
+    return caminho_tabela('variaveis_enriquecidas')
+
+def run():
+    logging.info('Iniciando enriquecimento espacial dos imóveis')
+    processar()
+
+if __name__ == '__main__':
+    configurar_logs()
+    run()
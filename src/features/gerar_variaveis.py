@@ -1,10 +1,11 @@
 import os
 import logging
 import pandas as pd
-from google.cloud import bigquery
-import boto3
-
-logging.basicConfig(level=logging.INFO, format='%(asctime)s — %(levelname)s — %(message)s')
+from src.utils.destino_s3 import enviar_em_segundo_plano
+from src.utils.instrumentacao import contar
+from src.utils.logs import configurar_logs
+from src.utils.tabelas import caminho_tabela, escritor_tabela
+from src.utils.warehouse import obter_warehouse
 
 PROCESSED_DIR = os.path.join('data', 'processed')
 AWS_S3_BUCKET = 'seu-bucket-aqui'
@@ -14,61 +15,86 @@ BQ_PROJECT = 'seu-projeto-gcp'
 BQ_DATASET = 'valorimob'
 BQ_TABLE = 'variaveis_paranagua'
 
-def carregar_dados():
-    df_pontal = pd.read_csv(os.path.join(PROCESSED_DIR, 'imoveis_pontal.csv'))
-    df_paranagua = pd.read_csv(os.path.join(PROCESSED_DIR, 'imoveis_paranagua.csv'))
-    df_hist = pd.read_csv(os.path.join(PROCESSED_DIR, 'dados_historicos.csv'))
-
-    logging.info('Dados carregados com sucesso')
-
-    df = pd.concat([df_pontal, df_paranagua], ignore_index=True)
-
-
-    df['preco_por_m2'] = df['preco'] / df['area_m2']
-    df['eh_novo'] = df['ano_construcao'].apply(lambda x: 1 if x >= 2015 else 0 if pd.notnull(x) else None)
-    df['bairro'] = df['bairro'].str.strip().str.lower()
-
-    logging.info(f'Variáveis geradas — {df.shape[0]} registros')
-
-    return df
-
-def salvar_csv(df, nome_arquivo):
-    os.makedirs(PROCESSED_DIR, exist_ok=True)
-    path = os.path.join(PROCESSED_DIR, nome_arquivo)
-    df.to_csv(path, index=False)
-    logging.info(f'Arquivo salvo: {path}')
-    return path
-
-def upload_s3(file_path, bucket=AWS_S3_BUCKET, prefix=AWS_S3_PREFIX):
-    s3 = boto3.client('s3')
-    key = prefix + os.path.basename(file_path)
-    s3.upload_file(file_path, bucket, key)
-    logging.info(f'Upload para S3: s3://{bucket}/{key}')
+# Arquivos de imóveis por município e colunas efetivamente usadas, com tipos compactos
+ARQUIVOS_IMOVEIS = {
+    'pontal': 'imoveis_pontal.csv',
+    'paranagua': 'imoveis_paranagua.csv',
+}
+TIPOS_IMOVEIS = {
+    'bairro': 'string',
+    'preco': 'float64',
+    'area_m2': 'float32',
+    'ano_construcao': 'float32',
+}
+# Colunas que nem todo CSV traz: coordenadas (WGS84) do anúncio, usadas no enriquecimento
+# espacial, e o ano do anúncio, usado no backtesting temporal
+COLUNAS_OPCIONAIS = {
+    'latitude': 'float64',
+    'longitude': 'float64',
+    'ano': 'Int16',
+}
+
+# Imóveis construídos a partir deste ano são considerados novos
+ANO_CORTE_NOVO = 2015
+
+# Memória aproximada (MB) de cada bloco lido dos CSVs de imóveis
+ORCAMENTO_MEMORIA_MB = int(os.environ.get('VALORIMOB_MEMORIA_MB', 256))
+BYTES_POR_LINHA = 120
+
+def linhas_por_bloco(orcamento_mb=ORCAMENTO_MEMORIA_MB):
+    return max(10_000, orcamento_mb * 1024 ** 2 // BYTES_POR_LINHA)
+
+def calcular_variaveis(df, municipio):
+    """Calcula as variáveis de um bloco de imóveis só com operações vetorizadas."""
+    ano = df['ano_construcao']
+    variaveis = pd.DataFrame({
+        'municipio': pd.Categorical([municipio] * len(df)),
+        'bairro': df['bairro'].str.strip().str.lower().astype('category'),
+        'preco': df['preco'],
+        'area_m2': df['area_m2'],
+        'ano_construcao': ano.round().astype('Int16'),
+        'preco_por_m2': (df['preco'] / df['area_m2']).astype('float32'),
+        'eh_novo': ano.ge(ANO_CORTE_NOVO).astype('Int8').mask(ano.isna()),
+    }, index=df.index)
+    for coluna, tipo in COLUNAS_OPCIONAIS.items():
+        variaveis[coluna] = df[coluna] if coluna in df.columns else pd.Series(float('nan'), index=df.index, dtype=tipo)
+    return variaveis
+
+def ler_imoveis_em_blocos(municipio, tamanho_bloco=None):
+    return ler_csv_em_blocos(os.path.join(PROCESSED_DIR, ARQUIVOS_IMOVEIS[municipio]), tamanho_bloco)
+
+def ler_csv_em_blocos(path, tamanho_bloco=None):
+    return pd.read_csv(
+        path,
+        usecols=lambda coluna: coluna in TIPOS_IMOVEIS or coluna in COLUNAS_OPCIONAIS,
+        dtype={**TIPOS_IMOVEIS, **COLUNAS_OPCIONAIS},
+        chunksize=tamanho_bloco or linhas_por_bloco(),
+    )
 
-def upload_bigquery(csv_path, project=BQ_PROJECT, dataset=BQ_DATASET, table=BQ_TABLE):
-    client = bigquery.Client(project=project)
-    dataset_ref = client.dataset(dataset)
-    table_ref = dataset_ref.table(table)
+def processar_imoveis():
+    """Lê os imóveis em blocos e grava variaveis_paranagua.parquet bloco a bloco."""
+    registros = 0
+    with escritor_tabela('variaveis_paranagua') as escrever:
+        for municipio in ARQUIVOS_IMOVEIS:
+            for bloco in ler_imoveis_em_blocos(municipio):
+                contar(linhas_entrada=len(bloco))
+                escrever(calcular_variaveis(bloco, municipio))
+                registros += len(bloco)
 
-    job_config = bigquery.LoadJobConfig(
-        source_format=bigquery.SourceFormat.CSV,
-        skip_leading_rows=1,
-        autodetect=True,
-        write_disposition='WRITE_TRUNCATE'
-    )
+    logging.info(f'Variáveis geradas — {registros} registros')
+    return caminho_tabela('variaveis_paranagua')
 
-    with open(csv_path, "rb") as source_file:
-        job = client.load_table_from_file(source_file, table_ref, job_config=job_config)
-    job.result()
-    logging.info(f'Upload para BigQuery concluído: {project}.{dataset}.{table}')
+def upload_bigquery(parquet_path, project=BQ_PROJECT, dataset=BQ_DATASET, table=BQ_TABLE):
+    obter_warehouse(project).carregar(parquet_path, f'{dataset}.{table}')
+    logging.info(f'Upload para o warehouse concluído: {dataset}.{table}')
 
 def run():
     logging.info('Iniciando geração de variáveis')
-    df = carregar_dados()
-    path = salvar_csv(df, 'variaveis_paranagua.csv')
-    upload_s3(path)
+    path = processar_imoveis()
+    enviar_em_segundo_plano(path, AWS_S3_BUCKET, AWS_S3_PREFIX + os.path.basename(path))
     upload_bigquery(path)
     logging.info('Geração de variáveis finalizada')
 
 if __name__ == '__main__':
+    configurar_logs()
     run()
@@ -0,0 +1,110 @@
+import os
+import logging
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import shapely
+from sklearn.neighbors import BallTree
+from src.features.gerar_variaveis import linhas_por_bloco
+from src.utils.indice_espacial import carregar_indice
+from src.utils.instrumentacao import contar
+from src.utils.logs import configurar_logs
+from src.utils.tabelas import caminho_tabela, escritor_tabela
+
+# Camada local de pontos de interesse (qualquer formato lido pelo GeoPandas) com a coluna `categoria`
+POI_PATH = os.path.join('data', 'raw', 'pontos_interesse.gpkg')
+
+# Categorias com distância ao mais próximo; linhas (orla, rodovia) viram vértices a cada ~100 m
+CATEGORIAS_DISTANCIA = {
+    'porto': 'dist_porto_km',
+    'praia': 'dist_praia_km',
+    'pr407': 'dist_pr407_km',
+}
+PASSO_DENSIFICACAO_GRAUS = 0.001
+
+# Demais pontos (comércio, escolas, serviços) contados num raio em volta do imóvel
+RAIO_CONTAGEM_KM = 1.0
+COLUNA_CONTAGEM = 'qtde_poi_1km'
+
+RAIO_TERRA_KM = 6371.0088
+
+class ArvoresProximidade:
+    """BallTrees haversine por categoria da camada de pontos de interesse."""
+
+    def __init__(self, gdf):
+        gdf = gdf.to_crs(epsg=4326) if gdf.crs is not None else gdf
+        self.distancia = {}
+        for categoria in CATEGORIAS_DISTANCIA:
+            geometrias = gdf.geometry[gdf['categoria'] == categoria].values
+            if len(geometrias):
+                vertices = shapely.get_coordinates(shapely.segmentize(geometrias, PASSO_DENSIFICACAO_GRAUS))
+                self.distancia[categoria] = _arvore(vertices)
+        outros = gdf[~gdf['categoria'].isin(list(CATEGORIAS_DISTANCIA))]
+        centroides = shapely.get_coordinates(shapely.centroid(outros.geometry.values))
+        self.contagem = _arvore(centroides) if len(centroides) else None
+
+    def calcular(self, latitude, longitude) -> pd.DataFrame:
+        """Distâncias (km) e contagem no raio para todos os imóveis numa consulta por árvore."""
+        lat = np.asarray(latitude, dtype='float64')
+        lon = np.asarray(longitude, dtype='float64')
+        validos = ~(np.isnan(lat) | np.isnan(lon))
+        pontos = np.radians(np.column_stack([lat[validos], lon[validos]]))
+
+        resultado = pd.DataFrame(index=range(len(lat)))
+        for categoria, coluna in CATEGORIAS_DISTANCIA.items():
+            valores = np.full(len(lat), np.nan, dtype='float32')
+            arvore = self.distancia.get(categoria)
+            if arvore is not None and len(pontos):
+                distancia, _ = arvore.query(pontos, k=1)
+                valores[validos] = distancia[:, 0] * RAIO_TERRA_KM
+            resultado[coluna] = valores
+
+        contagem = np.zeros(len(lat), dtype='int32')
+        if self.contagem is not None and len(pontos):
+            contagem[validos] = self.contagem.query_radius(pontos, r=RAIO_CONTAGEM_KM / RAIO_TERRA_KM, count_only=True)
+        resultado[COLUNA_CONTAGEM] = pd.array(contagem, dtype='Int32')
+        resultado.loc[~validos, COLUNA_CONTAGEM] = pd.NA
+        return resultado
+
+def _arvore(coordenadas_lon_lat):
+    # BallTree haversine espera (latitude, longitude) em radianos
+    return BallTree(np.radians(coordenadas_lon_lat[:, ::-1]), metric='haversine')
+
+def carregar_arvores():
+    if not os.path.exists(POI_PATH):
+        logging.warning(f'{POI_PATH} não encontrado — variáveis de proximidade ficarão vazias')
+        return None
+    return carregar_indice('proximidade', [POI_PATH], lambda: ArvoresProximidade(gpd.read_file(POI_PATH)))
+
+def adicionar_proximidade(df, arvores):
+    if arvores is None:
+        for coluna in CATEGORIAS_DISTANCIA.values():
+            df[coluna] = pd.Series(np.nan, index=df.index, dtype='float32')
+        df[COLUNA_CONTAGEM] = pd.Series(pd.NA, index=df.index, dtype='Int32')
+        return df
+    proximidade = arvores.calcular(df['latitude'], df['longitude'])
+    proximidade.index = df.index
+    return pd.concat([df, proximidade], axis=1)
+
+def processar():
+    arvores = carregar_arvores()
+    origem = pq.ParquetFile(caminho_tabela('variaveis_enriquecidas'))
+    registros = 0
+    with escritor_tabela('variaveis_modelo') as escrever:
+        for lote in origem.iter_batches(batch_size=linhas_por_bloco()):
+            contar(linhas_entrada=lote.num_rows)
+            bloco = adicionar_proximidade(lote.to_pandas(), arvores)
+            escrever(bloco)
+            registros += len(bloco)
+
+    logging.info(f'Variáveis de proximidade calculadas — {registros} imóveis')
+    return caminho_tabela('variaveis_modelo')
+
+def run():
+    logging.info('Iniciando cálculo das variáveis de proximidade')
+    processar()
+
+if __name__ == '__main__':
+    configurar_logs()
+    run()
@@ -0,0 +1,186 @@
+import json
+import logging
+import os
+import shutil
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+from joblib import dump, load
+
+VERSOES_DIR = os.path.join('models', 'versoes')
+PONTEIRO_ATUAL = os.path.join(VERSOES_DIR, 'atual.json')
+MAX_VERSOES = 10
+
+# VALORIMOB_MODO_TREINO=completo força o retreino do zero a cada execução
+MODO = os.environ.get('VALORIMOB_MODO_TREINO', 'incremental')
+
+# PSI acima do limiar em alguma variável indica deriva: os dados novos não se parecem com os do modelo
+LIMIAR_PSI = float(os.environ.get('VALORIMOB_LIMIAR_PSI', 0.2))
+# Abaixo disto não vale a pena atualizar o modelo
+MIN_LINHAS_NOVAS = 200
+# Acima desta fração de linhas novas um retreino completo sai praticamente pelo mesmo custo
+MAX_FRACAO_NOVAS = 0.5
+MIN_ARVORES_NOVAS = 5
+BINS_PSI = 10
+
+
+@dataclass
+class Plano:
+    tipo: str  # 'completo', 'incremental' ou 'nenhum'
+    motivo: str
+    novas: np.ndarray = field(default=None, repr=False)  # máscara das linhas ainda não vistas pelo modelo
+    psi: dict = field(default_factory=dict)
+    versao_base: dict = None
+
+
+def hash_linhas(df) -> np.ndarray:
+    """Identificador de cada linha pelo conteúdo, para reconhecer as já usadas em treino."""
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def perfil(X: pd.DataFrame) -> dict:
+    """Faixas por quantis e proporção de linhas em cada uma, por variável (referência do PSI)."""
+    resultado = {}
+    for coluna in X.columns:
+        valores = X[coluna].to_numpy(dtype='float64')
+        limites = np.unique(np.quantile(valores, np.linspace(0, 1, BINS_PSI + 1)[1:-1]))
+        contagem = np.bincount(np.searchsorted(limites, valores, side='right'), minlength=len(limites) + 1)
+        resultado[coluna] = {'limites': limites.tolist(), 'proporcoes': (contagem / len(valores)).tolist()}
+    return resultado
+
+
+def psi(referencia: dict, X: pd.DataFrame) -> dict:
+    """Population Stability Index de cada variável de `X` contra o perfil de referência."""
+    resultado = {}
+    for coluna, ref in referencia.items():
+        limites = np.asarray(ref['limites'])
+        esperado = np.clip(np.asarray(ref['proporcoes']), 1e-4, None)
+        contagem = np.bincount(np.searchsorted(limites, X[coluna].to_numpy(dtype='float64'), side='right'),
+                               minlength=len(limites) + 1)
+        observado = np.clip(contagem / max(len(X), 1), 1e-4, None)
+        resultado[coluna] = float(np.sum((observado - esperado) * np.log(observado / esperado)))
+    return resultado
+
+
+def versao_atual():
+    """Manifesto da versão em uso, ou None se nenhum modelo foi versionado ainda."""
+    if not os.path.exists(PONTEIRO_ATUAL):
+        return None
+    with open(PONTEIRO_ATUAL, encoding='utf-8') as f:
+        versao = json.load(f)['versao']
+    with open(os.path.join(VERSOES_DIR, versao, 'manifesto.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def planejar(df, X) -> Plano:
+    """Decide entre não fazer nada, estender o modelo atual ou retreinar do zero."""
+    if MODO == 'completo':
+        return Plano('completo', 'VALORIMOB_MODO_TREINO=completo')
+    base = versao_atual()
+    if base is None:
+        return Plano('completo', 'nenhuma versão anterior')
+
+    vistas = np.load(os.path.join(VERSOES_DIR, base['versao'], 'linhas.npy'))
+    novas = ~np.isin(hash_linhas(df), vistas)
+    n_novas = int(novas.sum())
+    if n_novas < MIN_LINHAS_NOVAS:
+        return Plano('nenhum', f'{n_novas} linhas novas', novas, versao_base=base)
+    if n_novas > MAX_FRACAO_NOVAS * len(df):
+        return Plano('completo', f'{n_novas} de {len(df)} linhas são novas', novas, versao_base=base)
+
+    indices = psi(base['perfil'], X[novas])
+    pior = max(indices, key=indices.get)
+    if indices[pior] > LIMIAR_PSI:
+        return Plano('completo', f'deriva em {pior} (PSI {indices[pior]:.3f})', novas, indices, base)
+    return Plano('incremental', f'{n_novas} linhas novas, PSI máximo {indices[pior]:.3f}', novas, indices, base)
+
+
+def carregar_versao(manifesto):
+    return load(os.path.join(VERSOES_DIR, manifesto['versao'], 'modelo.joblib'))
+
+
+def estender(modelo, X_novo, y_novo, linhas_vistas):
+    """Acrescenta árvores treinadas só nas linhas novas, em proporção à parcela que elas representam."""
+    fracao = len(X_novo) / max(linhas_vistas, 1)
+    parametros = modelo.get_params()
+
+    if 'max_iter' in parametros:  # HistGradientBoosting: continua o boosting de onde parou
+        adicionais = max(MIN_ARVORES_NOVAS, round(modelo.n_iter_ * fracao))
+        modelo.set_params(warm_start=True, max_iter=modelo.n_iter_ + adicionais)
+        return modelo.fit(X_novo, y_novo)
+
+    if 'tree_method' in parametros:  # XGBoost: novas rodadas a partir do booster atual
+        booster = modelo.get_booster()
+        adicionais = max(MIN_ARVORES_NOVAS, round(booster.num_boosted_rounds() * fracao))
+        continuacao = type(modelo)(**{**parametros, 'n_estimators': adicionais, 'early_stopping_rounds': None})
+        return continuacao.fit(X_novo, y_novo, xgb_model=booster, verbose=False)
+
+    # RandomForest: warm_start mantém as árvores atuais e ajusta apenas as novas
+    adicionais = max(MIN_ARVORES_NOVAS, round(len(modelo.estimators_) * fracao))
+    modelo.set_params(warm_start=True, n_estimators=len(modelo.estimators_) + adicionais)
+    return modelo.fit(X_novo, y_novo)
+
+
+def gravar_versao(modelo, tipo, df, X, plano=None, metricas=None) -> dict:
+    """Grava o modelo como nova versão em VERSOES_DIR, sem torná-la a versão atual.
+
+    A versão só passa a valer em `ativar_versao`, depois que tudo o que
+    depende dela foi gravado. Versões incrementais herdam o perfil de
+    referência da versão completa que as originou, para que a deriva
+    acumulada também seja detectada.
+    """
+    versao = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+    diretorio = os.path.join(VERSOES_DIR, versao)
+    os.makedirs(diretorio)
+    dump(modelo, os.path.join(diretorio, 'modelo.joblib'))
+    np.save(os.path.join(diretorio, 'linhas.npy'), np.unique(hash_linhas(df)))
+
+    base = plano.versao_base if plano else None
+    manifesto = {
+        'versao': versao,
+        'tipo': tipo,
+        'base': base['versao'] if base and tipo == 'incremental' else None,
+        'motivo': plano.motivo if plano else None,
+        'motor': type(modelo).__name__,
+        'linhas': len(df),
+        'linhas_novas': int(plano.novas.sum()) if plano is not None and plano.novas is not None else len(df),
+        'psi': plano.psi if plano else {},
+        'metricas': metricas or {},
+        'perfil': base['perfil'] if base and tipo == 'incremental' else perfil(X),
+    }
+    _gravar_json(os.path.join(diretorio, 'manifesto.json'), manifesto)
+    logging.info(f'Modelo versão {versao} ({tipo}) gravado')
+    return manifesto
+
+
+def ativar_versao(manifesto, caminho_publicado):
+    """Publica uma cópia do modelo em `caminho_publicado` e aponta `atual.json` para a versão.
+
+    A troca do ponteiro é o último passo: se a execução cair antes dele, a
+    próxima continua da versão anterior e refaz o trabalho desta.
+    """
+    versao = manifesto['versao']
+    diretorio = os.path.join(VERSOES_DIR, versao)
+    tmp = caminho_publicado + '.tmp'
+    os.makedirs(os.path.dirname(caminho_publicado) or '.', exist_ok=True)
+    shutil.copyfile(os.path.join(diretorio, 'modelo.joblib'), tmp)
+    os.replace(tmp, caminho_publicado)
+    _gravar_json(PONTEIRO_ATUAL, {'versao': versao})
+    _limpar_versoes_antigas(versao)
+    logging.info(f'Modelo versão {versao} ativada e publicada em {caminho_publicado}')
+
+
+def _gravar_json(caminho, dados):
+    tmp = caminho + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(dados, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, caminho)
+
+
+def _limpar_versoes_antigas(atual):
+    # Versões gravadas por execuções interrompidas nunca foram ativadas e também saem com o tempo
+    versoes = sorted(v for v in os.listdir(VERSOES_DIR) if os.path.isdir(os.path.join(VERSOES_DIR, v)) and v != atual)
+    for versao in versoes[:-(MAX_VERSOES - 1)]:
+        shutil.rmtree(os.path.join(VERSOES_DIR, versao))
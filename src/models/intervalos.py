@@ -0,0 +1,62 @@
+import numpy as np
+
+# Nível dos intervalos de previsão (0.8 = entre os quantis 10% e 90%)
+NIVEL = 0.8
+
+# Quantis dos resíduos de validação guardados no modelo para intervalos de modelos de boosting
+GRADE_QUANTIS = np.linspace(0, 1, 201)
+
+
+def _valores_folhas(floresta):
+    """Valores de todos os nós de todas as árvores numa só matriz (árvores x nós), completada com zeros.
+
+    Fica guardada no próprio modelo e é refeita se o número de árvores
+    mudar (atualização incremental com warm_start).
+    """
+    cache = getattr(floresta, 'valores_folhas_', None)
+    if cache is not None and cache.shape[0] == len(floresta.estimators_):
+        return cache
+    arvores = [estimador.tree_ for estimador in floresta.estimators_]
+    valores = np.zeros((len(arvores), max(a.node_count for a in arvores)), dtype=np.float64)
+    for i, arvore in enumerate(arvores):
+        valores[i, :arvore.node_count] = arvore.value[:, 0, 0]
+    floresta.valores_folhas_ = valores
+    return valores
+
+
+def previsoes_por_arvore(floresta, X) -> np.ndarray:
+    """Matriz (linhas x árvores) com a previsão de cada árvore, sem laço sobre as árvores.
+
+    `apply` devolve de uma vez a folha alcançada em cada árvore; as previsões
+    saem de uma única indexação na matriz de valores das folhas.
+    """
+    folhas = floresta.apply(X)
+    valores = _valores_folhas(floresta)
+    return valores[np.arange(valores.shape[0]), folhas]
+
+
+def calibrar(modelo, X_val, y_val):
+    """Guarda no modelo os quantis dos resíduos numa validação que não entrou no ajuste."""
+    modelo.quantis_residuo_ = np.quantile(np.asarray(y_val) - modelo.predict(X_val), GRADE_QUANTIS)
+    return modelo
+
+
+def prever_com_intervalo(modelo, X, nivel=NIVEL):
+    """Retorna (previsto, inferior, superior).
+
+    Florestas usam os quantis das previsões das árvores; os demais modelos
+    somam à previsão os quantis dos resíduos guardados por `calibrar`.
+    Sem nenhum dos dois, os limites ficam iguais à previsão.
+    """
+    cauda = (1 - nivel) / 2
+    if hasattr(modelo, 'estimators_') and hasattr(modelo, 'apply'):
+        por_arvore = previsoes_por_arvore(modelo, X)
+        inferior, superior = np.quantile(por_arvore, [cauda, 1 - cauda], axis=1)
+        return por_arvore.mean(axis=1), inferior, superior
+
+    previsto = modelo.predict(X)
+    quantis = getattr(modelo, 'quantis_residuo_', None)
+    if quantis is None:
+        return previsto, previsto, previsto
+    baixo, alto = np.interp([cauda, 1 - cauda], GRADE_QUANTIS, quantis)
+    return previsto, previsto + baixo, previsto + alto
@@ -2,37 +2,46 @@ import os
 import logging
 import pandas as pd
 from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_squared_error, r2_score
-from joblib import dump
-import boto3
-from google.cloud import bigquery
+from src.models import atualizacao, backtest, intervalos, publicacao, treino
+from src.utils.destino_s3 import enviar_em_segundo_plano
+from src.utils.logs import configurar_logs
+from src.utils.tabelas import caminho_tabela, ler_tabela, salvar_tabela
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s — %(levelname)s — %(message)s')
-
-PROCESSED_DIR = os.path.join('data', 'processed')
 MODEL_DIR = os.path.join('models')
+MODEL_PATH = os.path.join(MODEL_DIR, 'modelo_valorizacao.joblib')
 AWS_S3_BUCKET = 'seu-bucket-aqui'
 AWS_S3_PREFIX = 'valorimob/modelos/'
-BQ_PROJECT = 'seu-projeto-gcp'
-BQ_DATASET = 'valorimob'
-BQ_TABLE = 'predicoes_valorizacao'
+
+# Variáveis explicativas do modelo; distâncias ausentes (sem coordenadas) viram -1
+VARIAVEIS_MODELO = [
+    'area_m2', 'preco_por_m2', 'eh_novo',
+    'dist_porto_km', 'dist_praia_km', 'dist_pr407_km', 'qtde_poi_1km',
+]
+PREENCHIMENTO = {'dist_porto_km': -1, 'dist_praia_km': -1, 'dist_pr407_km': -1}
+
+# Colunas de variaveis_modelo usadas no treino, no backtesting e no ranking
+COLUNAS_ENTRADA = ['municipio', 'ano', 'bairro', 'preco'] + VARIAVEIS_MODELO
 
 def carregar_dados():
-    path = os.path.join(PROCESSED_DIR, 'variaveis_paranagua.csv')
-    df = pd.read_csv(path)
+    df = ler_tabela('variaveis_modelo', colunas=COLUNAS_ENTRADA)
     logging.info(f'Dados carregados: {df.shape[0]} registros')
     return df
 
-def treinar_modelo(df):
+def matriz_variaveis(df):
+    return df[VARIAVEIS_MODELO].fillna(PREENCHIMENTO).fillna(0).astype('float32')
+
+def preparar_variaveis(df):
     df = df.dropna(subset=['preco', 'area_m2', 'preco_por_m2'])
-    X = df[['area_m2', 'preco_por_m2', 'eh_novo']].fillna(0)
-    y = df['preco']
+    return df, matriz_variaveis(df), df['preco']
+
+def treinar_modelo(df):
+    df, X, y = preparar_variaveis(df)
 
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
 
-    modelo = RandomForestRegressor(n_estimators=100, random_state=42)
-    modelo.fit(X_train, y_train)
+    modelo, resultados = treino.treinar(X_train, y_train)
+    salvar_tabela(resultados, 'resultados_treino')
 
     y_pred = modelo.predict(X_test)
     mse = mean_squared_error(y_test, y_pred)
@@ -42,52 +51,117 @@ def treinar_modelo(df):
 
     return modelo, X_test, y_test, y_pred
 
-def salvar_modelo(modelo):
-    os.makedirs(MODEL_DIR, exist_ok=True)
-    model_path = os.path.join(MODEL_DIR, 'modelo_valorizacao.joblib')
-    dump(modelo, model_path)
-    logging.info(f'Modelo salvo: {model_path}')
-    return model_path
-
-def upload_s3(path, bucket=AWS_S3_BUCKET, prefix=AWS_S3_PREFIX):
-    s3 = boto3.client('s3')
-    key = prefix + os.path.basename(path)
-    s3.upload_file(path, bucket, key)
-    logging.info(f'Upload para S3: s3://{bucket}/{key}')
-
-def upload_bigquery(df_pred, project=BQ_PROJECT, dataset=BQ_DATASET, table=BQ_TABLE):
-    client = bigquery.Client(project=project)
-    table_ref = client.dataset(dataset).table(table)
-
-    job_config = bigquery.LoadJobConfig(
-        source_format=bigquery.SourceFormat.CSV,
-        autodetect=True,
-        skip_leading_rows=1,
-        write_disposition='WRITE_TRUNCATE'
-    )
+def atualizar_modelo(plano, df):
+    """Estende a versão atual com as linhas novas, avaliando numa parte delas que fica fora do ajuste.
 
-    tmp_csv = os.path.join(PROCESSED_DIR, 'predicoes_valorizacao.csv')
-    df_pred.to_csv(tmp_csv, index=False)
+    Outra parte das linhas novas, também fora do ajuste, recalibra os
+    resíduos dos intervalos: os quantis da versão anterior não valem para
+    o modelo estendido (e a continuação do XGBoost nem os herda).
+    """
+    df, X, y = preparar_variaveis(df)
+    novas = plano.novas
+    X_train, X_test, y_train, y_test = train_test_split(X[novas], y[novas], test_size=0.2, random_state=42)
+    X_train, X_cal, y_train, y_cal = train_test_split(X_train, y_train, test_size=0.25, random_state=42)
 
-    with open(tmp_csv, "rb") as f:
-        job = client.load_table_from_file(f, table_ref, job_config=job_config)
-    job.result()
+    modelo = atualizacao.carregar_versao(plano.versao_base)
+    modelo = atualizacao.estender(modelo, X_train, y_train, linhas_vistas=plano.versao_base['linhas'])
+    intervalos.calibrar(modelo, X_cal, y_cal)
 
-    logging.info(f'Previsões enviadas para BigQuery: {project}.{dataset}.{table}')
+    y_pred = modelo.predict(X_test)
+    mse = mean_squared_error(y_test, y_pred)
+    r2 = r2_score(y_test, y_pred)
+    logging.info(f'Métricas nas linhas novas — MSE: {mse:.2f} | R²: {r2:.2f}')
+
+    return modelo, X_test, y_test, y_pred
+
+def rodar_backtest(modelo, df):
+    """Backtesting por ano e por município com a configuração escolhida; grava metricas_backtest."""
+    df, X, y = preparar_variaveis(df)
+    metricas = backtest.executar_backtest(
+        modelo, X, y,
+        anos=df['ano'].fillna(-1).to_numpy(dtype='int64'),
+        municipios=df['municipio'].astype('string').fillna('').to_numpy(dtype=object),
+    )
+    if not metricas.empty:
+        salvar_tabela(metricas, 'metricas_backtest')
+    return metricas
+
+def salvar_modelo(modelo, df, plano, metricas=None):
+    """Versiona o modelo em models/versoes; a versão só vale depois de `publicar_modelo`."""
+    df, X, _ = preparar_variaveis(df)
+    return atualizacao.gravar_versao(modelo, plano.tipo, df[COLUNAS_ENTRADA], X, plano, metricas)
+
+def publicar_modelo(manifesto):
+    """Torna a versão a atual, publica-a em MODEL_PATH e a envia ao S3."""
+    atualizacao.ativar_versao(manifesto, MODEL_PATH)
+    logging.info(f'Modelo salvo: {MODEL_PATH}')
+    versao = manifesto['versao']
+    enviar_em_segundo_plano(MODEL_PATH, AWS_S3_BUCKET, AWS_S3_PREFIX + os.path.basename(MODEL_PATH))
+    enviar_em_segundo_plano(MODEL_PATH, AWS_S3_BUCKET, f'{AWS_S3_PREFIX}versoes/{versao}/{os.path.basename(MODEL_PATH)}')
+
+def prever_linhas(modelo, df_pred):
+    """Preenche a previsão e o intervalo do modelo nas linhas de uma tabela de previsões."""
+    previsto, inferior, superior = intervalos.prever_com_intervalo(modelo, matriz_variaveis(df_pred))
+    df_pred['preco_previsto'] = previsto
+    df_pred['preco_previsto_inferior'] = inferior
+    df_pred['preco_previsto_superior'] = superior
+    return df_pred
+
+def mesclar_predicoes(novas):
+    """Acrescenta as previsões das linhas novas às da tabela atual.
+
+    Na atualização incremental só as linhas novas têm parte separada para
+    validação; as das versões anteriores continuam na tabela (e no ranking,
+    no cubo e no mapa) com as previsões da versão que as validou. As novas
+    também vão para `predicoes_valorizacao_delta`, que o cubo soma às suas
+    células.
+    """
+    salvar_tabela(novas, 'predicoes_valorizacao_delta')
+    if not os.path.exists(caminho_tabela('predicoes_valorizacao')):
+        logging.warning('Sem previsões anteriores: a tabela terá só as linhas novas')
+        return novas
+    anteriores = ler_tabela('predicoes_valorizacao')
+    # Uma execução interrompida antes de ativar a versão pode já ter acrescentado estas linhas
+    chave = ['municipio', 'ano', 'bairro', 'preco_real'] + VARIAVEIS_MODELO
+    repetidas = anteriores[chave].merge(novas[chave].drop_duplicates(), how='left', indicator=True)['_merge'] == 'both'
+    if repetidas.any():
+        logging.warning(f'{int(repetidas.sum())} previsões de uma execução interrompida substituídas')
+    return pd.concat([anteriores[~repetidas.to_numpy()], novas], ignore_index=True)
 
 def run():
     logging.info('Treinamento do modelo de valorização iniciado')
     df = carregar_dados()
-    modelo, X_test, y_test, y_pred = treinar_modelo(df)
-    model_path = salvar_modelo(modelo)
-    upload_s3(model_path)
+    df_validos, X, _ = preparar_variaveis(df)
+    plano = atualizacao.planejar(df_validos[COLUNAS_ENTRADA], X)
+    logging.info(f'Modo de treino: {plano.tipo} ({plano.motivo})')
+    if plano.tipo == 'nenhum':
+        logging.info('Modelo atual mantido; nada a atualizar')
+        return
+
+    if plano.tipo == 'incremental':
+        modelo, X_test, y_test, y_pred = atualizar_modelo(plano, df)
+    else:
+        modelo, X_test, y_test, y_pred = treinar_modelo(df)
+        if backtest.ATIVO:
+            rodar_backtest(modelo, df)
+    metricas = {'mse': float(mean_squared_error(y_test, y_pred)), 'r2': float(r2_score(y_test, y_pred))}
+    manifesto = salvar_modelo(modelo, df, plano, metricas)
 
     df_pred = X_test.copy()
+    df_pred['bairro'] = df.loc[X_test.index, 'bairro'].values
+    df_pred['municipio'] = df.loc[X_test.index, 'municipio'].values
+    df_pred['ano'] = df.loc[X_test.index, 'ano'].values
     df_pred['preco_real'] = y_test.values
-    df_pred['preco_previsto'] = y_pred
-    upload_bigquery(df_pred)
+    df_pred = prever_linhas(modelo, df_pred)
+    if plano.tipo == 'incremental':
+        df_pred = mesclar_predicoes(df_pred)
+    salvar_tabela(df_pred, 'predicoes_valorizacao')
 
-    logging.info('Modelo treinado e resultados enviados com sucesso')
+    # Por último: com as previsões gravadas, a versão passa a valer para as próximas execuções e o cubo
+    publicar_modelo(manifesto)
+    logging.info('Modelo treinado e previsões gravadas com sucesso')
 
 if __name__ == '__main__':
+    configurar_logs()
     run()
+    publicacao.publicar()
@@ -0,0 +1,174 @@
+import argparse
+import json
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+from joblib import load
+from src.features.enriquecer_espacial import carregar_indices, enriquecer_bloco
+from src.features.gerar_variaveis import calcular_variaveis, ler_csv_em_blocos
+from src.features.proximidade import adicionar_proximidade, carregar_arvores
+from src.models.modelo_valorizacao import MODEL_PATH, matriz_variaveis
+from src.utils.logs import configurar_logs
+from src.utils.tabelas import caminho_tabela, escritor_tabela
+
+# Linhas máximas de um micro-lote do modo HTTP
+MAX_LINHAS_LOTE = 4096
+PORTA_PADRAO = 8000
+
+
+class Pontuador:
+    """Modelo e índices espaciais carregados uma vez, aplicando as mesmas transformações do pipeline."""
+
+    def __init__(self, caminho_modelo=MODEL_PATH):
+        # O joblib grava o modelo sem compressão, então os arrays das árvores são mapeados do disco
+        self.modelo = load(caminho_modelo, mmap_mode='r')
+        self.bairros, self.regularizacao = carregar_indices()
+        self.arvores = carregar_arvores()
+        logging.info(f'Modelo carregado de {caminho_modelo}: {type(self.modelo).__name__}')
+
+    def variaveis(self, bruto, municipio):
+        df = calcular_variaveis(bruto, municipio)
+        df = enriquecer_bloco(df, self.bairros, self.regularizacao)
+        return adicionar_proximidade(df, self.arvores)
+
+    def prever(self, X):
+        return self.modelo.predict(X)
+
+    def pontuar(self, bruto, municipio):
+        df = self.variaveis(bruto, municipio)
+        df['preco_previsto'] = self.prever(matriz_variaveis(df))
+        return df
+
+
+def pontuar_arquivo(caminho_csv, municipio, diretorio_saida, tamanho_bloco=None, pontuador=None):
+    """Pontua um CSV de imóveis bloco a bloco, gravando cada bloco assim que é previsto.
+
+    A memória fica limitada ao tamanho do bloco, qualquer que seja o tamanho do arquivo.
+    """
+    pontuador = pontuador or Pontuador()
+    registros = 0
+    with escritor_tabela('imoveis_pontuados', diretorio_saida) as escrever:
+        for bloco in ler_csv_em_blocos(caminho_csv, tamanho_bloco):
+            escrever(pontuador.pontuar(bloco, municipio))
+            registros += len(bloco)
+    logging.info(f'{registros} imóveis de {caminho_csv} pontuados')
+    return caminho_tabela('imoveis_pontuados', diretorio_saida)
+
+
+class PrevisorEmLotes:
+    """Agrupa as previsões de requisições concorrentes numa só chamada ao modelo.
+
+    Cada requisição prepara suas variáveis na própria thread e entrega a
+    matriz a uma fila; uma thread única junta tudo o que já está na fila e
+    chama `predict` uma vez para o lote. Sem espera artificial: uma
+    requisição sozinha é prevista na hora, e sob carga as que chegam
+    durante uma previsão formam o lote seguinte.
+    """
+
+    def __init__(self, pontuador):
+        self.pontuador = pontuador
+        self.fila = queue.Queue()
+        threading.Thread(target=self._laco, name='previsor-lotes', daemon=True).start()
+
+    def prever(self, X) -> np.ndarray:
+        futuro = Future()
+        self.fila.put((X, futuro))
+        return futuro.result()
+
+    def _laco(self):
+        while True:
+            pendentes = [self.fila.get()]
+            linhas = len(pendentes[0][0])
+            while linhas < MAX_LINHAS_LOTE:
+                try:
+                    pendentes.append(self.fila.get_nowait())
+                except queue.Empty:
+                    break
+                linhas += len(pendentes[-1][0])
+            try:
+                previsto = self.pontuador.prever(pd.concat([X for X, _ in pendentes], ignore_index=True))
+            except Exception as e:
+                for _, futuro in pendentes:
+                    futuro.set_exception(e)
+                continue
+            inicio = 0
+            for X, futuro in pendentes:
+                futuro.set_result(previsto[inicio:inicio + len(X)])
+                inicio += len(X)
+
+
+def criar_servidor(porta=PORTA_PADRAO, pontuador=None):
+    """Servidor HTTP local: POST /prever com {"municipio": ..., "imoveis": [{...}, ...]}."""
+    pontuador = pontuador or Pontuador()
+    # Lotes pequenos: o paralelismo interno do modelo custa mais do que rende
+    if 'n_jobs' in pontuador.modelo.get_params():
+        pontuador.modelo.set_params(n_jobs=1)
+    previsor = PrevisorEmLotes(pontuador)
+
+    class Manipulador(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Conexões persistentes: sem o Nagle cada resposta sai na hora, sem esperar o ACK atrasado do cliente
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            if self.path != '/prever':
+                return self._responder(404, {'erro': 'rota desconhecida'})
+            try:
+                corpo = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                bruto = pd.DataFrame.from_records(corpo['imoveis'])
+                df = pontuador.variaveis(bruto, corpo.get('municipio', 'paranagua'))
+                previsto = previsor.prever(matriz_variaveis(df))
+            except (KeyError, ValueError, TypeError) as e:
+                return self._responder(400, {'erro': str(e)})
+            except Exception as e:
+                # Falha do modelo ou do lote: o cliente recebe a resposta em vez de ter a conexão derrubada
+                logging.exception(f'Erro ao prever em /prever: {e}')
+                return self._responder(500, {'erro': f'{type(e).__name__}: {e}'})
+            self._responder(200, {'preco_previsto': previsto.tolist(), 'bairro': df['bairro'].astype(str).tolist()})
+
+        def _responder(self, status, dados):
+            corpo = json.dumps(dados).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, formato, *args):
+            logging.debug(formato % args)
+
+    return ThreadingHTTPServer(('127.0.0.1', porta), Manipulador)
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(description='Pontuação de imóveis com o modelo de valorização')
+    parser.add_argument('arquivos', nargs='*', help='CSVs de imóveis a pontuar')
+    parser.add_argument('--municipio', default='paranagua', help='Município dos imóveis dos CSVs')
+    parser.add_argument('--saida', default=os.path.join('data', 'scored'), help='Diretório do Parquet pontuado')
+    parser.add_argument('--bloco', type=int, help='Linhas por bloco (padrão: pelo orçamento de memória)')
+    parser.add_argument('--servir', action='store_true', help='Sobe o servidor HTTP de previsões')
+    parser.add_argument('--porta', type=int, default=PORTA_PADRAO)
+    return parser
+
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    pontuador = Pontuador()
+    for caminho in args.arquivos:
+        saida = os.path.join(args.saida, os.path.splitext(os.path.basename(caminho))[0])
+        pontuar_arquivo(caminho, args.municipio, saida, args.bloco, pontuador)
+    if args.servir:
+        servidor = criar_servidor(args.porta, pontuador)
+        logging.info(f'Servindo previsões em http://127.0.0.1:{args.porta}/prever')
+        servidor.serve_forever()
+
+
+if __name__ == '__main__':
+    configurar_logs()
+    main()
@@ -0,0 +1,21 @@
+import logging
+from src.utils.logs import configurar_logs
+from src.utils.tabelas import caminho_tabela
+from src.utils.warehouse import obter_warehouse
+
+# Só tabelas e warehouse: a etapa de carga não importa o sklearn nem o código de treino
+BQ_PROJECT = 'seu-projeto-gcp'
+BQ_DATASET = 'valorimob'
+BQ_TABLE = 'predicoes_valorizacao'
+
+def upload_bigquery(path, project=BQ_PROJECT, dataset=BQ_DATASET, table=BQ_TABLE):
+    obter_warehouse(project).carregar(path, f'{dataset}.{table}')
+    logging.info(f'Previsões enviadas para o warehouse: {dataset}.{table}')
+
+def publicar():
+    """Carrega no warehouse as previsões gravadas pelo treino (etapa própria do pipeline)."""
+    upload_bigquery(caminho_tabela('predicoes_valorizacao'))
+
+if __name__ == '__main__':
+    configurar_logs()
+    publicar()
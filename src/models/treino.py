@@ -0,0 +1,219 @@
+import json
+import logging
+import os
+import pickle
+import time
+from itertools import count
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed, effective_n_jobs
+from scipy.stats import loguniform, randint, uniform
+from sklearn.base import clone
+from sklearn.ensemble import HistGradientBoostingRegressor, RandomForestRegressor
+from sklearn.metrics import mean_squared_error
+from sklearn.model_selection import KFold, ParameterSampler, train_test_split
+from src.models import intervalos
+
+# Motores avaliados, em ordem (do mais rápido ao mais lento); VALORIMOB_MOTORES=hgb,xgb restringe a lista
+MOTORES_PADRAO = ['hgb', 'xgb', 'rf']
+MOTORES = [m for m in os.environ.get('VALORIMOB_MOTORES', ','.join(MOTORES_PADRAO)).split(',') if m]
+
+# Tempo total (s) para a busca; motores que não cabem no que sobra do orçamento não são avaliados
+ORCAMENTO_SEGUNDOS = float(os.environ.get('VALORIMOB_ORCAMENTO_TREINO_S', 900))
+
+# Busca por halving: N_CANDIDATOS configurações, 1/FATOR_HALVING sobrevive a cada rodada com FATOR_HALVING vezes mais linhas,
+# começando com MIN_AMOSTRAS linhas
+N_CANDIDATOS = 24
+FATOR_HALVING = 3
+DOBRAS_CV = 3
+MIN_AMOSTRAS = 2_000
+
+# Rodadas sem melhora na validação que encerram o boosting
+PARADA_ANTECIPADA = 30
+FRACAO_VALIDACAO = 0.1
+
+SEMENTE = 42
+
+
+def _rf():
+    return RandomForestRegressor(n_jobs=1, random_state=SEMENTE), {
+        'n_estimators': randint(100, 400),
+        'max_depth': [None, 12, 20, 30],
+        'min_samples_leaf': randint(1, 10),
+        'max_features': [0.33, 0.5, 1.0],
+    }
+
+
+def _hgb():
+    return HistGradientBoostingRegressor(
+        max_iter=1000, early_stopping=True, validation_fraction=FRACAO_VALIDACAO,
+        n_iter_no_change=PARADA_ANTECIPADA, random_state=SEMENTE,
+    ), {
+        'learning_rate': loguniform(0.02, 0.3),
+        'max_leaf_nodes': randint(15, 127),
+        'min_samples_leaf': randint(10, 100),
+        'l2_regularization': loguniform(1e-4, 10),
+    }
+
+
+def _xgb():
+    from xgboost import XGBRegressor
+    return XGBRegressor(
+        tree_method='hist', n_estimators=400, n_jobs=1, random_state=SEMENTE,
+    ), {
+        'learning_rate': loguniform(0.02, 0.3),
+        'max_depth': randint(3, 10),
+        'min_child_weight': loguniform(1, 20),
+        'subsample': uniform(0.6, 0.4),
+        'colsample_bytree': uniform(0.6, 0.4),
+    }
+
+
+FABRICAS = {'rf': _rf, 'hgb': _hgb, 'xgb': _xgb}
+
+
+def _rmse(y, y_pred):
+    return float(np.sqrt(mean_squared_error(y, y_pred)))
+
+
+def _refit_final(motor, estimador, X, y):
+    """Reajusta a melhor configuração em todas as linhas; o XGBoost usa parada antecipada numa validação."""
+    # Na busca cada ajuste usa um núcleo; o ajuste final sozinho pode usar todos
+    if 'n_jobs' in estimador.get_params():
+        estimador.set_params(n_jobs=-1)
+    if motor != 'xgb':
+        return estimador.fit(X, y)
+    X_tr, X_val, y_tr, y_val = train_test_split(X, y, test_size=FRACAO_VALIDACAO, random_state=SEMENTE)
+    estimador.set_params(n_estimators=2000, early_stopping_rounds=PARADA_ANTECIPADA)
+    estimador.fit(X_tr, y_tr, eval_set=[(X_val, y_val)], verbose=False)
+    return estimador
+
+
+def _avaliar(estimador, X, y, treino, teste):
+    inicio = time.perf_counter()
+    estimador.fit(X.iloc[treino], y.iloc[treino])
+    tempo = time.perf_counter() - inicio
+    return tempo, _rmse(y.iloc[teste], estimador.predict(X.iloc[teste]))
+
+
+def _avaliar_rodada(paralelo, lote, estimador, candidatos, X, y, dobras, prazo):
+    """Ajusta as configurações em todas as dobras, em lotes de `lote` ajustes, até o `prazo` passar.
+
+    Os ajustes seguem a ordem de `candidatos`, dobra a dobra, e a rodada
+    só para depois que ao menos uma configuração passou por todas as dobras.
+    Retorna os tempos e erros médios das configurações completas, na ordem de `candidatos`.
+    """
+    tarefas = [(params, treino, teste) for params in candidatos for treino, teste in dobras]
+    avaliacoes = []
+    for inicio in range(0, len(tarefas), lote):
+        avaliacoes += paralelo(
+            delayed(_avaliar)(clone(estimador).set_params(**params), X, y, treino, teste)
+            for params, treino, teste in tarefas[inicio:inicio + lote]
+        )
+        if len(avaliacoes) >= len(dobras) and time.perf_counter() >= prazo:
+            break
+    completas = len(avaliacoes) // len(dobras)
+    medias = np.array(avaliacoes[:completas * len(dobras)]).reshape(completas, len(dobras), 2).mean(axis=1)
+    return medias[:, 0], medias[:, 1]
+
+
+def buscar_motor(motor, X, y, prazo, n_jobs=-1):
+    """Busca por halving as configurações de um motor, em paralelo em todos os núcleos.
+
+    Cada rodada treina as configurações vivas e suas dobras no pool, um lote
+    de ajustes por núcleo de cada vez; só a melhor fração segue, com
+    FATOR_HALVING vezes mais linhas. O `prazo` (perf_counter) é verificado
+    a cada lote: quando passa, a busca fica com as configurações já
+    avaliadas na rodada. Retorna o melhor estimador reajustado e uma linha
+    por configuração avaliada.
+    """
+    estimador, distribuicoes = FABRICAS[motor]()
+    candidatos = list(ParameterSampler(distribuicoes, N_CANDIDATOS, random_state=SEMENTE))
+    ordem = np.random.default_rng(SEMENTE).permutation(len(X))
+    n_amostras = min(MIN_AMOSTRAS, len(X))
+    rodadas = []
+    lote = effective_n_jobs(n_jobs)
+
+    with Parallel(n_jobs=n_jobs) as paralelo:
+        for rodada in count():
+            X_r, y_r = X.iloc[ordem[:n_amostras]], y.iloc[ordem[:n_amostras]]
+            dobras = list(KFold(DOBRAS_CV, shuffle=True, random_state=SEMENTE).split(X_r))
+            tempos, erros = _avaliar_rodada(paralelo, lote, estimador, candidatos, X_r, y_r, dobras, prazo)
+            # Configurações que o prazo deixou sem avaliação nesta rodada saem da busca
+            candidatos = candidatos[:len(erros)]
+            rodadas.append(pd.DataFrame({
+                'motor': motor,
+                'rodada': rodada,
+                'n_amostras': n_amostras,
+                'parametros': [json.dumps(p, default=str) for p in candidatos],
+                'tempo_treino_s': tempos,
+                'rmse_cv': erros,
+            }))
+
+            ranking = np.argsort(erros)
+            candidatos = [candidatos[i] for i in ranking]
+            if len(candidatos) == 1 or n_amostras == len(X) or time.perf_counter() >= prazo:
+                break
+            candidatos = candidatos[:int(np.ceil(len(candidatos) / FATOR_HALVING))]
+            n_amostras = min(n_amostras * FATOR_HALVING, len(X))
+
+    resultados = pd.concat(rodadas, ignore_index=True)
+    melhores = candidatos[0]
+    inicio = time.perf_counter()
+    melhor = _refit_final(motor, clone(estimador).set_params(**melhores), X, y)
+    finalista = (resultados['rodada'] == rodada) & (resultados['parametros'] == json.dumps(melhores, default=str))
+    resultados.loc[finalista, 'tempo_refit_s'] = time.perf_counter() - inicio
+    return melhor, resultados
+
+
+def treinar(X, y, motores=None, orcamento_segundos=ORCAMENTO_SEGUNDOS, n_jobs=-1):
+    """Avalia os motores dentro do orçamento de tempo e retorna (melhor_modelo, resultados).
+
+    O orçamento é verificado a cada lote de ajustes do halving, então pode
+    ser excedido em no máximo um lote e o reajuste final de cada motor.
+    O desempate entre motores é feito numa validação separada das linhas
+    usadas na busca. `resultados` traz uma linha por configuração avaliada,
+    com o tamanho serializado e o erro de validação do finalista de cada motor.
+    """
+    X_busca, X_val, y_busca, y_val = train_test_split(X, y, test_size=FRACAO_VALIDACAO, random_state=SEMENTE)
+    inicio = time.perf_counter()
+    melhor, melhor_rmse, tabelas = None, np.inf, []
+
+    motores = motores or MOTORES
+    desconhecidos = [motor for motor in motores if motor not in FABRICAS]
+    if desconhecidos:
+        raise ValueError(f'Motores de treino desconhecidos em VALORIMOB_MOTORES: {desconhecidos} '
+                         f'(disponíveis: {",".join(MOTORES_PADRAO)})')
+    for posicao, motor in enumerate(motores):
+        decorrido = time.perf_counter() - inicio
+        if decorrido >= orcamento_segundos:
+            logging.warning(f'Orçamento de treino esgotado ({decorrido:.0f}s) — motor {motor} não avaliado')
+            continue
+        # Cada motor recebe uma parte igual do que resta do orçamento
+        prazo = time.perf_counter() + (orcamento_segundos - decorrido) / (len(motores) - posicao)
+        try:
+            modelo, resultados = buscar_motor(motor, X_busca, y_busca, prazo, n_jobs=n_jobs)
+        except ImportError as e:
+            logging.warning(f'Motor {motor} indisponível: {e}')
+            continue
+
+        rmse = _rmse(y_val, modelo.predict(X_val))
+        finalista = resultados['tempo_refit_s'].notna()
+        resultados.loc[finalista, 'rmse_validacao'] = rmse
+        resultados.loc[finalista, 'tamanho_modelo_bytes'] = len(pickle.dumps(modelo))
+        tabelas.append(resultados)
+        logging.info(
+            f'Motor {motor}: {len(resultados)} configurações em {time.perf_counter() - inicio - decorrido:.1f}s, '
+            f'RMSE validação {rmse:.2f}')
+        if rmse < melhor_rmse:
+            melhor, melhor_rmse = modelo, rmse
+
+    if melhor is None:
+        raise RuntimeError('Nenhum motor de treino pôde ser avaliado')
+    intervalos.calibrar(melhor, X_val, y_val)
+    resultados = pd.concat(tabelas, ignore_index=True)
+    resultados['escolhido'] = (resultados['rmse_validacao'] == melhor_rmse).astype('int8')
+    resultados['rodada'] = resultados['rodada'].astype('int16')
+    logging.info(f'Modelo escolhido: {type(melhor).__name__} (RMSE validação {melhor_rmse:.2f})')
+    return melhor, resultados
@@ -0,0 +1,301 @@
+import importlib
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+
+from src.utils.checkpoints import Checkpoints
+from src.utils.instrumentacao import gravar_execucao, no_contexto_atual, trecho
+
+PROCESSED_DIR = os.path.join('data', 'processed')
+MAX_ETAPAS_SIMULTANEAS = 4
+
+# Parâmetros de ambiente que mudam o resultado das etapas; entram na impressão digital do checkpoint
+PARAMETROS_WAREHOUSE = ('VALORIMOB_WAREHOUSE', 'VALORIMOB_DUCKDB_PATH')
+PARAMETROS_TREINO = ('VALORIMOB_MOTORES', 'VALORIMOB_ORCAMENTO_TREINO_S', 'VALORIMOB_MODO_TREINO',
+                     'VALORIMOB_LIMIAR_PSI', 'VALORIMOB_BACKTEST')
+# Etapas que leem fontes externas não têm entradas locais: o checkpoint delas vence no prazo do cache da fonte
+UM_DIA = 24 * 3600
+
+
+@dataclass(frozen=True)
+class Etapa:
+    """Etapa do pipeline: função de entrada (`modulo:funcao`) e artefatos que lê e produz.
+
+    As dependências entre etapas são deduzidas dos artefatos: uma etapa
+    depende de todas as que produzem alguma de suas entradas. `parametros`
+    são as variáveis de ambiente que alteram o resultado e `validade_s` o
+    prazo do checkpoint de etapas que dependem de fontes externas.
+    """
+    nome: str
+    funcao: str
+    entradas: tuple = ()
+    saidas: tuple = ()
+    parametros: tuple = ()
+    validade_s: float = None
+
+    @property
+    def modulo(self):
+        return self.funcao.split(':')[0]
+
+    def executar(self):
+        # O módulo só é importado aqui: listar, verificar ou rodar outra etapa não carrega suas dependências
+        modulo, funcao = self.funcao.split(':')
+        with trecho('etapa', etapa=self.nome):
+            with trecho('importacao'):
+                funcao = getattr(importlib.import_module(modulo), funcao)
+            return funcao()
+
+
+def _processado(nome):
+    return os.path.join(PROCESSED_DIR, nome)
+
+
+# Estado mutável lido pelas etapas: declarado como saída de quem o grava e entrada de quem o lê, para que
+# apagá-lo ou restaurar uma versão anterior invalide o checkpoint
+WATERMARKS_SIDRA = os.path.join('data', 'state', 'watermarks_sidra.json')
+VERSAO_MODELO = os.path.join('models', 'versoes', 'atual.json')
+ESTADO_CUBO = os.path.join('data', 'state', 'cubo_valorizacao.json')
+
+
+ETAPAS = [
+    Etapa(
+        'etl_regularizacao', 'src.etl.etl_locais_paranagua:run_etl',
+        saidas=(_processado('regularizacao_paranagua.parquet'), _processado('regularizacao_pontal.parquet')),
+        parametros=PARAMETROS_WAREHOUSE, validade_s=7 * UM_DIA,
+    ),
+    Etapa(
+        'etl_malhas_ibge', 'src.etl.etl_locais_pontal:run_etl',
+        saidas=(_processado('ibge_municipios'),),
+        parametros=PARAMETROS_WAREHOUSE, validade_s=30 * UM_DIA,
+    ),
+    Etapa(
+        'etl_historico', 'src.etl.etl_dados_historicos:rodar_etl',
+        saidas=(_processado('dados_historicos_ibge.parquet'), WATERMARKS_SIDRA),
+        parametros=PARAMETROS_WAREHOUSE, validade_s=UM_DIA,
+    ),
+    Etapa(
+        'etl_bairros', 'src.etl.etl_geospatial:main',
+        saidas=(_processado('bairros_paranagua.gpkg'),),
+        validade_s=30 * UM_DIA,
+    ),
+    Etapa(
+        'variaveis', 'src.features.gerar_variaveis:run',
+        entradas=(_processado('imoveis_pontal.csv'), _processado('imoveis_paranagua.csv')),
+        saidas=(_processado('variaveis_paranagua.parquet'),),
+        parametros=PARAMETROS_WAREHOUSE,
+    ),
+    Etapa(
+        'enriquecimento_espacial', 'src.features.enriquecer_espacial:run',
+        entradas=(
+            _processado('variaveis_paranagua.parquet'), _processado('bairros_paranagua.gpkg'),
+            _processado('regularizacao_paranagua.parquet'), _processado('regularizacao_pontal.parquet'),
+        ),
+        saidas=(_processado('variaveis_enriquecidas.parquet'),),
+    ),
+    Etapa(
+        'proximidade', 'src.features.proximidade:run',
+        entradas=(_processado('variaveis_enriquecidas.parquet'), os.path.join('data', 'raw', 'pontos_interesse.gpkg')),
+        saidas=(_processado('variaveis_modelo.parquet'),),
+    ),
+    Etapa(
+        'modelo', 'src.models.modelo_valorizacao:run',
+        entradas=(_processado('variaveis_modelo.parquet'),),
+        saidas=(
+            os.path.join('models', 'modelo_valorizacao.joblib'), VERSAO_MODELO,
+            _processado('predicoes_valorizacao.parquet'), _processado('predicoes_valorizacao_delta.parquet'),
+        ),
+        parametros=PARAMETROS_TREINO,
+    ),
+    # Carga separada do treino: se o warehouse falhar, a nova tentativa não treina o modelo de novo
+    Etapa(
+        'publicar_predicoes', 'src.models.publicacao:publicar',
+        entradas=(_processado('predicoes_valorizacao.parquet'),),
+        parametros=PARAMETROS_WAREHOUSE,
+    ),
+    Etapa(
+        'cubo', 'src.reports.cubo:run',
+        entradas=(
+            _processado('predicoes_valorizacao.parquet'), _processado('predicoes_valorizacao_delta.parquet'),
+            VERSAO_MODELO,
+        ),
+        saidas=(_processado('cubo_celulas.parquet'), _processado('cubo_valorizacao.parquet'), ESTADO_CUBO),
+        parametros=PARAMETROS_WAREHOUSE,
+    ),
+    Etapa(
+        'ranking', 'src.reports.gerar_ranking:run',
+        entradas=(_processado('cubo_valorizacao.parquet'),),
+        saidas=(_processado('ranking_bairros.parquet'),),
+        parametros=PARAMETROS_WAREHOUSE,
+    ),
+    Etapa(
+        'mapas', 'src.reports.mapas:run',
+        entradas=(
+            _processado('bairros_paranagua.gpkg'),
+            _processado('regularizacao_paranagua.parquet'), _processado('regularizacao_pontal.parquet'),
+        ),
+        saidas=(_processado('mapas'),),
+    ),
+]
+
+
+def dependencias(etapas=ETAPAS) -> dict:
+    """Mapeia cada etapa para o conjunto de etapas que produzem suas entradas."""
+    produtor = {}
+    for etapa in etapas:
+        for saida in etapa.saidas:
+            if saida in produtor:
+                raise ValueError(f"Artefato {saida} produzido por {produtor[saida]} e {etapa.nome}")
+            produtor[saida] = etapa.nome
+    return {
+        etapa.nome: {produtor[e] for e in etapa.entradas if e in produtor}
+        for etapa in etapas
+    }
+
+
+def ordenar(etapas=ETAPAS) -> list:
+    """Ordem topológica estável (respeita a ordem de declaração entre etapas independentes)."""
+    deps = dependencias(etapas)
+    ordem, visitadas, em_visita = [], set(), set()
+
+    def visitar(nome):
+        if nome in visitadas:
+            return
+        if nome in em_visita:
+            raise ValueError(f"Ciclo no grafo de etapas envolvendo {nome}")
+        em_visita.add(nome)
+        for dep in sorted(deps[nome], key=[e.nome for e in etapas].index):
+            visitar(dep)
+        em_visita.discard(nome)
+        visitadas.add(nome)
+        ordem.append(nome)
+
+    for etapa in etapas:
+        visitar(etapa.nome)
+    return ordem
+
+
+def selecionar(alvos=None, somente=None, etapas=ETAPAS) -> list:
+    """Nomes das etapas a executar: `somente` exatamente essas; `alvos` e todos os seus ancestrais."""
+    nomes = {etapa.nome for etapa in etapas}
+    pedidas = set(somente or []) | set(alvos or [])
+    desconhecidas = pedidas - nomes
+    if desconhecidas:
+        raise KeyError(f"Etapas desconhecidas: {sorted(desconhecidas)}")
+
+    if somente:
+        escolhidas = set(somente)
+    elif alvos:
+        deps = dependencias(etapas)
+        escolhidas, pilha = set(), list(alvos)
+        while pilha:
+            nome = pilha.pop()
+            if nome not in escolhidas:
+                escolhidas.add(nome)
+                pilha.extend(deps[nome])
+    else:
+        escolhidas = nomes
+    return [nome for nome in ordenar(etapas) if nome in escolhidas]
+
+
+def artefatos(nomes, etapas=ETAPAS) -> list:
+    """(etapa, saída, idade em segundos ou None se ausente) das saídas das etapas, sem importá-las."""
+    por_nome = {etapa.nome: etapa for etapa in etapas}
+    agora = time.time()
+    return [
+        (nome, saida, agora - os.path.getmtime(saida) if os.path.exists(saida) else None)
+        for nome in nomes for saida in por_nome[nome].saidas
+    ]
+
+
+def executar(nomes, etapas=ETAPAS, max_workers=MAX_ETAPAS_SIMULTANEAS, forcar=False):
+    """Executa as etapas em paralelo assim que suas dependências (dentro da seleção) terminam.
+
+    Etapas cujo checkpoint continua válido (mesmas entradas, código e
+    parâmetros, saídas intactas) são puladas, a menos que `forcar` seja
+    verdadeiro; assim uma nova tentativa após uma falha retoma do ponto em
+    que parou. Cada execução é medida (tempo, CPU, memória, linhas, bytes,
+    cache) e registrada num manifesto JSON e no arquivo do Prometheus,
+    mesmo se falhar.
+    """
+    execucao = None
+    try:
+        with trecho('execucao', etapas=list(nomes)) as execucao:
+            return _executar(nomes, etapas, max_workers, forcar, execucao)
+    finally:
+        if execucao is not None:
+            try:
+                gravar_execucao(execucao)
+            except OSError as e:
+                logging.warning(f"Manifesto da execução não gravado: {e}")
+
+
+def _envio_falhou(medicao):
+    return any((filho.nome == 'envio_s3' and filho.erro) or _envio_falhou(filho) for filho in medicao.filhos)
+
+
+def _executar(nomes, etapas, max_workers, forcar, execucao):
+    por_nome = {etapa.nome: etapa for etapa in etapas}
+    deps = {nome: dep & set(nomes) for nome, dep in dependencias(etapas).items() if nome in nomes}
+    checkpoints = Checkpoints()
+    pendentes = list(nomes)
+    concluidas = set()
+    puladas = execucao.atributos.setdefault('puladas', [])
+    componentes = {}
+    erros = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        em_execucao = {}
+        while pendentes or em_execucao:
+            # Pular uma etapa libera as seguintes na mesma rodada
+            prontas = [n for n in pendentes if deps[n] <= concluidas] if not erros else []
+            while prontas:
+                for nome in prontas:
+                    pendentes.remove(nome)
+                    # A impressão é calculada quando as dependências terminam: as entradas já são as definitivas
+                    componentes[nome] = checkpoints.componentes(por_nome[nome])
+                    motivo = 'execução forçada' if forcar else checkpoints.motivo_execucao(por_nome[nome], componentes[nome])
+                    if motivo is None:
+                        logging.info(f"Etapa {nome} inalterada desde o último checkpoint — pulada")
+                        puladas.append(nome)
+                        concluidas.add(nome)
+                        continue
+                    logging.info(f"Iniciando etapa {nome} ({motivo})")
+                    em_execucao[executor.submit(no_contexto_atual(por_nome[nome].executar))] = nome
+                prontas = [n for n in pendentes if deps[n] <= concluidas]
+            if not em_execucao:
+                break
+
+            feitas, _ = wait(em_execucao, return_when=FIRST_COMPLETED)
+            for futuro in feitas:
+                nome = em_execucao.pop(futuro)
+                try:
+                    futuro.result()
+                except Exception as e:
+                    logging.error(f"Etapa {nome} falhou: {e}")
+                    erros[nome] = e
+                    checkpoints.invalidar(nome)
+                else:
+                    logging.info(f"Etapa {nome} concluída")
+                    concluidas.add(nome)
+                    checkpoints.registrar(por_nome[nome], componentes[nome])
+
+    # Uploads iniciados em segundo plano pelas etapas precisam terminar antes do fim do pipeline
+    destino_s3 = sys.modules.get('src.utils.destino_s3')
+    if destino_s3 is not None:
+        try:
+            destino_s3.aguardar_envios()
+        except RuntimeError:
+            # A etapa cujo envio falhou não pode ser pulada na próxima execução
+            for medicao in execucao.filhos:
+                if medicao.nome == 'etapa' and _envio_falhou(medicao):
+                    checkpoints.invalidar(medicao.atributos['etapa'])
+            raise
+
+    if erros:
+        if pendentes:
+            logging.warning(f"Etapas não executadas por falha anterior: {pendentes}")
+        raise RuntimeError(f"Falha nas etapas: {sorted(erros)}") from next(iter(erros.values()))
+    return concluidas
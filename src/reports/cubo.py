@@ -0,0 +1,220 @@
+import os
+import json
+import logging
+from itertools import combinations
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from src.utils.logs import configurar_logs
+from src.utils.tabelas import caminho_tabela, ler_tabela, salvar_tabela
+from src.utils.warehouse import obter_warehouse
+
+BQ_PROJECT = 'seu-projeto-gcp'
+BQ_DATASET = 'valorimob'
+BQ_TABLE = 'cubo_valorizacao'
+
+# Versões do modelo cujas previsões já estão somadas nas células do cubo
+ESTADO_PATH = os.path.join('data', 'state', 'cubo_valorizacao.json')
+
+# Dimensões do cubo; TODOS marca a dimensão agregada nas linhas de total
+DIMENSOES = ['bairro', 'municipio', 'ano', 'eh_novo', 'faixa_preco']
+TODOS = '*'
+
+FAIXAS_PRECO = [0, 200_000, 400_000, 700_000, 1_000_000, np.inf]
+ROTULOS_FAIXAS = ['ate_200k', '200k_400k', '400k_700k', '700k_1m', 'acima_1m']
+
+# Medidas aditivas: somar células dá a célula agregada, o que permite atualizar o cubo por incrementos
+MEDIDAS = [
+    'qtde_imoveis', 'soma_valorizacao_absoluta', 'soma_valorizacao_percentual',
+    'soma_quadrados_valorizacao_percentual', 'soma_valorizacao_minima_percentual',
+    'soma_valorizacao_maxima_percentual', 'soma_preco_real', 'soma_preco_previsto',
+]
+
+# Bootstrap de Poisson do intervalo de confiança da valorização média: cada imóvel recebe um peso
+# Poisson(1) por reamostragem, e as somas ponderadas de cada reamostragem são aditivas como as medidas
+# (os pesos são independentes por imóvel, então somar células dá o bootstrap da célula agregada)
+REAMOSTRAGENS = 200
+NIVEL_CONFIANCA = 0.9
+SEMENTE = 42
+COLUNAS_PESOS = [f'bootstrap_peso_{i:03d}' for i in range(REAMOSTRAGENS)]
+COLUNAS_SOMAS = [f'bootstrap_soma_{i:03d}' for i in range(REAMOSTRAGENS)]
+REPLICAS = COLUNAS_PESOS + COLUNAS_SOMAS
+# Elementos (linhas x reamostragens) da matriz de pesos gerada por vez, para limitar a memória
+MAX_ELEMENTOS_BLOCO = 10_000_000
+# Com tão poucos imóveis o bootstrap não estima a incerteza; a célula fica sem intervalo e vai para o fim do ranking
+MIN_IMOVEIS_IC = 5
+# Ordem do ranking de bairros numa fatia (a de ranking_bairros é a fatia sem filtros): limite inferior do intervalo
+ORDEM_RANKING = 'ic_inferior DESC NULLS LAST, valorizacao_percentual DESC'
+
+# Pesos Poisson(1) por consulta a uma tabela de quantis indexada por inteiros de 16 bits:
+# bem mais rápido que rng.poisson, com probabilidades exatas até 1/65536
+_QUANTIS_16_BITS = (np.arange(2 ** 16) + 0.5) / 2 ** 16
+_CDF_POISSON_1 = np.cumsum(np.exp(-1) / np.cumprod(np.r_[1, np.arange(1, 16)]))
+TABELA_POISSON = np.searchsorted(_CDF_POISSON_1, _QUANTIS_16_BITS, side='right').astype(np.uint8)
+
+def somas_bootstrap(valores, grupos, n_grupos, semente=SEMENTE):
+    """Somas dos pesos e dos valores ponderados de cada reamostragem, por grupo, sem laço sobre os grupos.
+
+    `grupos` numera as linhas de 0 a `n_grupos` - 1, todos presentes. As
+    somas saem de `np.add.reduceat` com as linhas ordenadas por grupo.
+    Retorna duas matrizes (grupos x reamostragens): pesos e somas.
+    """
+    ordem = np.argsort(grupos, kind='stable')
+    valores = np.nan_to_num(np.asarray(valores, dtype=np.float64)[ordem])
+    inicios = np.searchsorted(np.asarray(grupos)[ordem], np.arange(n_grupos))
+    rng = np.random.default_rng(semente)
+
+    pesos = np.empty((n_grupos, REAMOSTRAGENS))
+    somas = np.empty((n_grupos, REAMOSTRAGENS))
+    por_bloco = max(1, MAX_ELEMENTOS_BLOCO // max(len(valores), 1))
+    for inicio in range(0, REAMOSTRAGENS, por_bloco):
+        fim = min(inicio + por_bloco, REAMOSTRAGENS)
+        sorteio = rng.integers(0, 2 ** 16, size=(len(valores), fim - inicio), dtype=np.uint16)
+        bloco = TABELA_POISSON[sorteio].astype(np.float64)
+        pesos[:, inicio:fim] = np.add.reduceat(bloco, inicios, axis=0)
+        somas[:, inicio:fim] = np.add.reduceat(bloco * valores[:, None], inicios, axis=0)
+    return pesos, somas
+
+def celulas(df, semente=SEMENTE) -> pd.DataFrame:
+    """Agrega as previsões no grão mais fino do cubo, numa única passada de groupby.
+
+    Cada carga somada ao cubo precisa da sua `semente`, para que os pesos
+    do bootstrap de imóveis de cargas diferentes sejam independentes.
+    """
+    percentual = (df['preco_previsto'] / df['preco_real'] - 1) * 100
+    base = pd.DataFrame({
+        'bairro': df['bairro'].astype('string').fillna('Desconhecido'),
+        'municipio': df['municipio'].astype('string').fillna('Desconhecido'),
+        'ano': df['ano'].astype('Int16').astype('string').fillna('Desconhecido'),
+        'eh_novo': df['eh_novo'].astype('Int8').astype('string').fillna('Desconhecido'),
+        'faixa_preco': pd.cut(df['preco_real'], FAIXAS_PRECO, labels=ROTULOS_FAIXAS, right=False)
+                         .astype('string').fillna('Desconhecido'),
+        'qtde_imoveis': 1,
+        'soma_valorizacao_absoluta': df['preco_previsto'] - df['preco_real'],
+        'soma_valorizacao_percentual': percentual,
+        'soma_quadrados_valorizacao_percentual': percentual ** 2,
+        # Limites de valorização segundo o intervalo de previsão de cada imóvel
+        'soma_valorizacao_minima_percentual': (df['preco_previsto_inferior'] / df['preco_real'] - 1) * 100,
+        'soma_valorizacao_maxima_percentual': (df['preco_previsto_superior'] / df['preco_real'] - 1) * 100,
+        'soma_preco_real': df['preco_real'],
+        'soma_preco_previsto': df['preco_previsto'],
+    })
+    grupos = base.groupby(DIMENSOES, observed=True)
+    resultado = grupos[MEDIDAS].sum().reset_index()
+    pesos, somas = somas_bootstrap(base['soma_valorizacao_percentual'], grupos.ngroup().to_numpy(),
+                                   len(resultado), semente)
+    replicas = pd.DataFrame(np.hstack([pesos, somas]), columns=REPLICAS)
+    return pd.concat([resultado, replicas], axis=1)
+
+def somar(*tabelas_celulas) -> pd.DataFrame:
+    """Junta células de várias cargas somando as medidas das que coincidem."""
+    return pd.concat(tabelas_celulas, ignore_index=True).groupby(DIMENSOES, as_index=False)[MEDIDAS + REPLICAS].sum()
+
+def materializar(base) -> pd.DataFrame:
+    """Pré-calcula todos os agregados (2^5 combinações de dimensões) e as métricas derivadas.
+
+    As somas das reamostragens só servem para o intervalo de confiança e não vão para o cubo.
+    """
+    partes = []
+    for k in range(len(DIMENSOES) + 1):
+        for agregadas in combinations(DIMENSOES, k):
+            mantidas = [d for d in DIMENSOES if d not in agregadas]
+            if mantidas:
+                parte = base.groupby(mantidas, as_index=False)[MEDIDAS + REPLICAS].sum()
+            else:
+                parte = base[MEDIDAS + REPLICAS].sum().to_frame().T
+            for dimensao in agregadas:
+                parte[dimensao] = TODOS
+            partes.append(parte[DIMENSOES + MEDIDAS + REPLICAS])
+    cubo = pd.concat(partes, ignore_index=True)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        medias = cubo[COLUNAS_SOMAS].to_numpy() / cubo[COLUNAS_PESOS].to_numpy()
+    cauda = (1 - NIVEL_CONFIANCA) / 2 * 100
+    limites = np.full((2, len(cubo)), np.nan)
+    validas = cubo['qtde_imoveis'].to_numpy() >= MIN_IMOVEIS_IC
+    # Reamostragens com peso total zero não têm média; o nanpercentile, bem mais lento, fica só para essas células
+    sem_media = np.isnan(medias).any(axis=1)
+    for linhas, percentil in ((validas & ~sem_media, np.percentile), (validas & sem_media, np.nanpercentile)):
+        if linhas.any():
+            limites[:, linhas] = percentil(medias[linhas], [cauda, 100 - cauda], axis=1)
+    cubo = cubo.drop(columns=REPLICAS)
+
+    n = cubo['qtde_imoveis'].astype('float64')
+    media = cubo['soma_valorizacao_percentual'] / n
+    cubo['valorizacao_absoluta'] = cubo['soma_valorizacao_absoluta'] / n
+    cubo['valorizacao_percentual'] = media
+    cubo['valorizacao_minima_percentual'] = cubo['soma_valorizacao_minima_percentual'] / n
+    cubo['valorizacao_maxima_percentual'] = cubo['soma_valorizacao_maxima_percentual'] / n
+    cubo['ic_inferior'], cubo['ic_superior'] = limites
+    cubo['qtde_imoveis'] = cubo['qtde_imoveis'].astype('int64')
+    return cubo
+
+def _ler_estado():
+    if not os.path.exists(ESTADO_PATH):
+        return {'versoes': []}
+    with open(ESTADO_PATH, encoding='utf-8') as f:
+        return json.load(f)
+
+def _salvar_estado(estado):
+    os.makedirs(os.path.dirname(ESTADO_PATH), exist_ok=True)
+    tmp = ESTADO_PATH + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(estado, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, ESTADO_PATH)
+
+def _celulas_existentes() -> bool:
+    """Há células gravadas, e com todas as medidas e reamostragens atuais (senão o cubo é reconstruído)."""
+    caminho = caminho_tabela('cubo_celulas')
+    return os.path.exists(caminho) and set(MEDIDAS + REPLICAS) <= set(pq.read_schema(caminho).names)
+
+def atualizar_cubo():
+    """Soma as previsões da versão atual do modelo ao cubo, ou o reconstrói após um retreino completo.
+
+    Depois de um retreino completo as previsões antigas deixam de valer e
+    as células recomeçam da tabela inteira; após uma atualização incremental
+    só as previsões acrescentadas (`predicoes_valorizacao_delta`) são somadas
+    às células existentes.
+    """
+    from src.models import atualizacao
+
+    manifesto = atualizacao.versao_atual()
+    versao = manifesto['versao'] if manifesto else None
+    estado = _ler_estado()
+    existentes = _celulas_existentes()
+    if versao is not None and versao in estado['versoes'] and existentes:
+        logging.info(f'Cubo já contém as previsões da versão {versao}')
+        return caminho_tabela('cubo_valorizacao')
+
+    incremental = (
+        manifesto is not None and manifesto['tipo'] == 'incremental' and existentes
+        and manifesto['base'] in estado['versoes']
+    )
+    if incremental:
+        # Só as previsões acrescentadas por esta versão; as anteriores já estão nas células
+        delta = celulas(ler_tabela('predicoes_valorizacao_delta'), semente=(SEMENTE, len(estado['versoes'])))
+        base = somar(ler_tabela('cubo_celulas'), delta)
+        estado['versoes'].append(versao)
+    else:
+        base = celulas(ler_tabela('predicoes_valorizacao'))
+        estado['versoes'] = [versao] if versao else []
+
+    # As somas das reamostragens ficam nas células, fora do esquema declarado
+    salvar_tabela(base, 'cubo_celulas', manter_extras=True)
+    path = salvar_tabela(materializar(base), 'cubo_valorizacao')
+    _salvar_estado(estado)
+    logging.info(f'Cubo {"atualizado" if incremental else "reconstruído"}: {len(base)} células')
+    return path
+
+def upload_bigquery(cubo_path, project=BQ_PROJECT, dataset=BQ_DATASET, table=BQ_TABLE):
+    obter_warehouse(project).carregar(cubo_path, f'{dataset}.{table}')
+    logging.info(f'Cubo enviado ao warehouse: {dataset}.{table}')
+
+def run():
+    logging.info('Atualizando cubo de valorização')
+    path = atualizar_cubo()
+    upload_bigquery(path)
+
+if __name__ == '__main__':
+    configurar_logs()
+    run()
@@ -1,82 +1,53 @@
 import os
 import logging
-import pandas as pd
-import boto3
-from google.cloud import bigquery
+from src.reports.cubo import DIMENSOES, TODOS
+from src.utils.destino_s3 import enviar_em_segundo_plano
+from src.utils.logs import configurar_logs
+from src.utils.tabelas import ler_tabela, salvar_tabela
+from src.utils.warehouse import obter_warehouse
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s — %(levelname)s — %(message)s')
-
-PROCESSED_DIR = os.path.join('data', 'processed')
 AWS_S3_BUCKET = 'seu-bucket-aqui'
 AWS_S3_PREFIX = 'valorimob/rankings/'
 BQ_PROJECT = 'seu-projeto-gcp'
 BQ_DATASET = 'valorimob'
 BQ_TABLE = 'ranking_bairros'
 
-def carregar_predicoes():
-    path = os.path.join(PROCESSED_DIR, 'predicoes_valorizacao.csv')
-    df = pd.read_csv(path)
-    logging.info(f'Previsões carregadas: {df.shape[0]} registros')
+COLUNAS_RANKING = [
+    'bairro', 'valorizacao_absoluta', 'valorizacao_percentual', 'valorizacao_minima_percentual',
+    'valorizacao_maxima_percentual', 'qtde_imoveis', 'ic_inferior', 'ic_superior',
+]
+
+def carregar_fatia_bairros():
+    """Linhas do cubo de cada bairro com as demais dimensões agregadas (a fatia sem filtros do dashboard)."""
+    filtros = [(dimensao, '==', TODOS) for dimensao in DIMENSOES if dimensao != 'bairro'] + [('bairro', '!=', TODOS)]
+    df = ler_tabela('cubo_valorizacao', colunas=COLUNAS_RANKING, filtros=filtros)
+    logging.info(f'Fatia do cubo carregada: {df.shape[0]} bairros')
     return df
 
 def gerar_ranking(df):
-    if 'bairro' not in df.columns:
-        logging.warning('Coluna "bairro" não encontrada. Ranking será inválido.')
-        df['bairro'] = 'Desconhecido'
-
-    df['valorizacao_absoluta'] = df['preco_previsto'] - df['preco_real']
-    df['valorizacao_percentual'] = ((df['preco_previsto'] / df['preco_real']) - 1) * 100
-
-    ranking = df.groupby('bairro').agg({
-        'valorizacao_absoluta': 'mean',
-        'valorizacao_percentual': 'mean',
-        'preco_real': 'count'
-    }).rename(columns={'preco_real': 'qtde_imoveis'}).reset_index()
-
-    ranking = ranking.sort_values(by='valorizacao_percentual', ascending=False)
+    # Ordena pelo limite inferior: um bairro com poucos imóveis só sobe se a valorização for consistente
+    ranking = df.sort_values(by=['ic_inferior', 'valorizacao_percentual'], ascending=False, na_position='last')
     logging.info(f'🏆 Ranking gerado: {ranking.shape[0]} bairros')
-    return ranking
+    return ranking.reset_index(drop=True)
 
 def salvar_ranking(ranking):
-    os.makedirs(PROCESSED_DIR, exist_ok=True)
-    path = os.path.join(PROCESSED_DIR, 'ranking_bairros.csv')
-    ranking.to_csv(path, index=False)
+    path = salvar_tabela(ranking, 'ranking_bairros')
     logging.info(f'Ranking salvo em: {path}')
     return path
 
-def upload_s3(path, bucket=AWS_S3_BUCKET, prefix=AWS_S3_PREFIX):
-    s3 = boto3.client('s3')
-    key = prefix + os.path.basename(path)
-    s3.upload_file(path, bucket, key)
-    logging.info(f'Upload do ranking para S3: s3://{bucket}/{key}')
-
-def upload_bigquery(ranking, project=BQ_PROJECT, dataset=BQ_DATASET, table=BQ_TABLE):
-    client = bigquery.Client(project=project)
-    table_ref = client.dataset(dataset).table(table)
-
-    job_config = bigquery.LoadJobConfig(
-        source_format=bigquery.SourceFormat.CSV,
-        autodetect=True,
-        skip_leading_rows=1,
-        write_disposition='WRITE_TRUNCATE'
-    )
-
-    tmp_csv = os.path.join(PROCESSED_DIR, 'ranking_bairros.csv')
-    with open(tmp_csv, "rb") as f:
-        job = client.load_table_from_file(f, table_ref, job_config=job_config)
-    job.result()
-
-    logging.info(f'📡 Ranking enviado ao BigQuery: {project}.{dataset}.{table}')
+def upload_bigquery(ranking_path, project=BQ_PROJECT, dataset=BQ_DATASET, table=BQ_TABLE):
+    obter_warehouse(project).carregar(ranking_path, f'{dataset}.{table}')
+    logging.info(f'📡 Ranking enviado ao warehouse: {dataset}.{table}')
 
 def run():
     logging.info('Gerando ranking de valorização dos bairros')
-    df_pred = carregar_predicoes()
-    ranking = gerar_ranking(df_pred)
+    ranking = gerar_ranking(carregar_fatia_bairros())
     ranking_path = salvar_ranking(ranking)
-    upload_s3(ranking_path)
-    upload_bigquery(ranking)
+    enviar_em_segundo_plano(ranking_path, AWS_S3_BUCKET, AWS_S3_PREFIX + os.path.basename(ranking_path))
+    upload_bigquery(ranking_path)
 
     logging.info('Ranking de valorização finalizado e publicado')
 
 if __name__ == '__main__':
+    configurar_logs()
     run()
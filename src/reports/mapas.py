@@ -0,0 +1,107 @@
+import os
+import json
+import logging
+import math
+import numpy as np
+import shapely
+from src.utils.logs import configurar_logs
+# geopandas e as camadas de origem são importados dentro das funções que geram os mapas:
+# o dashboard importa este módulo só pelos níveis de zoom e caminhos dos arquivos
+
+# GeoJSON já simplificado, um arquivo por camada e nível de zoom; o navegador nunca recebe os polígonos originais
+MAPAS_DIR = os.path.join('data', 'processed', 'mapas')
+
+# Níveis de zoom (escala do web mercator) gerados; o dashboard escolhe o mais próximo do enquadramento
+ZOOMS = (10, 12, 14)
+METROS_POR_PIXEL_Z0 = 156_543.03
+METROS_POR_GRAU = 111_320
+# Desvio máximo da simplificação, em pixels da tela no zoom do arquivo
+TOLERANCIA_PIXELS = 0.5
+# A grade de quantização é uma fração da tolerância: coordenadas curtas sem deslocar vértices visivelmente
+FRACAO_GRADE = 0.25
+
+def tolerancia_graus(zoom) -> float:
+    """Tolerância de simplificação em graus para o zoom, pela latitude média do litoral do PR."""
+    metros = METROS_POR_PIXEL_Z0 * math.cos(math.radians(25.5)) / 2 ** zoom
+    return TOLERANCIA_PIXELS * metros / METROS_POR_GRAU
+
+def simplificar(geometrias, tolerancia):
+    """Simplifica preservando a topologia.
+
+    Com `shapely.coverage_simplify` (GEOS 3.12+), as fronteiras
+    compartilhadas entre bairros vizinhos são simplificadas uma só vez e
+    continuam coincidentes; sem ele, cada polígono é simplificado
+    isoladamente com preserve_topology, o que mantém cada um válido.
+    """
+    geometrias = np.asarray(geometrias, dtype=object)
+    if hasattr(shapely, 'coverage_simplify'):
+        return shapely.coverage_simplify(geometrias, tolerancia)
+    return shapely.simplify(geometrias, tolerancia, preserve_topology=True)
+
+def quantizar(geometrias, tolerancia):
+    """Encaixa os vértices numa grade e arredonda as coordenadas para o número de casas da grade."""
+    expoente = math.floor(math.log10(tolerancia * FRACAO_GRADE))
+    grade = 10.0 ** expoente
+    geometrias = shapely.set_precision(geometrias, grade)
+    return shapely.transform(geometrias, lambda coordenadas: np.round(coordenadas, -expoente))
+
+def caminho_mapa(camada, zoom, diretorio=MAPAS_DIR) -> str:
+    return os.path.join(diretorio, f'{camada}_z{zoom}.geojson')
+
+def gerar_niveis(gdf, camada, diretorio=MAPAS_DIR) -> list:
+    """Grava `<camada>_z<zoom>.geojson` para cada zoom, descartando geometrias que somem no nível."""
+    import geopandas as gpd
+    os.makedirs(diretorio, exist_ok=True)
+    caminhos = []
+    for zoom in ZOOMS:
+        tolerancia = tolerancia_graus(zoom)
+        geometrias = quantizar(simplificar(gdf.geometry.values, tolerancia), tolerancia)
+        nivel = gdf.drop(columns=gdf.geometry.name).assign(geometry=geometrias)
+        nivel = gpd.GeoDataFrame(nivel, geometry='geometry', crs='EPSG:4326')
+        nivel = nivel[~nivel.geometry.is_empty & nivel.geometry.notna()]
+
+        caminho = caminho_mapa(camada, zoom, diretorio)
+        tmp = caminho + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(nivel.__geo_interface__, f, separators=(',', ':'), ensure_ascii=False)
+        os.replace(tmp, caminho)
+        caminhos.append(caminho)
+        vertices = int(shapely.get_num_coordinates(nivel.geometry.values).sum())
+        logging.info(f'Mapa {camada} z{zoom}: {len(nivel)} feições, {vertices} vértices, '
+                     f'{os.path.getsize(caminho) / 1024:.0f} KiB')
+    return caminhos
+
+def camada_bairros():
+    from src.features.enriquecer_espacial import ler_bairros
+    gdf = ler_bairros().rename(columns={'bairro_oficial': 'bairro'})
+    gdf = gdf[gdf['bairro'].notna()]
+    # Bairros em várias partes viram uma feição só, com a mesma chave do cubo
+    return gdf.dissolve(by='bairro', as_index=False)
+
+def camada_regularizacao(caminhos):
+    import geopandas as gpd
+    from src.features.enriquecer_espacial import ler_regularizacao
+    gdf = ler_regularizacao(caminhos)
+    if gdf.crs is not None:
+        gdf = gdf.to_crs(epsg=4326)
+    gdf = gpd.GeoDataFrame({'situacao': gdf['situacao'].astype('string').fillna('Desconhecida')},
+                           geometry=gdf.geometry.values, crs='EPSG:4326')
+    # O mapa só colore pela situação: polígonos vizinhos da mesma situação viram uma feição
+    return gdf.dissolve(by='situacao', as_index=False)
+
+def run():
+    from src.features.enriquecer_espacial import BAIRROS_PATH, REGULARIZACAO_PATHS
+    if os.path.exists(BAIRROS_PATH):
+        gerar_niveis(camada_bairros(), 'bairros')
+    else:
+        logging.warning(f'{BAIRROS_PATH} não encontrado — mapa de bairros não gerado')
+
+    caminhos = [c for c in REGULARIZACAO_PATHS if os.path.exists(c)]
+    if caminhos:
+        gerar_niveis(camada_regularizacao(caminhos), 'regularizacao')
+    else:
+        logging.warning('Camadas de regularização não encontradas — sobreposição do mapa não gerada')
+
+if __name__ == '__main__':
+    configurar_logs()
+    run()
@@ -0,0 +1,235 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+
+from tqdm import tqdm
+
+from src.utils.instrumentacao import contar, trecho
+from src.utils.rede import obter_cliente
+
+CACHE_DIR = os.environ.get('VALORIMOB_CACHE_DIR', os.path.join('data', 'cache', 'downloads'))
+
+# Limite total do cache em disco; acima disso os itens menos usados são removidos
+TAMANHO_MAXIMO_BYTES = int(os.environ.get('VALORIMOB_CACHE_MAX_BYTES', 5 * 1024 ** 3))
+
+# Com VALORIMOB_OFFLINE=1 nenhuma requisição é feita: só respostas já gravadas são usadas
+OFFLINE = os.environ.get('VALORIMOB_OFFLINE', '0') == '1'
+
+# Tempo (segundos) em que uma resposta é usada sem revalidação, por fonte.
+# None significa que a resposta nunca expira sem revalidação explícita.
+TTL_POR_FONTE = {
+    'sidra': 24 * 3600,
+    'onr': 7 * 24 * 3600,
+    'bairros': 30 * 24 * 3600,
+}
+TTL_PADRAO = 24 * 3600
+
+TAMANHO_BLOCO = 1024 * 1024
+
+
+class CacheDownloads:
+    """Cache de downloads endereçado por conteúdo, indexado por URL e parâmetros.
+
+    Os arquivos são gravados uma única vez em `objetos/<sha256><extensão>`,
+    em blocos e sem carregar o conteúdo inteiro em memória, e o índice
+    associa cada chave (URL + parâmetros) ao hash do conteúdo, aos cabeçalhos
+    de validação (ETag/Last-Modified) e ao último acesso, usado na remoção LRU.
+    """
+
+    def __init__(self, diretorio=CACHE_DIR, tamanho_maximo=TAMANHO_MAXIMO_BYTES, offline=OFFLINE):
+        self.diretorio = diretorio
+        self.tamanho_maximo = tamanho_maximo
+        self.offline = offline
+        self.caminho_indice = os.path.join(diretorio, 'indice.json')
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(diretorio, 'objetos'), exist_ok=True)
+        self._indice = self._ler_indice()
+
+    def obter(self, url, fonte, params=None, sha256_esperado=None) -> str:
+        """Retorna o caminho local do conteúdo de `url`, baixando ou revalidando se preciso.
+
+        Com `sha256_esperado`, o conteúdo baixado é conferido antes de entrar no cache.
+        """
+        chave = chave_requisicao(url, params)
+        with self._lock:
+            entrada = self._indice.get(chave)
+
+        if entrada and os.path.exists(self._caminho_objeto(entrada)):
+            if self.offline or not self._expirada(entrada, fonte):
+                logging.info(f"Cache: usando cópia local de {url}")
+                contar(cache_acertos=1)
+                return self._registrar_acesso(chave, entrada)
+        elif self.offline:
+            raise FileNotFoundError(f"Modo offline: {url} não está no cache")
+        else:
+            entrada = None
+
+        with trecho('download', fonte=fonte, url=url):
+            return self._baixar(chave, url, fonte, params, entrada, sha256_esperado)
+
+    def importar(self, url, caminho, fonte, params=None) -> str:
+        """Registra um arquivo local como a resposta de `url`, como se tivesse sido baixado.
+
+        Permite rodar as etapas em modo offline sobre arquivos preparados
+        localmente (dados sintéticos dos benchmarks, cópias manuais).
+        """
+        def blocos():
+            with open(caminho, 'rb') as f:
+                while bloco := f.read(TAMANHO_BLOCO):
+                    yield bloco
+
+        extensao = os.path.splitext(urlparse(url).path)[1].lower()
+        sha256, tamanho = self._gravar_objeto(blocos(), extensao)
+        entrada = {
+            'url': url,
+            'params': params,
+            'fonte': fonte,
+            'sha256': sha256,
+            'extensao': extensao,
+            'tamanho': tamanho,
+            'etag': None,
+            'last_modified': None,
+            'baixado_em': time.time(),
+        }
+        return self._registrar_acesso(chave_requisicao(url, params), entrada)
+
+    def _baixar(self, chave, url, fonte, params, entrada, sha256_esperado=None):
+        headers = {}
+        if entrada:
+            if entrada.get('etag'):
+                headers['If-None-Match'] = entrada['etag']
+            if entrada.get('last_modified'):
+                headers['If-Modified-Since'] = entrada['last_modified']
+
+        resp = obter_cliente().get(url, params=params, headers=headers, stream=True)
+        with resp:
+            if resp.status_code == 304 and entrada:
+                logging.info(f"Cache: {url} não mudou no servidor (304)")
+                contar(cache_acertos=1)
+                entrada['baixado_em'] = time.time()
+                return self._registrar_acesso(chave, entrada)
+
+            total = int(resp.headers.get('Content-Length', 0)) or None
+            extensao = os.path.splitext(urlparse(url).path)[1].lower()
+            with tqdm(total=total, unit='B', unit_scale=True, desc=os.path.basename(urlparse(url).path),
+                      leave=False) as progresso:
+                sha256, tamanho = self._gravar_objeto(
+                    resp.iter_content(TAMANHO_BLOCO), extensao, sha256_esperado, progresso.update)
+
+        nova = {
+            'url': url,
+            'params': params,
+            'fonte': fonte,
+            'sha256': sha256,
+            'extensao': extensao,
+            'tamanho': tamanho,
+            'etag': resp.headers.get('ETag'),
+            'last_modified': resp.headers.get('Last-Modified'),
+            'baixado_em': time.time(),
+        }
+        logging.info(f"Cache: {url} baixado ({tamanho} bytes, sha256 {sha256})")
+        contar(cache_falhas=1, bytes_baixados=tamanho)
+        caminho = self._registrar_acesso(chave, nova)
+        self._remover_excedente()
+        return caminho
+
+    def _gravar_objeto(self, blocos, extensao, sha256_esperado=None, progresso=None):
+        """Grava os blocos num arquivo temporário calculando o hash e move para o destino final."""
+        hash_conteudo = hashlib.sha256()
+        tamanho = 0
+        fd, tmp = tempfile.mkstemp(dir=self.diretorio, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for bloco in blocos:
+                    hash_conteudo.update(bloco)
+                    tamanho += len(bloco)
+                    f.write(bloco)
+                    if progresso:
+                        progresso(len(bloco))
+            sha256 = hash_conteudo.hexdigest()
+            if sha256_esperado and sha256 != sha256_esperado.lower():
+                raise ValueError(f"Checksum divergente: esperado {sha256_esperado}, obtido {sha256}")
+            destino = self._caminho_objeto({'sha256': sha256, 'extensao': extensao})
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            os.replace(tmp, destino)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return sha256, tamanho
+
+    def _expirada(self, entrada, fonte):
+        ttl = TTL_POR_FONTE.get(fonte, TTL_PADRAO)
+        if ttl is None:
+            return False
+        return time.time() - entrada['baixado_em'] > ttl
+
+    def _registrar_acesso(self, chave, entrada):
+        entrada['ultimo_acesso'] = time.time()
+        with self._lock:
+            self._indice[chave] = entrada
+            self._salvar_indice()
+        return self._caminho_objeto(entrada)
+
+    def _remover_excedente(self):
+        """Remove as entradas menos usadas recentemente até caber no limite."""
+        with self._lock:
+            objetos = {self._caminho_objeto(e): e['tamanho'] for e in self._indice.values()}
+            total = sum(objetos.values())
+            if total <= self.tamanho_maximo:
+                return
+            for chave, entrada in sorted(self._indice.items(), key=lambda item: item[1]['ultimo_acesso']):
+                if total <= self.tamanho_maximo:
+                    break
+                del self._indice[chave]
+                caminho = self._caminho_objeto(entrada)
+                if any(self._caminho_objeto(e) == caminho for e in self._indice.values()):
+                    continue
+                if os.path.exists(caminho):
+                    os.remove(caminho)
+                total -= objetos[caminho]
+                logging.info(f"Cache: removido {entrada['url']} (LRU)")
+            self._salvar_indice()
+
+    def _caminho_objeto(self, entrada):
+        sha256 = entrada['sha256']
+        return os.path.join(self.diretorio, 'objetos', sha256[:2], sha256 + entrada.get('extensao', ''))
+
+    def _ler_indice(self):
+        if not os.path.exists(self.caminho_indice):
+            return {}
+        with open(self.caminho_indice, encoding='utf-8') as f:
+            return json.load(f)
+
+    def _salvar_indice(self):
+        tmp = self.caminho_indice + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self._indice, f)
+        os.replace(tmp, self.caminho_indice)
+
+
+def chave_requisicao(url, params=None) -> str:
+    conteudo = json.dumps({'url': url, 'params': params or {}}, sort_keys=True)
+    return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def obter_cache() -> CacheDownloads:
+    """Retorna o cache de downloads compartilhado pelo processo."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CacheDownloads()
+        return _cache
+
+
+def baixar_com_cache(url, fonte, params=None, sha256_esperado=None) -> str:
+    return obter_cache().obter(url, fonte, params, sha256_esperado)
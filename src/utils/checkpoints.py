@@ -0,0 +1,146 @@
+import ast
+import hashlib
+import json
+import logging
+import os
+import time
+from functools import lru_cache
+
+# Etapas concluídas (impressão digital e hash das saídas) e hashes dos arquivos por tamanho e data de modificação
+CHECKPOINTS_PATH = os.environ.get('VALORIMOB_CHECKPOINTS_PATH', os.path.join('data', 'state', 'checkpoints.json'))
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Módulos que não alteram os artefatos: mudar a medição ou os logs não invalida nenhuma etapa
+CODIGO_IGNORADO = {'src.utils.instrumentacao', 'src.utils.logs'}
+
+TAMANHO_BLOCO = 1024 * 1024
+
+
+def _arquivo_modulo(modulo):
+    base = os.path.join(RAIZ, *modulo.split('.'))
+    for caminho in (base + '.py', os.path.join(base, '__init__.py')):
+        if os.path.exists(caminho):
+            return caminho
+    return None
+
+
+@lru_cache(maxsize=None)
+def _imports_locais(modulo) -> tuple:
+    """Módulos `src.*` importados por `modulo`, inclusive os importados dentro de funções."""
+    with open(_arquivo_modulo(modulo), encoding='utf-8') as f:
+        arvore = ast.parse(f.read())
+    nomes = set()
+    for no in ast.walk(arvore):
+        if isinstance(no, ast.Import):
+            nomes.update(alias.name for alias in no.names)
+        elif isinstance(no, ast.ImportFrom) and no.module and no.level == 0:
+            nomes.add(no.module)
+            # `from src.models import treino` importa o submódulo treino
+            nomes.update(f'{no.module}.{alias.name}' for alias in no.names)
+    return tuple(sorted(n for n in nomes if n.split('.')[0] == 'src' and _arquivo_modulo(n)))
+
+
+@lru_cache(maxsize=None)
+def versao_codigo(modulo) -> dict:
+    """Hash do código-fonte do módulo e de todos os módulos do projeto que ele importa, direta ou indiretamente."""
+    versoes, pilha = {}, [modulo]
+    while pilha:
+        atual = pilha.pop()
+        if atual in versoes or atual in CODIGO_IGNORADO:
+            continue
+        with open(_arquivo_modulo(atual), 'rb') as f:
+            versoes[atual] = hashlib.sha256(f.read()).hexdigest()
+        pilha.extend(_imports_locais(atual))
+    return dict(sorted(versoes.items()))
+
+
+class Checkpoints:
+    """Checkpoints das etapas do pipeline.
+
+    A impressão digital de uma etapa junta o hash do conteúdo das entradas,
+    a versão do código do módulo (e dos módulos do projeto que ele importa)
+    e os parâmetros de ambiente declarados. Uma etapa é pulada quando a
+    impressão é a mesma do último checkpoint e as saídas continuam as que
+    ela gravou. O hash de um arquivo só é recalculado quando seu tamanho ou
+    data de modificação mudam.
+    """
+
+    def __init__(self, caminho=CHECKPOINTS_PATH):
+        self.caminho = caminho
+        self.etapas, self.arquivos = {}, {}
+        if os.path.exists(caminho):
+            with open(caminho, encoding='utf-8') as f:
+                estado = json.load(f)
+            self.etapas, self.arquivos = estado.get('etapas', {}), estado.get('arquivos', {})
+
+    def hash_arquivo(self, caminho):
+        if not os.path.exists(caminho):
+            return None
+        if os.path.isdir(caminho):
+            conteudo = hashlib.sha256()
+            for pasta, _, arquivos in sorted(os.walk(caminho)):
+                for nome in sorted(arquivos):
+                    completo = os.path.join(pasta, nome)
+                    conteudo.update(f'{os.path.relpath(completo, caminho)}:{self.hash_arquivo(completo)}\n'.encode())
+            return conteudo.hexdigest()
+
+        stat = os.stat(caminho)
+        conhecido = self.arquivos.get(caminho)
+        if conhecido and conhecido['tamanho'] == stat.st_size and conhecido['mtime_ns'] == stat.st_mtime_ns:
+            return conhecido['sha256']
+        conteudo = hashlib.sha256()
+        with open(caminho, 'rb') as f:
+            while bloco := f.read(TAMANHO_BLOCO):
+                conteudo.update(bloco)
+        self.arquivos[caminho] = {'tamanho': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': conteudo.hexdigest()}
+        return conteudo.hexdigest()
+
+    def componentes(self, etapa) -> dict:
+        return {
+            'funcao': etapa.funcao,
+            'codigo': versao_codigo(etapa.modulo),
+            'parametros': {nome: os.environ.get(nome) for nome in etapa.parametros},
+            'entradas': {entrada: self.hash_arquivo(entrada) for entrada in etapa.entradas},
+        }
+
+    def motivo_execucao(self, etapa, componentes, agora=None):
+        """Por que a etapa precisa rodar, ou None se o checkpoint ainda vale."""
+        anterior = self.etapas.get(etapa.nome)
+        if anterior is None:
+            return 'sem checkpoint'
+        for parte in ('funcao', 'codigo', 'parametros', 'entradas'):
+            if anterior['componentes'][parte] != componentes[parte]:
+                if isinstance(componentes[parte], dict):
+                    mudancas = sorted(k for k in set(componentes[parte]) | set(anterior['componentes'][parte])
+                                      if componentes[parte].get(k) != anterior['componentes'][parte].get(k))
+                    return f'{parte} alterado(s): {", ".join(mudancas)}'
+                return f'{parte} alterado(s)'
+        alteradas = [s for s, h in anterior['saidas'].items() if self.hash_arquivo(s) != h]
+        if alteradas:
+            return f'saídas alteradas ou ausentes: {", ".join(alteradas)}'
+        if etapa.validade_s is not None and (agora or time.time()) - anterior['concluida_em'] > etapa.validade_s:
+            return f'checkpoint com mais de {etapa.validade_s / 3600:.0f} h (fontes externas)'
+        return None
+
+    def registrar(self, etapa, componentes):
+        self.etapas[etapa.nome] = {
+            'componentes': componentes,
+            'saidas': {saida: self.hash_arquivo(saida) for saida in etapa.saidas},
+            'concluida_em': time.time(),
+        }
+        self.salvar()
+
+    def invalidar(self, nome):
+        if self.etapas.pop(nome, None) is not None:
+            self.salvar()
+
+    def salvar(self):
+        """Grava o estado atomicamente: uma interrupção nunca deixa um checkpoint pela metade."""
+        os.makedirs(os.path.dirname(self.caminho) or '.', exist_ok=True)
+        arquivos = {c: a for c, a in self.arquivos.items() if os.path.exists(c)}
+        tmp = self.caminho + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'etapas': self.etapas, 'arquivos': arquivos}, f, indent=2)
+        os.replace(tmp, self.caminho)
+        logging.debug(f'Checkpoints gravados em {self.caminho}')
@@ -0,0 +1,147 @@
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from src.utils.instrumentacao import contar, no_contexto_atual, trecho
+
+# Endpoint alternativo compatível com S3 (MinIO, moto server) para testes locais
+S3_ENDPOINT_URL = os.environ.get('VALORIMOB_S3_ENDPOINT')
+
+# Tamanho de cada parte no upload multipart e número de partes enviadas em paralelo
+TAMANHO_PARTE = int(os.environ.get('VALORIMOB_S3_PART_SIZE', 16 * 1024 * 1024))
+MAX_CONCORRENCIA = int(os.environ.get('VALORIMOB_S3_CONCURRENCY', 8))
+
+# Uploads de arquivos diferentes rodando em segundo plano ao mesmo tempo
+MAX_UPLOADS_SIMULTANEOS = 4
+
+TAMANHO_BLOCO = 1024 * 1024
+
+_cliente = None
+_executor = None
+_pendentes = []
+_lock = threading.Lock()
+
+
+def obter_cliente():
+    """Cliente S3 compartilhado pelo processo, com pool de conexões dimensionado para os uploads."""
+    global _cliente
+    with _lock:
+        if _cliente is None:
+            # O boto3 só é importado no primeiro envio: etapas que não enviam nada não pagam a importação
+            import boto3
+            from botocore.config import Config
+            _cliente = boto3.client(
+                's3',
+                endpoint_url=S3_ENDPOINT_URL,
+                config=Config(
+                    max_pool_connections=MAX_CONCORRENCIA * MAX_UPLOADS_SIMULTANEOS,
+                    retries={'max_attempts': 5, 'mode': 'adaptive'},
+                ),
+            )
+        return _cliente
+
+
+def config_transferencia():
+    from boto3.s3.transfer import TransferConfig
+    return TransferConfig(
+        multipart_threshold=TAMANHO_PARTE,
+        multipart_chunksize=TAMANHO_PARTE,
+        max_concurrency=MAX_CONCORRENCIA,
+        use_threads=True,
+    )
+
+
+def assinaturas_arquivo(caminho, tamanho_parte=TAMANHO_PARTE):
+    """Calcula numa só leitura o SHA-256 e o ETag que o S3 atribuiria ao arquivo.
+
+    Para uploads multipart, o ETag é o MD5 da concatenação dos MD5 de cada
+    parte, seguido de `-<número de partes>`.
+    """
+    sha256 = hashlib.sha256()
+    md5_total = hashlib.md5()
+    md5_partes = []
+    md5_parte = hashlib.md5()
+    lidos_parte = 0
+    tamanho = os.path.getsize(caminho)
+    with open(caminho, 'rb') as f:
+        while bloco := f.read(TAMANHO_BLOCO):
+            sha256.update(bloco)
+            md5_total.update(bloco)
+            while bloco:
+                resto = tamanho_parte - lidos_parte
+                trecho, bloco = bloco[:resto], bloco[resto:]
+                md5_parte.update(trecho)
+                lidos_parte += len(trecho)
+                if lidos_parte == tamanho_parte:
+                    md5_partes.append(md5_parte.digest())
+                    md5_parte, lidos_parte = hashlib.md5(), 0
+    if lidos_parte:
+        md5_partes.append(md5_parte.digest())
+
+    if tamanho < tamanho_parte:
+        etag = md5_total.hexdigest()
+    else:
+        etag = f"{hashlib.md5(b''.join(md5_partes)).hexdigest()}-{len(md5_partes)}"
+    return sha256.hexdigest(), etag
+
+
+def inalterado_no_destino(bucket, key, sha256, etag) -> bool:
+    from botocore.exceptions import ClientError
+    try:
+        remoto = obter_cliente().head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return False
+        raise
+    if remoto.get('Metadata', {}).get('sha256') == sha256:
+        return True
+    return remoto.get('ETag', '').strip('"') == etag
+
+
+def enviar_arquivo(caminho, bucket, key) -> bool:
+    """Envia o arquivo para s3://bucket/key, pulando o envio se o conteúdo remoto for idêntico.
+
+    Retorna True quando o arquivo foi de fato enviado.
+    """
+    with trecho('envio_s3', destino=f's3://{bucket}/{key}'):
+        sha256, etag = assinaturas_arquivo(caminho)
+        if inalterado_no_destino(bucket, key, sha256, etag):
+            logging.info(f"S3: s3://{bucket}/{key} já está atualizado, envio ignorado")
+            contar(envios_ignorados=1)
+            return False
+
+        obter_cliente().upload_file(
+            caminho, bucket, key,
+            ExtraArgs={'Metadata': {'sha256': sha256}},
+            Config=config_transferencia(),
+        )
+        logging.info(f"S3: upload concluído s3://{bucket}/{key}")
+        contar(bytes_enviados=os.path.getsize(caminho))
+        return True
+
+
+def enviar_em_segundo_plano(caminho, bucket, key):
+    """Agenda o envio e retorna imediatamente um Future; use `aguardar_envios` para esperar."""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_UPLOADS_SIMULTANEOS, thread_name_prefix='upload-s3')
+        # O envio é medido dentro do trecho da etapa que o agendou
+        futuro = _executor.submit(no_contexto_atual(enviar_arquivo), caminho, bucket, key)
+        _pendentes.append(futuro)
+    futuro.add_done_callback(lambda f: f.exception() and logging.error(
+        f"S3: erro ao enviar {caminho} para s3://{bucket}/{key}: {f.exception()}"))
+    return futuro
+
+
+def aguardar_envios():
+    """Espera os uploads em segundo plano; levanta erro se algum tiver falhado."""
+    with _lock:
+        futuros = list(_pendentes)
+        _pendentes.clear()
+    wait(futuros)
+    falhas = [f.exception() for f in futuros if f.exception()]
+    if falhas:
+        raise RuntimeError(f"{len(falhas)} upload(s) para o S3 falharam") from falhas[0]
@@ -0,0 +1,59 @@
+import os
+import subprocess
+import sys
+from functools import lru_cache
+
+# Pacotes mais pesados listados por módulo no relatório
+MAX_PACOTES = 5
+# Pacotes abaixo disto não aparecem (ficam dentro do ruído da medição)
+MIN_PACOTE_US = 5000
+
+
+def _importtime(codigo, raiz):
+    processo = subprocess.run([sys.executable, '-X', 'importtime', '-c', codigo], capture_output=True, text=True, cwd=raiz)
+    linhas = []
+    for linha in processo.stderr.splitlines():
+        if linha.startswith('import time:') and 'cumulative' not in linha:
+            _, acumulado, nome = linha[len('import time:'):].split('|')
+            linhas.append((nome.strip(), int(acumulado)))
+    return processo, linhas
+
+
+@lru_cache(maxsize=None)
+def _importados_na_partida(raiz):
+    """Módulos que o interpretador carrega antes de qualquer import (site, .pth)."""
+    return frozenset(nome for nome, _ in _importtime('pass', raiz)[1])
+
+
+def medir_importacao(modulo, raiz=None) -> dict:
+    """Importa `modulo` num interpretador novo com `-X importtime` e resume o custo.
+
+    Um processo por medição: os módulos já carregados pelo processo atual
+    não entram na conta, nem os que o interpretador carrega na partida.
+    Retorna o tempo total e os pacotes de terceiros mais caros (tempo
+    acumulado, incluindo suas próprias dependências).
+    """
+    raiz = raiz or os.getcwd()
+    processo, linhas = _importtime(f'import {modulo}', raiz)
+    if processo.returncode != 0:
+        erro = processo.stderr.strip().splitlines()
+        return {'modulo': modulo, 'total_s': None, 'pacotes': [], 'erro': erro[-1] if erro else 'falha'}
+
+    partida = _importados_na_partida(raiz)
+    total_us, pacotes = 0, {}
+    for nome, acumulado in linhas:
+        if nome == modulo:
+            total_us = acumulado
+        raiz_pacote = nome.split('.')[0]
+        if (nome not in partida and raiz_pacote not in sys.stdlib_module_names
+                and raiz_pacote != modulo.split('.')[0]):
+            pacotes[raiz_pacote] = max(pacotes.get(raiz_pacote, 0), acumulado)
+
+    pacotes = {nome: us for nome, us in pacotes.items() if us >= MIN_PACOTE_US}
+    mais_caros = sorted(pacotes.items(), key=lambda item: item[1], reverse=True)[:MAX_PACOTES]
+    return {
+        'modulo': modulo,
+        'total_s': total_us / 1e6,
+        'pacotes': [(nome, us / 1e6) for nome, us in mais_caros],
+        'erro': None,
+    }
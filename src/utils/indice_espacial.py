@@ -0,0 +1,84 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+import shapely
+
+# Índices persistidos entre execuções, um arquivo por camada e versão das fontes
+INDICES_DIR = os.environ.get('VALORIMOB_INDICES_DIR', os.path.join('data', 'cache', 'indices'))
+
+
+class IndiceEspacial:
+    """STRtree sobre uma camada de polígonos com os atributos de cada polígono."""
+
+    def __init__(self, geometrias, atributos: pd.DataFrame):
+        self.geometrias = np.asarray(geometrias, dtype=object)
+        self.atributos = atributos.reset_index(drop=True)
+        self.arvore = shapely.STRtree(self.geometrias)
+
+    def localizar(self, x, y) -> pd.DataFrame:
+        """Atributos do polígono que contém cada ponto (x=longitude, y=latitude).
+
+        A consulta é feita de uma vez para todos os pontos. Pontos sem
+        coordenada ou fora de todos os polígonos ficam com atributos nulos;
+        se houver sobreposição, vale o primeiro polígono da camada.
+        """
+        x = np.asarray(x, dtype='float64')
+        y = np.asarray(y, dtype='float64')
+        validos = np.flatnonzero(~(np.isnan(x) | np.isnan(y)))
+        pontos = shapely.points(x[validos], y[validos])
+        idx_ponto, idx_poligono = self.arvore.query(pontos, predicate='within')
+
+        # Em caso de sobreposição, fica o polígono de menor índice para cada ponto
+        ordem = np.lexsort((idx_poligono, idx_ponto))
+        idx_ponto, idx_poligono = idx_ponto[ordem], idx_poligono[ordem]
+        _, primeiros = np.unique(idx_ponto, return_index=True)
+
+        posicao = np.full(len(x), -1, dtype=np.int64)
+        posicao[validos[idx_ponto[primeiros]]] = idx_poligono[primeiros]
+        # -1 não existe no índice dos atributos e vira uma linha nula
+        return self.atributos.reindex(posicao).reset_index(drop=True)
+
+
+def impressao_fontes(caminhos) -> str:
+    """Identifica a versão das fontes pelo caminho, tamanho e data de modificação de cada arquivo."""
+    estado = []
+    for caminho in sorted(caminhos):
+        info = os.stat(caminho)
+        estado.append([os.path.abspath(caminho), info.st_size, info.st_mtime_ns])
+    return hashlib.sha256(json.dumps(estado).encode()).hexdigest()[:16]
+
+
+def carregar_indice(nome, fontes, construir):
+    """Retorna o índice `nome` persistido para a versão atual das `fontes`.
+
+    O índice é o objeto devolvido por `construir`, desde que serializável
+    com joblib. Só vale para objetos cuja forma serializada carrega mais
+    rápido do que se constrói, como os arrays das BallTrees de proximidade;
+    um `IndiceEspacial` não: o STRtree é serializado como as suas geometrias
+    e reconstruído ao carregar.
+
+    `construir()` só é chamada quando alguma fonte mudou desde a última
+    execução; o índice novo é gravado e as versões antigas são removidas.
+    """
+    impressao = impressao_fontes(fontes)
+    caminho = os.path.join(INDICES_DIR, f'{nome}_{impressao}.joblib')
+    if os.path.exists(caminho):
+        logging.info(f'Índice espacial {nome} carregado de {caminho}')
+        return joblib.load(caminho)
+
+    indice = construir()
+    os.makedirs(INDICES_DIR, exist_ok=True)
+    tmp = caminho + '.tmp'
+    joblib.dump(indice, tmp)
+    os.replace(tmp, caminho)
+    for antigo in glob.glob(os.path.join(INDICES_DIR, f'{nome}_*.joblib')):
+        if antigo != caminho:
+            os.remove(antigo)
+    logging.info(f'Índice espacial {nome} construído e salvo em {caminho}')
+    return indice
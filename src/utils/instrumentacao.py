@@ -0,0 +1,304 @@
+import contextvars
+import functools
+import glob
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Manifestos JSON de cada execução do pipeline e o resumo acumulado por etapa
+RUNS_DIR = os.environ.get('VALORIMOB_RUNS_DIR', os.path.join('data', 'runs'))
+# Arquivo no formato texto do Prometheus (coletor textfile do node_exporter)
+PROMETHEUS_PATH = os.environ.get('VALORIMOB_PROMETHEUS_PATH', os.path.join(RUNS_DIR, 'valorimob.prom'))
+MANIFESTOS_MANTIDOS = 50
+# Intervalo da amostragem da memória residente enquanto há trechos abertos
+AMOSTRAGEM_MEMORIA_S = 0.05
+
+# Contadores acumulados nos trechos e exportados por etapa
+CONTADORES = {
+    'linhas_entrada': 'Linhas lidas',
+    'linhas_saida': 'Linhas gravadas',
+    'bytes_gravados': 'Bytes gravados em disco',
+    'bytes_baixados': 'Bytes baixados (HTTP e FTP)',
+    'bytes_enviados': 'Bytes enviados ao S3',
+    'envios_ignorados': 'Envios ao S3 pulados por conteúdo inalterado',
+    'cache_acertos': 'Downloads atendidos pelo cache sem baixar o conteúdo',
+    'cache_falhas': 'Downloads que precisaram baixar o conteúdo',
+}
+
+_atual = contextvars.ContextVar('trecho_atual', default=None)
+_lock = threading.Lock()
+# Trechos abertos, que recebem as amostras de memória; o amostrador dorme enquanto não houver nenhum
+_abertos = set()
+_ha_abertos = threading.Condition(_lock)
+_amostrador = None
+
+
+def pico_memoria_bytes() -> int:
+    """Pico de memória residente do processo desde o início (o benchmark roda cada etapa num processo novo).
+
+    Usa o VmHWM de /proc, que recomeça a cada exec; o ru_maxrss herda o pico
+    do processo pai através do fork e só é usado fora do Linux.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            return next(int(linha.split()[1]) * 1024 for linha in f if linha.startswith('VmHWM:'))
+    except (OSError, StopIteration):
+        import resource
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pico if sys.platform == 'darwin' else pico * 1024
+
+
+def memoria_residente_bytes():
+    """Memória residente atual do processo (None se não houver como medir)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+def _registrar_amostra():
+    rss = memoria_residente_bytes()
+    if rss is None:
+        return
+    with _lock:
+        for aberto in _abertos:
+            aberto.pico_rss_bytes = max(aberto.pico_rss_bytes or 0, rss)
+
+
+def _amostrar():
+    while True:
+        with _ha_abertos:
+            _ha_abertos.wait_for(lambda: _abertos)
+        _registrar_amostra()
+        time.sleep(AMOSTRAGEM_MEMORIA_S)
+
+
+def _abrir(atual):
+    global _amostrador
+    with _ha_abertos:
+        _abertos.add(atual)
+        if _amostrador is None:
+            _amostrador = threading.Thread(target=_amostrar, name='amostrador-memoria', daemon=True)
+            _amostrador.start()
+        _ha_abertos.notify()
+    _registrar_amostra()
+
+
+def _fechar(atual):
+    _registrar_amostra()
+    with _lock:
+        _abertos.discard(atual)
+
+
+def _cpu_processo():
+    # Inclui processos filhos já encerrados (workers do joblib)
+    return sum(os.times()[:4])
+
+
+class Trecho:
+    """Trecho medido do pipeline: tempo de parede, CPU, pico de memória e contadores.
+
+    `cpu_s` é o tempo de CPU da thread que abriu o trecho; `cpu_processo_s`
+    é o do processo inteiro no mesmo intervalo, que inclui threads nativas
+    e workers, mas também as etapas que rodaram em paralelo. O mesmo vale
+    para `pico_rss_bytes`: a maior memória residente do processo amostrada
+    durante o trecho (no início, no fim e a cada `AMOSTRAGEM_MEMORIA_S`).
+    """
+
+    def __init__(self, nome, atributos):
+        self.nome = nome
+        self.atributos = atributos
+        self.filhos = []
+        self.contadores = {}
+        self.thread = threading.get_ident()
+        self.inicio = time.time()
+        self.duracao_s = self.cpu_s = self.cpu_processo_s = self.pico_rss_bytes = None
+        self.erro = None
+        self._relogio = time.perf_counter()
+        self._cpu = time.thread_time()
+        self._cpu_processo = _cpu_processo()
+        _abrir(self)
+
+    def encerrar(self, erro=None):
+        self.duracao_s = time.perf_counter() - self._relogio
+        self.cpu_s = time.thread_time() - self._cpu
+        self.cpu_processo_s = _cpu_processo() - self._cpu_processo
+        _fechar(self)
+        self.erro = erro
+
+    def contar(self, **valores):
+        with _lock:
+            for nome, valor in valores.items():
+                self.contadores[nome] = self.contadores.get(nome, 0) + valor
+
+    def totais(self) -> dict:
+        """Contadores deste trecho somados aos de todos os trechos internos."""
+        with _lock:
+            totais = dict(self.contadores)
+            filhos = list(self.filhos)
+        for filho in filhos:
+            for nome, valor in filho.totais().items():
+                totais[nome] = totais.get(nome, 0) + valor
+        return totais
+
+    def cpu_total_s(self) -> float:
+        """CPU da thread do trecho mais a dos trechos internos que rodaram em outras threads."""
+        return (self.cpu_s or 0) + self._cpu_outras_threads()
+
+    def _cpu_outras_threads(self):
+        total = 0.0
+        for filho in list(self.filhos):
+            if filho.thread != self.thread:
+                total += filho.cpu_s or 0
+            total += filho._cpu_outras_threads()
+        return total
+
+    def resumo(self) -> dict:
+        totais = self.totais()
+        consultas = totais.get('cache_acertos', 0) + totais.get('cache_falhas', 0)
+        return {
+            'status': 'erro' if self.erro else 'ok',
+            'duracao_s': self.duracao_s,
+            'cpu_s': self.cpu_total_s(),
+            'cpu_processo_s': self.cpu_processo_s,
+            'pico_rss_bytes': self.pico_rss_bytes,
+            **totais,
+            'taxa_acertos_cache': totais.get('cache_acertos', 0) / consultas if consultas else None,
+        }
+
+    def como_dict(self, origem=None) -> dict:
+        origem = self.inicio if origem is None else origem
+        return {
+            'nome': self.nome,
+            **({'atributos': self.atributos} if self.atributos else {}),
+            'inicio_s': round(self.inicio - origem, 6),
+            'duracao_s': self.duracao_s,
+            'cpu_s': self.cpu_s,
+            'pico_rss_bytes': self.pico_rss_bytes,
+            **({'contadores': self.contadores} if self.contadores else {}),
+            **({'erro': self.erro} if self.erro else {}),
+            **({'filhos': [f.como_dict(origem) for f in self.filhos]} if self.filhos else {}),
+        }
+
+
+@contextmanager
+def trecho(nome, **atributos):
+    """Mede o bloco como um trecho dentro do trecho corrente (o da etapa, da execução...)."""
+    pai = _atual.get()
+    atual = Trecho(nome, atributos)
+    if pai is not None:
+        with _lock:
+            pai.filhos.append(atual)
+    token = _atual.set(atual)
+    erro = None
+    try:
+        yield atual
+    except BaseException as e:
+        erro = f'{type(e).__name__}: {e}'
+        raise
+    finally:
+        atual.encerrar(erro)
+        _atual.reset(token)
+
+
+def contar(**valores):
+    """Soma os valores aos contadores do trecho corrente; fora de um trecho não faz nada."""
+    atual = _atual.get()
+    if atual is not None:
+        atual.contar(**valores)
+
+
+def no_contexto_atual(funcao):
+    """Vincula `funcao` ao trecho corrente, para rodar em outra thread (executores, uploads)."""
+    return functools.partial(contextvars.copy_context().run, funcao)
+
+
+def _gravar_json(caminho, dados):
+    tmp = caminho + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(dados, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, caminho)
+
+
+def _etapas(execucao):
+    return {f.atributos['etapa']: f for f in execucao.filhos if f.nome == 'etapa'}
+
+
+def manifesto(execucao) -> dict:
+    return {
+        'execucao': datetime.fromtimestamp(execucao.inicio, timezone.utc).strftime('%Y%m%dT%H%M%S%fZ'),
+        'inicio': datetime.fromtimestamp(execucao.inicio, timezone.utc).isoformat(),
+        **execucao.resumo(),
+        'etapas': {nome: etapa.resumo() for nome, etapa in _etapas(execucao).items()},
+        'trechos': execucao.como_dict(),
+    }
+
+
+def gravar_execucao(execucao, diretorio=RUNS_DIR, prometheus_path=PROMETHEUS_PATH) -> str:
+    """Grava o manifesto da execução, atualiza o resumo por etapa e o arquivo do Prometheus.
+
+    Etapas fora desta execução mantêm as métricas da última vez que rodaram.
+    """
+    os.makedirs(diretorio, exist_ok=True)
+    dados = manifesto(execucao)
+    caminho = os.path.join(diretorio, f"execucao_{dados['execucao']}.json")
+    _gravar_json(caminho, dados)
+    _gravar_json(os.path.join(diretorio, 'ultima_execucao.json'), dados)
+    for antigo in sorted(glob.glob(os.path.join(diretorio, 'execucao_*.json')))[:-MANIFESTOS_MANTIDOS]:
+        os.remove(antigo)
+
+    caminho_etapas = os.path.join(diretorio, 'etapas.json')
+    etapas = {}
+    if os.path.exists(caminho_etapas):
+        with open(caminho_etapas, encoding='utf-8') as f:
+            etapas = json.load(f)
+    for nome, etapa in _etapas(execucao).items():
+        etapas[nome] = dict(dados['etapas'][nome], fim=etapa.inicio + etapa.duracao_s)
+    _gravar_json(caminho_etapas, etapas)
+
+    if prometheus_path:
+        os.makedirs(os.path.dirname(prometheus_path) or '.', exist_ok=True)
+        tmp = prometheus_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(texto_prometheus(dados, etapas))
+        os.replace(tmp, prometheus_path)
+    logging.info(f"Manifesto da execução gravado em {caminho}")
+    return caminho
+
+
+def texto_prometheus(dados, etapas) -> str:
+    metricas = [
+        ('valorimob_execucao_duracao_segundos', 'Duração da última execução do pipeline', {'': dados['duracao_s']}),
+        ('valorimob_execucao_sucesso', 'Última execução terminou sem erro', {'': int(dados['status'] == 'ok')}),
+        ('valorimob_execucao_fim_timestamp_segundos', 'Fim da última execução',
+         {'': datetime.fromisoformat(dados['inicio']).timestamp() + dados['duracao_s']}),
+    ]
+    por_etapa = [
+        ('duracao_segundos', 'duracao_s', 'Duração da última execução da etapa'),
+        ('cpu_segundos', 'cpu_s', 'Tempo de CPU das threads da etapa'),
+        ('pico_rss_bytes', 'pico_rss_bytes', 'Maior memória residente do processo amostrada durante a etapa'),
+        ('fim_timestamp_segundos', 'fim', 'Fim da última execução da etapa'),
+    ] + [(nome, nome, descricao) for nome, descricao in CONTADORES.items()]
+    for sufixo, campo, descricao in por_etapa:
+        valores = {f'etapa="{nome}"': resumo.get(campo, 0) for nome, resumo in sorted(etapas.items())}
+        metricas.append((f'valorimob_etapa_{sufixo}', descricao, valores))
+    metricas.append(('valorimob_etapa_sucesso', 'Última execução da etapa terminou sem erro',
+                     {f'etapa="{nome}"': int(r['status'] == 'ok') for nome, r in sorted(etapas.items())}))
+
+    linhas = []
+    for nome, descricao, valores in metricas:
+        linhas += [f'# HELP {nome} {descricao}', f'# TYPE {nome} gauge']
+        linhas += [f'{nome}{{{rotulos}}} {valor}' if rotulos else f'{nome} {valor}'
+                   for rotulos, valor in valores.items() if valor is not None]
+    return '\n'.join(linhas) + '\n'
@@ -0,0 +1,11 @@
+import logging
+import os
+
+FORMATO = '%(asctime)s — %(levelname)s — %(message)s'
+# VALORIMOB_LOG_NIVEL=DEBUG (ou WARNING...) ajusta o nível de todos os comandos
+NIVEL = os.environ.get('VALORIMOB_LOG_NIVEL', 'INFO')
+
+
+def configurar_logs(nivel=NIVEL):
+    """Configura o logging do processo; chamado pelos pontos de entrada, nunca na importação de um módulo."""
+    logging.basicConfig(level=nivel, format=FORMATO)
@@ -0,0 +1,151 @@
+import ftplib
+import json
+import logging
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+from src.utils.instrumentacao import contar, trecho
+
+TIMEOUT_FTP = 60
+MAX_TENTATIVAS_FTP = 3
+
+
+class PoolFTP:
+    """Pool de conexões FTP anônimas, reutilizadas entre downloads e threads."""
+
+    def __init__(self, host, tamanho=4, timeout=TIMEOUT_FTP):
+        self.host = host
+        self.timeout = timeout
+        self._livres = queue.LifoQueue()
+        self._vagas = threading.BoundedSemaphore(tamanho)
+
+    @contextmanager
+    def conexao(self):
+        self._vagas.acquire()
+        try:
+            ftp = self._pegar_livre() or self._conectar()
+            try:
+                yield ftp
+            except ftplib.all_errors:
+                # Conexão possivelmente corrompida: descarta em vez de devolver ao pool
+                _fechar(ftp)
+                raise
+            else:
+                self._livres.put(ftp)
+        finally:
+            self._vagas.release()
+
+    def fechar(self):
+        while True:
+            try:
+                _fechar(self._livres.get_nowait())
+            except queue.Empty:
+                return
+
+    def _pegar_livre(self):
+        while True:
+            try:
+                ftp = self._livres.get_nowait()
+            except queue.Empty:
+                return None
+            try:
+                ftp.voidcmd('NOOP')
+                return ftp
+            except ftplib.all_errors:
+                _fechar(ftp)
+
+    def _conectar(self):
+        ftp = ftplib.FTP(self.host, timeout=self.timeout)
+        ftp.login()
+        return ftp
+
+
+def _fechar(ftp):
+    try:
+        ftp.quit()
+    except ftplib.all_errors:
+        ftp.close()
+
+
+def _ler_meta(caminho):
+    if not os.path.exists(caminho):
+        return {}
+    with open(caminho, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _gravar_meta(caminho, meta):
+    with open(caminho + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(caminho + '.tmp', caminho)
+
+
+def _metadados_remotos(ftp, remoto):
+    ftp.voidcmd('TYPE I')
+    tamanho = ftp.size(remoto)
+    try:
+        mdtm = ftp.voidcmd(f'MDTM {remoto}')[4:].strip()
+    except ftplib.error_perm:
+        mdtm = None
+    return {'tamanho': tamanho, 'mdtm': mdtm}
+
+
+def arquivo_completo(destino, remoto_meta) -> bool:
+    """Confere o arquivo local contra o SIZE/MDTM registrados quando foi baixado."""
+    if not os.path.exists(destino) or os.path.getsize(destino) != remoto_meta['tamanho']:
+        return False
+    local_meta = _ler_meta(destino + '.meta.json')
+    return local_meta.get('mdtm') == remoto_meta['mdtm']
+
+
+def baixar_arquivo_ftp(pool, remoto, destino, max_tentativas=MAX_TENTATIVAS_FTP) -> str:
+    """Baixa `remoto` para `destino` com retomada (REST) e troca atômica do arquivo final.
+
+    Os bytes vão para `destino.part`; após uma falha, a próxima tentativa
+    continua do tamanho já gravado. O arquivo final só aparece depois de
+    conferido o tamanho informado pelo servidor.
+    """
+    with trecho('download_ftp', arquivo=remoto):
+        return _baixar_arquivo_ftp(pool, remoto, destino, max_tentativas)
+
+
+def _baixar_arquivo_ftp(pool, remoto, destino, max_tentativas):
+    parcial = destino + '.part'
+    for tentativa in range(1, max_tentativas + 1):
+        try:
+            with pool.conexao() as ftp:
+                remoto_meta = _metadados_remotos(ftp, remoto)
+                if arquivo_completo(destino, remoto_meta):
+                    logging.info(f"{os.path.basename(destino)} já está completo localmente.")
+                    return destino
+
+                # Descarta parciais de uma versão anterior do arquivo remoto
+                if _ler_meta(parcial + '.meta.json') != remoto_meta and os.path.exists(parcial):
+                    os.remove(parcial)
+                _gravar_meta(parcial + '.meta.json', remoto_meta)
+
+                offset = os.path.getsize(parcial) if os.path.exists(parcial) else 0
+                if offset:
+                    logging.info(f"Retomando {remoto} a partir do byte {offset}")
+                with open(parcial, 'ab') as f:
+                    if offset < remoto_meta['tamanho']:
+                        ftp.retrbinary(f'RETR {remoto}', f.write, rest=offset or None)
+                contar(bytes_baixados=os.path.getsize(parcial) - offset)
+        except ftplib.all_errors as e:
+            if tentativa == max_tentativas:
+                raise
+            logging.warning(f"Falha ao baixar {remoto} (tentativa {tentativa}): {e}")
+            continue
+
+        if os.path.getsize(parcial) != remoto_meta['tamanho']:
+            os.remove(parcial)
+            logging.warning(f"Tamanho divergente em {remoto}; download será refeito")
+            continue
+
+        os.replace(parcial, destino)
+        os.replace(parcial + '.meta.json', destino + '.meta.json')
+        return destino
+
+    raise IOError(f"Não foi possível baixar {remoto} após {max_tentativas} tentativas")
@@ -0,0 +1,114 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.utils.instrumentacao import no_contexto_atual
+
+# Tempo máximo (conexão, leitura) de cada requisição, em segundos
+TIMEOUT_PADRAO = (10, 60)
+
+# Retentativas com backoff exponencial e jitter
+MAX_TENTATIVAS = 4
+BACKOFF_BASE = 1.0
+BACKOFF_MAXIMO = 30.0
+STATUS_RETENTAVEIS = {429, 500, 502, 503, 504}
+
+# Concorrência e limite de requisições por segundo em cada host
+MAX_WORKERS_PADRAO = 8
+TAXA_PADRAO = 5.0
+TAXAS_POR_HOST = {
+    'servicodados.ibge.gov.br': 4.0,
+}
+
+
+class LimitadorTaxa:
+    """Espaça as requisições de cada host para respeitar uma taxa máxima por segundo."""
+
+    def __init__(self, taxas_por_host=None, taxa_padrao=TAXA_PADRAO):
+        self.taxas_por_host = dict(taxas_por_host or {})
+        self.taxa_padrao = taxa_padrao
+        self._proxima_liberacao = {}
+        self._lock = threading.Lock()
+
+    def aguardar(self, url):
+        host = urlparse(url).netloc
+        taxa = self.taxas_por_host.get(host, self.taxa_padrao)
+        with self._lock:
+            agora = time.monotonic()
+            liberacao = max(agora, self._proxima_liberacao.get(host, 0.0))
+            self._proxima_liberacao[host] = liberacao + 1.0 / taxa
+        espera = liberacao - agora
+        if espera > 0:
+            time.sleep(espera)
+
+
+class ClienteHTTP:
+    """Sessão keep-alive compartilhada com timeout, limite de taxa e retentativas."""
+
+    def __init__(self, max_conexoes=MAX_WORKERS_PADRAO, taxas_por_host=None,
+                 timeout=TIMEOUT_PADRAO, max_tentativas=MAX_TENTATIVAS):
+        self.timeout = timeout
+        self.max_tentativas = max_tentativas
+        self.limitador = LimitadorTaxa(taxas_por_host or TAXAS_POR_HOST)
+        self.sessao = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=max_conexoes, pool_maxsize=max_conexoes)
+        self.sessao.mount('http://', adaptador)
+        self.sessao.mount('https://', adaptador)
+
+    def get(self, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        for tentativa in range(1, self.max_tentativas + 1):
+            self.limitador.aguardar(url)
+            try:
+                resp = self.sessao.get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if tentativa == self.max_tentativas:
+                    raise
+                logging.warning(f"Falha de rede em {url} (tentativa {tentativa}): {e}")
+                time.sleep(_tempo_backoff(tentativa))
+                continue
+
+            if resp.status_code in STATUS_RETENTAVEIS and tentativa < self.max_tentativas:
+                logging.warning(f"Status {resp.status_code} em {url} (tentativa {tentativa})")
+                resp.close()
+                time.sleep(_tempo_backoff(tentativa, resp.headers.get('Retry-After')))
+                continue
+
+            resp.raise_for_status()
+            return resp
+
+
+def _tempo_backoff(tentativa, retry_after=None):
+    """Backoff exponencial com jitter completo, respeitando Retry-After quando informado."""
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), BACKOFF_MAXIMO)
+    return random.uniform(0, min(BACKOFF_MAXIMO, BACKOFF_BASE * 2 ** tentativa))
+
+
+_cliente = None
+_cliente_lock = threading.Lock()
+
+
+def obter_cliente() -> ClienteHTTP:
+    """Retorna o cliente HTTP compartilhado pelo processo."""
+    global _cliente
+    with _cliente_lock:
+        if _cliente is None:
+            _cliente = ClienteHTTP()
+        return _cliente
+
+
+def mapear_em_paralelo(funcao, itens, max_workers=MAX_WORKERS_PADRAO):
+    """Aplica `funcao` a cada item com concorrência limitada, mantendo a ordem de entrada."""
+    itens = list(itens)
+    if not itens:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(itens))) as executor:
+        futuros = [executor.submit(no_contexto_atual(funcao), item) for item in itens]
+        return [futuro.result() for futuro in futuros]
@@ -0,0 +1,18 @@
+import os
+from zipfile import ZipFile
+
+
+def caminho_virtual_shapefile(caminho_zip: str, prefixo_nome: str = '') -> str:
+    """Retorna o caminho virtual `zip://` do primeiro .shp do arquivo, sem extraí-lo.
+
+    O caminho pode ser passado diretamente para `geopandas.read_file`, que lê
+    o shapefile de dentro do zip.
+    """
+    with ZipFile(caminho_zip) as z:
+        nomes = sorted(
+            nome for nome in z.namelist()
+            if nome.lower().endswith('.shp') and os.path.basename(nome).startswith(prefixo_nome)
+        )
+    if not nomes:
+        raise FileNotFoundError(f"Arquivo .shp não encontrado em {caminho_zip}")
+    return f"zip://{os.path.abspath(caminho_zip)}!{nomes[0]}"
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import duckdb
+import pandas as pd
+
+SNAPSHOT_DIR = os.environ.get('VALORIMOB_SNAPSHOT_DIR', os.path.join('data', 'cache', 'snapshots'))
+# Intervalo mínimo entre consultas à versão publicada; a consulta lê só metadados, nunca a tabela
+INTERVALO_VERIFICACAO_S = float(os.environ.get('VALORIMOB_SNAPSHOT_VERIFICACAO_S', 300))
+
+
+class Snapshot:
+    """Cópia local em Parquet de uma tabela publicada no warehouse, renovada só quando a versão muda.
+
+    A tabela é exportada inteira uma vez por versão, ordenada por `ordem`,
+    e as consultas rodam num DuckDB em memória sobre o arquivo: só as
+    colunas pedidas são lidas, os filtros pulam os grupos de linhas fora da
+    faixa e o LIMIT corta o resultado antes de chegar ao pandas. O warehouse
+    só é varrido quando uma nova carga é publicada.
+    """
+
+    def __init__(self, warehouse, tabela, ordem=(), diretorio=SNAPSHOT_DIR,
+                 intervalo_verificacao=INTERVALO_VERIFICACAO_S):
+        self.warehouse = warehouse
+        self.tabela = tabela
+        self.ordem = tuple(ordem)
+        self.diretorio = os.path.join(diretorio, tabela)
+        self.intervalo_verificacao = intervalo_verificacao
+        self.con = duckdb.connect()
+        self._lock = threading.Lock()
+        self._verificado_em = None
+        self.versao, self.caminho = self._ler_ponteiro()
+
+    def _ponteiro(self):
+        return os.path.join(self.diretorio, 'atual.json')
+
+    def _ler_ponteiro(self):
+        try:
+            with open(self._ponteiro(), encoding='utf-8') as f:
+                ponteiro = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None, None
+        caminho = os.path.join(self.diretorio, ponteiro['arquivo'])
+        return (ponteiro['versao'], caminho) if os.path.exists(caminho) else (None, None)
+
+    def atualizar(self, forcar=False) -> bool:
+        """Baixa uma nova cópia se a versão publicada mudou. Retorna True se a cópia foi trocada."""
+        with self._lock:
+            agora = time.monotonic()
+            if (not forcar and self.caminho is not None and self._verificado_em is not None
+                    and agora - self._verificado_em < self.intervalo_verificacao):
+                return False
+            self._verificado_em = agora
+            try:
+                versao = self.warehouse.versao(self.tabela)
+            except Exception as e:
+                if self.caminho is None:
+                    raise
+                logging.warning(f'Snapshot {self.tabela}: versão indisponível ({e}); mantendo a cópia local')
+                return False
+            if versao is not None and versao == self.versao:
+                return False
+
+            # Sem versão conhecida a cópia é renovada a cada intervalo de verificação
+            versao = versao or f'sem-versao-{time.time_ns()}'
+            os.makedirs(self.diretorio, exist_ok=True)
+            arquivo = hashlib.sha1(versao.encode()).hexdigest()[:16] + '.parquet'
+            caminho = os.path.join(self.diretorio, arquivo)
+            inicio = time.perf_counter()
+            self.warehouse.exportar(self.tabela, caminho + '.tmp', self.ordem)
+            os.replace(caminho + '.tmp', caminho)
+            tmp = self._ponteiro() + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'versao': versao, 'arquivo': arquivo}, f)
+            os.replace(tmp, self._ponteiro())
+            for antigo in os.listdir(self.diretorio):
+                if antigo.endswith('.parquet') and antigo != arquivo:
+                    os.remove(os.path.join(self.diretorio, antigo))
+            self.versao, self.caminho = versao, caminho
+            logging.info(f'Snapshot {self.tabela} atualizado para a versão {versao} '
+                         f'em {time.perf_counter() - inicio:.1f}s')
+            return True
+
+    def consultar(self, colunas, filtros=None, excluir=None, ordem=None, limite=None, distintos=False) -> pd.DataFrame:
+        """SELECT sobre a cópia local.
+
+        `filtros` e `excluir` mapeiam coluna -> valor (ou lista de valores)
+        para as condições de igualdade e de diferença; `ordem` é a cláusula
+        ORDER BY já escrita em SQL.
+        """
+        self.atualizar()
+        condicoes, parametros = [], []
+        for negar, criterios in ((False, filtros or {}), (True, excluir or {})):
+            for coluna, valor in criterios.items():
+                valores = list(valor) if isinstance(valor, (list, tuple, set)) else [valor]
+                marcadores = ', '.join('?' * len(valores))
+                condicoes.append(f'"{coluna}" {"NOT IN" if negar else "IN"} ({marcadores})')
+                parametros.extend(valores)
+
+        selecao = ', '.join(f'"{coluna}"' for coluna in colunas)
+        sql = f'SELECT {"DISTINCT " if distintos else ""}{selecao} FROM read_parquet(?)'
+        if condicoes:
+            sql += ' WHERE ' + ' AND '.join(condicoes)
+        if ordem:
+            sql += f' ORDER BY {ordem}'
+        if limite is not None:
+            sql += f' LIMIT {int(limite)}'
+        # Um cursor por consulta: as sessões do dashboard consultam em paralelo
+        with self.con.cursor() as cursor:
+            return cursor.execute(sql, [self.caminho, *parametros]).df()
@@ -0,0 +1,218 @@
+import logging
+import os
+from contextlib import contextmanager
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.utils.instrumentacao import contar
+
+PROCESSED_DIR = os.path.join('data', 'processed')
+COMPRESSAO = 'zstd'
+
+# Esquemas das tabelas trocadas entre as etapas do pipeline (data/processed/<nome>.parquet)
+SCHEMAS = {
+    'dados_historicos_ibge': pa.schema([
+        ('municipio', pa.string()),
+        ('variavel', pa.string()),
+        ('ano', pa.int16()),
+    ]),
+    'dados_historicos_ibge_delta': pa.schema([
+        ('municipio', pa.string()),
+        ('variavel', pa.string()),
+        ('ano', pa.int16()),
+    ]),
+    'variaveis_paranagua': pa.schema([
+        ('municipio', pa.dictionary(pa.int8(), pa.string())),
+        ('bairro', pa.dictionary(pa.int32(), pa.string())),
+        ('preco', pa.float64()),
+        ('area_m2', pa.float32()),
+        ('ano_construcao', pa.int16()),
+        ('preco_por_m2', pa.float32()),
+        ('eh_novo', pa.int8()),
+        ('latitude', pa.float64()),
+        ('longitude', pa.float64()),
+        ('ano', pa.int16()),
+    ]),
+    'variaveis_enriquecidas': pa.schema([
+        ('municipio', pa.dictionary(pa.int8(), pa.string())),
+        ('bairro', pa.dictionary(pa.int32(), pa.string())),
+        ('bairro_informado', pa.dictionary(pa.int32(), pa.string())),
+        ('preco', pa.float64()),
+        ('area_m2', pa.float32()),
+        ('ano_construcao', pa.int16()),
+        ('preco_por_m2', pa.float32()),
+        ('eh_novo', pa.int8()),
+        ('latitude', pa.float64()),
+        ('longitude', pa.float64()),
+        ('ano', pa.int16()),
+        ('em_regularizacao', pa.int8()),
+        ('situacao_regularizacao', pa.dictionary(pa.int8(), pa.string())),
+        ('area_ha_regularizacao', pa.float32()),
+    ]),
+    'predicoes_valorizacao': pa.schema([
+        ('municipio', pa.string()),
+        ('ano', pa.int16()),
+        ('bairro', pa.string()),
+        ('area_m2', pa.float64()),
+        ('preco_por_m2', pa.float64()),
+        ('eh_novo', pa.int8()),
+        ('dist_porto_km', pa.float32()),
+        ('dist_praia_km', pa.float32()),
+        ('dist_pr407_km', pa.float32()),
+        ('qtde_poi_1km', pa.int32()),
+        ('preco_real', pa.float64()),
+        ('preco_previsto', pa.float64()),
+        ('preco_previsto_inferior', pa.float64()),
+        ('preco_previsto_superior', pa.float64()),
+    ]),
+    'resultados_treino': pa.schema([
+        ('motor', pa.string()),
+        ('rodada', pa.int16()),
+        ('n_amostras', pa.int64()),
+        ('parametros', pa.string()),
+        ('tempo_treino_s', pa.float64()),
+        ('rmse_cv', pa.float64()),
+        ('tempo_refit_s', pa.float64()),
+        ('rmse_validacao', pa.float64()),
+        ('tamanho_modelo_bytes', pa.float64()),
+        ('escolhido', pa.int8()),
+    ]),
+    'cubo_celulas': pa.schema([
+        ('bairro', pa.string()),
+        ('municipio', pa.string()),
+        ('ano', pa.string()),
+        ('eh_novo', pa.string()),
+        ('faixa_preco', pa.string()),
+        ('qtde_imoveis', pa.int64()),
+        ('soma_valorizacao_absoluta', pa.float64()),
+        ('soma_valorizacao_percentual', pa.float64()),
+        ('soma_quadrados_valorizacao_percentual', pa.float64()),
+        ('soma_valorizacao_minima_percentual', pa.float64()),
+        ('soma_valorizacao_maxima_percentual', pa.float64()),
+        ('soma_preco_real', pa.float64()),
+        ('soma_preco_previsto', pa.float64()),
+    ]),
+    'metricas_backtest': pa.schema([
+        ('tipo', pa.string()),
+        ('grupo_teste', pa.string()),
+        ('n_treino', pa.int64()),
+        ('n_teste', pa.int64()),
+        ('rmse', pa.float64()),
+        ('mae', pa.float64()),
+        ('mape', pa.float64()),
+        ('r2', pa.float64()),
+        ('tempo_s', pa.float64()),
+    ]),
+    'ranking_bairros': pa.schema([
+        ('bairro', pa.string()),
+        ('valorizacao_absoluta', pa.float64()),
+        ('valorizacao_percentual', pa.float64()),
+        ('valorizacao_minima_percentual', pa.float64()),
+        ('valorizacao_maxima_percentual', pa.float64()),
+        ('qtde_imoveis', pa.int64()),
+        ('ic_inferior', pa.float64()),
+        ('ic_superior', pa.float64()),
+    ]),
+}
+
+# Tabela final de variáveis do modelo: enriquecidas mais as de proximidade
+SCHEMAS['variaveis_modelo'] = pa.schema(list(SCHEMAS['variaveis_enriquecidas']) + [
+    ('dist_porto_km', pa.float32()),
+    ('dist_praia_km', pa.float32()),
+    ('dist_pr407_km', pa.float32()),
+    ('qtde_poi_1km', pa.int32()),
+])
+
+# Previsões acrescentadas pela última atualização incremental do modelo
+SCHEMAS['predicoes_valorizacao_delta'] = SCHEMAS['predicoes_valorizacao']
+
+# Cubo materializado: células mais todos os agregados (dimensão agregada = '*') e métricas derivadas
+SCHEMAS['cubo_valorizacao'] = pa.schema(list(SCHEMAS['cubo_celulas']) + [
+    ('valorizacao_absoluta', pa.float64()),
+    ('valorizacao_percentual', pa.float64()),
+    ('valorizacao_minima_percentual', pa.float64()),
+    ('valorizacao_maxima_percentual', pa.float64()),
+    ('ic_inferior', pa.float64()),
+    ('ic_superior', pa.float64()),
+])
+
+# Imóveis novos pontuados pelo modelo (src/models/pontuacao.py)
+SCHEMAS['imoveis_pontuados'] = pa.schema(list(SCHEMAS['variaveis_modelo']) + [
+    ('preco_previsto', pa.float64()),
+])
+
+
+def caminho_tabela(nome, diretorio=PROCESSED_DIR) -> str:
+    return os.path.join(diretorio, f'{nome}.parquet')
+
+
+def salvar_tabela(df: pd.DataFrame, nome, diretorio=PROCESSED_DIR, manter_extras=False) -> str:
+    """Grava `df` em Parquet com o esquema declarado da tabela.
+
+    Colunas do esquema ausentes em `df` geram erro. Colunas fora do esquema
+    são descartadas, a não ser que `manter_extras` seja verdadeiro, quando
+    são gravadas com o tipo inferido pelo pyarrow.
+    """
+    tabela = _para_arrow(df, nome, manter_extras)
+    os.makedirs(diretorio, exist_ok=True)
+    path = caminho_tabela(nome, diretorio)
+    pq.write_table(tabela, path, compression=COMPRESSAO)
+    contar(linhas_saida=tabela.num_rows, bytes_gravados=os.path.getsize(path))
+    logging.info(f'Tabela {nome} salva em {path} ({tabela.num_rows} linhas)')
+    return path
+
+
+@contextmanager
+def escritor_tabela(nome, diretorio=PROCESSED_DIR):
+    """Grava a tabela em blocos: cada chamada de `escrever(df)` vira um row group.
+
+    Só o bloco corrente fica em memória. O arquivo final aparece atomicamente
+    quando o bloco `with` termina sem erro.
+    """
+    schema = SCHEMAS[nome]
+    os.makedirs(diretorio, exist_ok=True)
+    path = caminho_tabela(nome, diretorio)
+    tmp = path + '.tmp'
+    linhas = 0
+
+    def escrever(df):
+        nonlocal linhas
+        writer.write_table(_para_arrow(df, nome))
+        linhas += len(df)
+
+    try:
+        with pq.ParquetWriter(tmp, schema, compression=COMPRESSAO) as writer:
+            yield escrever
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    os.replace(tmp, path)
+    contar(linhas_saida=linhas, bytes_gravados=os.path.getsize(path))
+    logging.info(f'Tabela {nome} salva em {path} ({linhas} linhas)')
+
+
+def _para_arrow(df, nome, manter_extras=False) -> pa.Table:
+    schema = SCHEMAS[nome]
+    faltantes = [campo.name for campo in schema if campo.name not in df.columns]
+    if faltantes:
+        raise KeyError(f"Tabela {nome}: colunas ausentes {faltantes}")
+
+    extras = [col for col in df.columns if col not in schema.names]
+    if extras and manter_extras:
+        inferido = pa.Schema.from_pandas(df[extras], preserve_index=False)
+        schema = pa.schema(list(schema) + list(inferido))
+    elif extras:
+        logging.warning(f"Tabela {nome}: colunas fora do esquema descartadas {extras}")
+
+    return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+
+def ler_tabela(nome, colunas=None, filtros=None, diretorio=PROCESSED_DIR) -> pd.DataFrame:
+    """Lê a tabela em Parquet, carregando só as `colunas` pedidas e as linhas que passam nos `filtros`."""
+    path = caminho_tabela(nome, diretorio)
+    df = pd.read_parquet(path, engine='pyarrow', columns=colunas, filters=filtros)
+    contar(linhas_entrada=len(df))
+    return df
@@ -0,0 +1,282 @@
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+# Backend do warehouse: 'bigquery' (padrão) ou 'duckdb' (arquivo local, sem rede)
+BACKEND = os.environ.get('VALORIMOB_WAREHOUSE', 'bigquery')
+DUCKDB_PATH = os.environ.get('VALORIMOB_DUCKDB_PATH', os.path.join('data', 'warehouse', 'valorimob.duckdb'))
+
+# Grupos de linhas pequenos nas exportações: filtros sobre as colunas ordenadas pulam os grupos fora da faixa
+LINHAS_GRUPO_EXPORTACAO = 16_384
+# Tabela do DuckDB com a versão da última carga de cada tabela (o DuckDB não guarda a data de modificação)
+TABELA_VERSOES = '_versoes_tabelas'
+# Tentativas de abrir o arquivo DuckDB enquanto outro processo o mantém travado
+TENTATIVAS_TRAVA = 100
+ESPERA_TRAVA_S = 0.1
+
+
+class Warehouse(ABC):
+    """Interface comum dos warehouses. Tabelas são identificadas como `dataset.tabela`."""
+
+    @abstractmethod
+    def carregar(self, caminho_parquet, tabela, substituir=True):
+        """Carrega um arquivo Parquet na tabela, substituindo ou acrescentando as linhas."""
+
+    @abstractmethod
+    def upsert(self, caminho_parquet, tabela, chaves):
+        """Insere ou atualiza as linhas do arquivo pela combinação de `chaves`."""
+
+    @abstractmethod
+    def consultar(self, sql, parametros=None):
+        """Executa uma consulta e retorna um DataFrame."""
+
+    @abstractmethod
+    def referencia(self, tabela) -> str:
+        """Nome da tabela pronto para uso em SQL no dialeto do backend."""
+
+    @abstractmethod
+    def versao(self, tabela):
+        """Identificador da carga atual da tabela, obtido só dos metadados (None se desconhecido)."""
+
+    @abstractmethod
+    def exportar(self, tabela, caminho_parquet, ordem=()):
+        """Grava a tabela inteira num arquivo Parquet local, ordenada pelas colunas de `ordem`."""
+
+
+class BigQueryWarehouse(Warehouse):
+
+    def __init__(self, projeto):
+        from google.cloud import bigquery
+        self._bigquery = bigquery
+        self.projeto = projeto
+        self.client = bigquery.Client(project=projeto)
+
+    def _id(self, tabela):
+        return f'{self.projeto}.{tabela}'
+
+    def referencia(self, tabela):
+        return f'`{self._id(tabela)}`'
+
+    def carregar(self, caminho_parquet, tabela, substituir=True):
+        bigquery = self._bigquery
+        job_config = bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.PARQUET,
+            write_disposition=(bigquery.WriteDisposition.WRITE_TRUNCATE if substituir
+                               else bigquery.WriteDisposition.WRITE_APPEND),
+        )
+        with open(caminho_parquet, 'rb') as f:
+            job = self.client.load_table_from_file(f, self._id(tabela), job_config=job_config)
+        job.result()
+        logging.info(f'BigQuery: {caminho_parquet} carregado em {self._id(tabela)}')
+
+    def upsert(self, caminho_parquet, tabela, chaves):
+        from google.api_core.exceptions import NotFound
+        try:
+            self.client.get_table(self._id(tabela))
+        except NotFound:
+            self.carregar(caminho_parquet, tabela)
+            return
+
+        staging = f'{tabela}_staging'
+        self.carregar(caminho_parquet, staging)
+        colunas = [campo.name for campo in self.client.get_table(self._id(staging)).schema]
+        condicao = ' AND '.join(f'T.`{c}` = S.`{c}`' for c in chaves)
+        atualizacao = ', '.join(f'`{c}` = S.`{c}`' for c in colunas if c not in chaves)
+        self.client.query(f"""
+            MERGE {self.referencia(tabela)} T
+            USING {self.referencia(staging)} S
+            ON {condicao}
+            WHEN MATCHED THEN UPDATE SET {atualizacao}
+            WHEN NOT MATCHED THEN INSERT ROW
+        """).result()
+        self.client.delete_table(self._id(staging), not_found_ok=True)
+        logging.info(f'BigQuery: {caminho_parquet} mesclado em {self._id(tabela)}')
+
+    def consultar(self, sql, parametros=None):
+        bigquery = self._bigquery
+        job_config = None
+        if parametros:
+            job_config = bigquery.QueryJobConfig(query_parameters=[
+                bigquery.ScalarQueryParameter(nome, _tipo_bigquery(valor), valor)
+                for nome, valor in parametros.items()
+            ])
+        return self.client.query(sql, job_config=job_config).to_dataframe()
+
+    def versao(self, tabela):
+        from google.api_core.exceptions import NotFound
+        try:
+            return self.client.get_table(self._id(tabela)).etag
+        except NotFound:
+            return None
+
+    def exportar(self, tabela, caminho_parquet, ordem=()):
+        import pyarrow.parquet as pq
+        # Leitura direta das linhas da tabela, sem job de consulta (não conta bytes varridos)
+        dados = self.client.list_rows(self._id(tabela)).to_arrow()
+        if ordem:
+            dados = dados.sort_by([(coluna, 'ascending') for coluna in ordem])
+        pq.write_table(dados, caminho_parquet, compression='zstd', row_group_size=LINHAS_GRUPO_EXPORTACAO)
+        logging.info(f'BigQuery: {self._id(tabela)} exportada para {caminho_parquet} ({dados.num_rows} linhas)')
+
+
+def _tipo_bigquery(valor):
+    if isinstance(valor, bool):
+        return 'BOOL'
+    if isinstance(valor, int):
+        return 'INT64'
+    if isinstance(valor, float):
+        return 'FLOAT64'
+    return 'STRING'
+
+
+class DuckDBWarehouse(Warehouse):
+    """Warehouse local em um arquivo DuckDB; cada dataset vira um schema.
+
+    O DuckDB trava o arquivo para um único processo escritor (ou vários só
+    leitura). Nenhuma conexão fica aberta entre operações: cada uma abre a
+    sua e a fecha ao terminar, para que o dashboard, que vive tanto quanto o
+    servidor, e o pipeline não se bloqueiem. Leitores usam `somente_leitura`.
+    """
+
+    def __init__(self, caminho=DUCKDB_PATH, somente_leitura=False):
+        import duckdb
+        self._duckdb = duckdb
+        self.caminho = caminho
+        self.somente_leitura = somente_leitura
+        self.catalogo = None
+        self._lock = threading.Lock()
+        if not somente_leitura:
+            os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+
+    def _conectar(self):
+        # Outro processo pode estar no meio de uma operação: espera a trava do arquivo ser liberada
+        for tentativa in range(TENTATIVAS_TRAVA):
+            try:
+                return self._duckdb.connect(self.caminho, read_only=self.somente_leitura)
+            except self._duckdb.IOException as e:
+                if 'lock' not in str(e).lower() or tentativa == TENTATIVAS_TRAVA - 1:
+                    raise
+                time.sleep(ESPERA_TRAVA_S)
+
+    @contextmanager
+    def _conexao(self):
+        """Conexão exclusiva da operação, fechada (liberando o arquivo) ao fim dela."""
+        with self._lock:
+            con = self._conectar()
+            try:
+                # O catálogo leva o nome do arquivo (valorimob.duckdb -> valorimob) e pode coincidir com um dataset
+                self.catalogo = con.execute('SELECT current_database()').fetchone()[0]
+                yield con
+            finally:
+                con.close()
+
+    def referencia(self, tabela):
+        return '.'.join(f'"{parte}"' for parte in [self.catalogo, *tabela.split('.')])
+
+    def _criar_schema(self, con, tabela):
+        schema = tabela.split('.')[0]
+        con.execute(f'CREATE SCHEMA IF NOT EXISTS "{self.catalogo}"."{schema}"')
+
+    def _existe(self, con, tabela):
+        schema, nome = tabela.split('.')
+        return con.execute(
+            'SELECT count(*) FROM information_schema.tables '
+            'WHERE table_catalog = ? AND table_schema = ? AND table_name = ?',
+            [self.catalogo, schema, nome],
+        ).fetchone()[0] > 0
+
+    def carregar(self, caminho_parquet, tabela, substituir=True):
+        with self._conexao() as con:
+            self._criar_schema(con, tabela)
+            if substituir or not self._existe(con, tabela):
+                con.execute(
+                    f'CREATE OR REPLACE TABLE {self.referencia(tabela)} AS SELECT * FROM read_parquet(?)',
+                    [caminho_parquet],
+                )
+            else:
+                con.execute(
+                    f'INSERT INTO {self.referencia(tabela)} BY NAME SELECT * FROM read_parquet(?)',
+                    [caminho_parquet],
+                )
+            self._registrar_versao(con, tabela)
+        logging.info(f'DuckDB: {caminho_parquet} carregado em {tabela}')
+
+    def upsert(self, caminho_parquet, tabela, chaves):
+        with self._conexao() as con:
+            self._criar_schema(con, tabela)
+            ref = self.referencia(tabela)
+            if not self._existe(con, tabela):
+                con.execute(f'CREATE TABLE {ref} AS SELECT * FROM read_parquet(?)', [caminho_parquet])
+            else:
+                condicao = ' AND '.join(f'{ref}."{c}" = novos."{c}"' for c in chaves)
+                con.execute('BEGIN TRANSACTION')
+                try:
+                    con.execute(
+                        f'DELETE FROM {ref} USING read_parquet(?) AS novos WHERE {condicao}', [caminho_parquet])
+                    con.execute(
+                        f'INSERT INTO {ref} BY NAME SELECT * FROM read_parquet(?)', [caminho_parquet])
+                    con.execute('COMMIT')
+                except Exception:
+                    con.execute('ROLLBACK')
+                    raise
+            self._registrar_versao(con, tabela)
+        logging.info(f'DuckDB: {caminho_parquet} mesclado em {tabela}')
+
+    def _registrar_versao(self, con, tabela):
+        con.execute(f'CREATE TABLE IF NOT EXISTS "{self.catalogo}".main.{TABELA_VERSOES} '
+                    '(tabela VARCHAR PRIMARY KEY, versao VARCHAR)')
+        con.execute(f'INSERT OR REPLACE INTO "{self.catalogo}".main.{TABELA_VERSOES} VALUES (?, ?)',
+                    [tabela, uuid.uuid4().hex])
+
+    def versao(self, tabela):
+        with self._conexao() as con:
+            if not self._existe(con, f'main.{TABELA_VERSOES}'):
+                return None
+            linha = con.execute(
+                f'SELECT versao FROM "{self.catalogo}".main.{TABELA_VERSOES} WHERE tabela = ?', [tabela]).fetchone()
+        return linha[0] if linha else None
+
+    def exportar(self, tabela, caminho_parquet, ordem=()):
+        colunas = ', '.join(f'"{coluna}"' for coluna in ordem)
+        ordenacao = f' ORDER BY {colunas}' if ordem else ''
+        destino = caminho_parquet.replace("'", "''")
+        with self._conexao() as con:
+            con.execute(
+                f"COPY (SELECT * FROM {self.referencia(tabela)}{ordenacao}) TO '{destino}' "
+                f"(FORMAT PARQUET, COMPRESSION ZSTD, ROW_GROUP_SIZE {LINHAS_GRUPO_EXPORTACAO})"
+            )
+        logging.info(f'DuckDB: {tabela} exportada para {caminho_parquet}')
+
+    def consultar(self, sql, parametros=None):
+        # Parâmetros nomeados são escritos como no BigQuery (@nome); o DuckDB usa $nome
+        if parametros:
+            sql = re.sub(r'@(\w+)', r'$\1', sql)
+        with self._conexao() as con:
+            return con.execute(sql, parametros or None).df()
+
+
+_instancias = {}
+_instancias_lock = threading.Lock()
+
+
+def obter_warehouse(projeto=None, somente_leitura=False) -> Warehouse:
+    """Retorna o warehouse configurado em VALORIMOB_WAREHOUSE, compartilhado por projeto.
+
+    Leitores (o dashboard) pedem `somente_leitura`, que no DuckDB abre o
+    arquivo só para leitura. No BigQuery o modo não muda nada.
+    """
+    chave = (BACKEND, projeto) if BACKEND == 'bigquery' else (BACKEND, DUCKDB_PATH, somente_leitura)
+    with _instancias_lock:
+        if chave not in _instancias:
+            if BACKEND == 'bigquery':
+                _instancias[chave] = BigQueryWarehouse(projeto)
+            elif BACKEND == 'duckdb':
+                _instancias[chave] = DuckDBWarehouse(somente_leitura=somente_leitura)
+            else:
+                raise ValueError(f'Backend de warehouse desconhecido: {BACKEND}')
+        return _instancias[chave]
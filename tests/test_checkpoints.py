@@ -0,0 +1,172 @@
+import importlib
+import sys
+import textwrap
+import types
+
+import pytest
+
+from src import pipeline
+from src.pipeline import Etapa
+from src.utils import checkpoints
+from src.utils.checkpoints import Checkpoints
+
+# Etapas de teste: `a` lê entrada.txt e grava a.txt, `b` lê a.txt e grava b.txt.
+# Cada execução é anotada em chamadas.log; arquivos-sinal fazem `b` falhar ou o envio de `a` ao S3 falhar.
+MODULO = textwrap.dedent('''
+    import os
+
+    from src.utils.instrumentacao import trecho
+
+
+    def _anotar(nome):
+        with open('chamadas.log', 'a') as f:
+            f.write(nome + '\\n')
+
+
+    def etapa_a():
+        _anotar('a')
+        with open('entrada.txt') as f:
+            conteudo = f.read()
+        with open('a.txt', 'w') as f:
+            f.write(conteudo.upper())
+        if os.path.exists('falhar_envio'):
+            try:
+                with trecho('envio_s3'):
+                    raise ConnectionError('S3 indisponível')
+            except ConnectionError:
+                pass
+
+
+    def etapa_b():
+        _anotar('b')
+        if os.path.exists('falhar_b'):
+            raise ValueError('falha em b')
+        with open('a.txt') as f:
+            conteudo = f.read()
+        with open('b.txt', 'w') as f:
+            f.write(conteudo[::-1])
+''')
+
+ETAPAS = [
+    Etapa('a', 'etapas_teste:etapa_a', entradas=('entrada.txt',), saidas=('a.txt',),
+          parametros=('VALORIMOB_TESTE_PARAMETRO',)),
+    Etapa('b', 'etapas_teste:etapa_b', entradas=('a.txt',), saidas=('b.txt',)),
+]
+
+
+@pytest.fixture(autouse=True)
+def projeto(tmp_path, monkeypatch):
+    """Diretório de trabalho com o módulo das etapas; o código é hasheado a partir dele."""
+    (tmp_path / 'etapas_teste.py').write_text(MODULO, encoding='utf-8')
+    (tmp_path / 'entrada.txt').write_text('valorimob', encoding='utf-8')
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(checkpoints, 'RAIZ', str(tmp_path))
+    monkeypatch.delenv('VALORIMOB_TESTE_PARAMETRO', raising=False)
+    _recarregar_codigo()
+    yield tmp_path
+    _recarregar_codigo()
+
+
+def _recarregar_codigo():
+    checkpoints.versao_codigo.cache_clear()
+    checkpoints._imports_locais.cache_clear()
+    sys.modules.pop('etapas_teste', None)
+    importlib.invalidate_caches()
+
+
+def chamadas():
+    """Etapas que rodaram desde a última consulta."""
+    with open('chamadas.log', 'a+') as f:
+        f.seek(0)
+        nomes = f.read().split()
+        f.truncate(0)
+    return nomes
+
+
+def rodar(forcar=False):
+    """Executa as duas etapas e retorna as que de fato rodaram."""
+    pipeline.executar(['a', 'b'], ETAPAS, max_workers=1, forcar=forcar)
+    return chamadas()
+
+
+def test_etapas_inalteradas_sao_puladas():
+    assert rodar() == ['a', 'b']
+    assert rodar() == []
+
+
+def test_entrada_alterada_reexecuta_etapa_e_dependentes(projeto):
+    rodar()
+    (projeto / 'entrada.txt').write_text('valorimob 2', encoding='utf-8')
+    assert rodar() == ['a', 'b']
+
+
+def test_entrada_regravada_com_mesmo_conteudo_e_pulada(projeto):
+    rodar()
+    (projeto / 'entrada.txt').write_text('valorimob', encoding='utf-8')
+    assert rodar() == []
+
+
+def test_codigo_alterado_reexecuta(projeto):
+    rodar()
+    with open(projeto / 'etapas_teste.py', 'a', encoding='utf-8') as f:
+        f.write('\n# alteração\n')
+    _recarregar_codigo()
+    assert rodar() == ['a', 'b']
+
+
+def test_parametro_alterado_reexecuta_so_a_etapa_que_o_declara(monkeypatch):
+    rodar()
+    monkeypatch.setenv('VALORIMOB_TESTE_PARAMETRO', 'outro')
+    # `a` roda de novo, mas grava a mesma saída: `b` continua válida
+    assert rodar() == ['a']
+
+
+def test_saida_removida_reexecuta(projeto):
+    rodar()
+    (projeto / 'b.txt').unlink()
+    assert rodar() == ['b']
+
+
+def test_etapa_que_falha_perde_o_checkpoint_e_e_retomada(projeto):
+    rodar()
+    (projeto / 'entrada.txt').write_text('valorimob 2', encoding='utf-8')
+    (projeto / 'falhar_b').touch()
+    with pytest.raises(RuntimeError, match='Falha nas etapas'):
+        rodar()
+    assert chamadas() == ['a', 'b']
+    assert set(Checkpoints().etapas) == {'a'}
+
+    (projeto / 'falhar_b').unlink()
+    assert rodar() == ['b']
+
+
+def test_envio_s3_falho_descarta_o_checkpoint_da_etapa(projeto, monkeypatch):
+    def aguardar_envios():
+        raise RuntimeError('1 envio ao S3 falhou')
+
+    monkeypatch.setitem(sys.modules, 'src.utils.destino_s3',
+                        types.SimpleNamespace(aguardar_envios=aguardar_envios))
+    (projeto / 'falhar_envio').touch()
+    with pytest.raises(RuntimeError, match='envio ao S3'):
+        rodar()
+    assert chamadas() == ['a', 'b']
+    assert set(Checkpoints().etapas) == {'b'}
+
+    monkeypatch.delitem(sys.modules, 'src.utils.destino_s3')
+    (projeto / 'falhar_envio').unlink()
+    assert rodar() == ['a']
+
+
+def test_forcar_executa_todas_as_etapas():
+    rodar()
+    assert rodar(forcar=True) == ['a', 'b']
+
+
+def test_estado_incremental_entra_nos_checkpoints_do_pipeline():
+    etapas = {etapa.nome: etapa for etapa in pipeline.ETAPAS}
+    assert pipeline.WATERMARKS_SIDRA in etapas['etl_historico'].saidas
+    assert pipeline.VERSAO_MODELO in etapas['modelo'].saidas
+    assert pipeline.VERSAO_MODELO in etapas['cubo'].entradas
+    assert pipeline.ESTADO_CUBO in etapas['cubo'].saidas
+    assert pipeline.dependencias()['cubo'] == {'modelo'}